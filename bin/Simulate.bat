@@ -0,0 +1 @@
+python ..\src\SoundCath.py -simulate
\ No newline at end of file
@@ -0,0 +1,89 @@
+import numpy as np # for Various Data and Numerical Operations
+import Profiler # stage timing
+
+# Pulse echo metrics for a whole stack of elements at once, nothing in here talks to an instrument
+# so it can score archived data or run on another thread
+
+# Finds the peak to peak voltage, peak frequency and -3dB band edges of every element in one call
+# voltage is elements x samples, amplitude is elements x frequencies over the frequency axis, one element can be given as 1-D arrays
+# the band edges are interpolated between the bins either side of the -3dB crossing and the peak is interpolated with a parabola
+@Profiler.Timed("Analysis")
+def PulseEchoMetrics(voltage: np.ndarray, frequency: np.ndarray, amplitude: np.ndarray) -> dict[str, np.ndarray]:
+
+    voltage = np.atleast_2d(voltage)
+    amplitude = np.atleast_2d(amplitude)
+    frequency = np.asarray(frequency, dtype=np.float64)
+
+    rows = np.arange(amplitude.shape[0])
+    bins = amplitude.shape[1]
+    index = np.arange(bins)
+
+    vpp = voltage.max(axis=-1) - voltage.min(axis=-1) # get the peak to peak of every waveform
+
+    peak = amplitude.argmax(axis=-1) # where the maximum amplitude of every spectrum is
+    maxamp = amplitude[rows, peak]
+    thresh = .707 * maxamp # -3db cutoff
+
+    below = amplitude <= thresh[:, np.newaxis] # every bin outside of the band
+
+    # the first bin below the cutoff going left from the peak
+    leftmask = below & (index < peak[:, np.newaxis])
+    left = bins - 1 - leftmask[:, ::-1].argmax(axis=-1)
+
+    # the first bin below the cutoff going right from the peak
+    rightmask = below & (index > peak[:, np.newaxis])
+    right = rightmask.argmax(axis=-1)
+
+    # an edge that never drops below the cutoff stays on the end of the spectrum
+    lower = np.where(leftmask.any(axis=-1), CrossingFrequency(frequency, amplitude, rows, left, np.minimum(left + 1, bins - 1), thresh), frequency[0])
+    upper = np.where(rightmask.any(axis=-1), CrossingFrequency(frequency, amplitude, rows, np.maximum(right - 1, 0), right, thresh), frequency[-1])
+
+    return {
+        "Vpp": vpp,
+        "Peak": PeakFrequency(frequency, amplitude, rows, peak),
+        "Lower": lower, # the lower band edge
+        "Upper": upper, # the upper band edge
+        "Bandwidth": upper - lower, # bandwidth is the distance between the upper and lower bandedges
+    }
+
+# The frequency where the amplitude crosses thresh between bins a and b of every row, bin a's frequency if they are level
+def CrossingFrequency(frequency: np.ndarray, amplitude: np.ndarray, rows: np.ndarray, a: np.ndarray, b: np.ndarray, thresh: np.ndarray) -> np.ndarray:
+
+    ya = amplitude[rows, a]
+    yb = amplitude[rows, b]
+    step = yb - ya
+
+    fraction = np.divide(thresh - ya, step, out=np.zeros_like(thresh, dtype=np.float64), where=step != 0)
+    fraction = np.clip(fraction, 0, 1)
+
+    return frequency[a] + fraction * (frequency[b] - frequency[a])
+
+# The peak frequency of every row refined with a parabola through the peak bin and its neighbours
+def PeakFrequency(frequency: np.ndarray, amplitude: np.ndarray, rows: np.ndarray, peak: np.ndarray) -> np.ndarray:
+
+    bins = amplitude.shape[1]
+    inside = (peak > 0) & (peak < bins - 1) # the peak bin has a neighbour on both sides
+
+    before = amplitude[rows, np.maximum(peak - 1, 0)]
+    center = amplitude[rows, peak]
+    after = amplitude[rows, np.minimum(peak + 1, bins - 1)]
+
+    curvature = before - 2 * center + after
+    offset = np.divide(before - after, 2 * curvature, out=np.zeros_like(center, dtype=np.float64), where=inside & (curvature != 0))
+
+    spacing = frequency[1] - frequency[0] if len(frequency) > 1 else 0.0
+    return frequency[peak] + offset * spacing
+
+# Checks every element's metrics against the limits, dead elements and anything out of range fail
+def PulseEchoVerdicts(metrics: dict[str, np.ndarray], limits: dict[str, float]) -> np.ndarray:
+
+    vpp = metrics["Vpp"]
+    bandwidth = metrics["Bandwidth"]
+    peak = metrics["Peak"]
+
+    return (
+        (vpp > limits["Dead"]) &
+        (vpp >= limits["VppLower"]) & (vpp <= limits["VppUpper"]) &
+        (bandwidth >= limits["BandwidthLower"]) & (bandwidth <= limits["BandwidthUpper"]) &
+        (peak >= limits["PeakLower"]) & (peak <= limits["PeakUpper"])
+    )
@@ -0,0 +1,286 @@
+import os
+import sys
+import json
+import csv
+import threading
+import numpy as np # for Various Data and Numerical Operations
+from concurrent.futures import Future
+import Oscilloscope
+import Spectrum
+import VNA
+import Profiler
+
+# A per run archive of every raw capture, kept in a directory as:
+#   index.jsonl  one json record per capture describing where its data is
+#   scope.bin    the raw int8 scope samples of every capture back to back
+#   vna.bin      the frequencies (float64) and parameters (complex128) of every sweep back to back
+# the binary files can be memory mapped so reading an archive back doesn't load it all
+
+# Writes a fresh archive for a run and appends captures as they come in, safe to use from the VNA worker thread and the test thread at once
+class ArchiveWriter:
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok = True)
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.index = open(os.path.join(directory, "index.jsonl"), "w")
+        self.scope = open(os.path.join(directory, "scope.bin"), "wb")
+        self.vna = open(os.path.join(directory, "vna.bin"), "wb")
+
+    # Saves the raw samples of one scope transfer, channels[i] was on scope input scopechannels[i] and is row i of samples
+    def AppendScope(self, channels: list[int], scopechannels: list[int], samples: np.ndarray, preambles: list[dict], axis: Oscilloscope.TimeAxis, averages: int = 1, mode: str = "single") -> None:
+
+        samples = np.ascontiguousarray(samples, dtype = np.int8)
+
+        with self.lock:
+            record = {
+                "Kind": "Scope", "Channels": list(channels), "ScopeChannels": list(scopechannels),
+                "Offset": self.scope.tell(), "Shape": list(samples.shape), "T0": axis.t0, "DT": axis.dt,
+                "Preambles": preambles, "Averages": averages, "Mode": mode,
+            }
+            self.scope.write(samples.tobytes())
+            self.Write(record)
+
+    # Saves the parsed data of every parameter of one sweep and the tests it was for
+    def AppendVNA(self, channel: int, tests: list[str], data: dict[str, dict]) -> None:
+
+        with self.lock:
+            parameters = {}
+            for param, values in data.items():
+                frequency = np.ascontiguousarray(values["Frequency"], dtype = np.float64)
+                value = np.ascontiguousarray(values["Value"], dtype = np.complex128)
+
+                parameters[param] = {"Offset": self.vna.tell(), "Points": len(frequency), "Shape": list(value.shape), "Z0": values["Z0"], "Parameter": values["Parameter"]}
+                self.vna.write(frequency.tobytes())
+                self.vna.write(value.tobytes())
+
+            self.Write({"Kind": "VNA", "Channel": channel, "Tests": list(tests), "Parameters": parameters})
+
+    def Write(self, record: dict) -> None: # the data is written before its index record so a record always points at whole data
+        self.scope.flush()
+        self.vna.flush()
+        self.index.write(json.dumps(record) + "\n")
+        self.index.flush()
+
+    def Close(self) -> None:
+        with self.lock:
+            self.index.close()
+            self.scope.close()
+            self.vna.close()
+
+# Reads an archive back with the binary data memory mapped
+class ArchiveReader:
+    def __init__(self, directory: str):
+        self.directory = directory
+
+        with open(os.path.join(directory, "index.jsonl"), "r") as index:
+            records = [json.loads(line) for line in index if len(line.strip()) != 0]
+
+        self.scope = [record for record in records if record["Kind"] == "Scope"] # every scope transfer in the order it happened
+        self.vna = [record for record in records if record["Kind"] == "VNA"] # every sweep in the order it happened
+
+        self.scopedata = MapFile(os.path.join(directory, "scope.bin"), np.int8)
+        self.vnadata = MapFile(os.path.join(directory, "vna.bin"), np.uint8)
+
+    # The raw samples of a scope record as a channels x samples array, a view into the file
+    def ScopeSamples(self, record: dict) -> np.ndarray:
+        count = int(np.prod(record["Shape"]))
+        return self.scopedata[record["Offset"]: record["Offset"] + count].reshape(record["Shape"])
+
+    # The parsed data of every parameter of a VNA record, the same layout VNA.ReadTouchstone gives
+    def VNAData(self, record: dict) -> dict[str, dict]:
+
+        data = {}
+        for param, info in record["Parameters"].items():
+            start = info["Offset"]
+            points = info["Points"]
+            values = int(np.prod(info["Shape"]))
+
+            frequency = self.vnadata[start: start + 8 * points].view(np.float64)
+            value = self.vnadata[start + 8 * points: start + 8 * points + 16 * values].view(np.complex128).reshape(info["Shape"])
+
+            data[param] = {"Frequency": frequency, "Value": value, "Z0": info["Z0"], "Parameter": info["Parameter"]}
+            if value.ndim == 1 and info["Parameter"] == "S": # one port data gives the impedance
+                data[param]["Z"] = info["Z0"] * (1 + value) / (1 - value)
+
+        return data
+
+def MapFile(filename: str, dtype) -> np.ndarray: # memory maps a file, empty files can't be mapped so they give an empty array
+    if os.path.getsize(filename) == 0:
+        return np.zeros(0, dtype = dtype)
+    return np.memmap(filename, dtype = dtype, mode = "r")
+
+# Stands in for the scope's VISA handle during a replay, nothing is ever sent anywhere
+class ReplayResource:
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def query(self, command: str) -> str:
+        return f"Archive Replay,{self.directory}" if command == "*IDN?" else ""
+
+    def write(self, command: str) -> int:
+        return len(command)
+
+# An oscilloscope that plays back the scope records of an archive in order instead of capturing
+class ReplayScope(Oscilloscope.Oscilloscope):
+    def __init__(self, reader: ArchiveReader):
+        super().__init__(ReplayResource(reader.directory)) # opened like any other already open scope so it has every setting a capture needs
+        self.reader = reader
+        self.position = 0 # the next record to play back
+
+    def IsConnected(self) -> bool:
+        return self.position < len(self.reader.scope)
+
+    def HoldBetweenCaptures(self, hold: bool) -> None: # nothing is running to hold
+        pass
+
+    def InvalidateCache(self) -> None:
+        pass
+
+    # gives back the next archived transfer, windowed on the host if the window is inside what was archived
+    @Profiler.Timed("Capture")
+    def CaptureWaveforms(self, channels: list[int], initial_us: float = None, window_size_us: float = None, averages: int = 1) -> dict[str, np.ndarray]:
+
+        record = self.reader.scope[self.position]
+        self.position += 1
+
+        self.samples = self.reader.ScopeSamples(record)
+        self.capturepreambles = record["Preambles"]
+        self.preamble = self.capturepreambles[-1]
+        self.sampleaxis = Oscilloscope.TimeAxis(record["T0"], record["DT"], self.samples.shape[1])
+
+        ymult = np.array([preamble["YMULT"] for preamble in self.capturepreambles])[:, np.newaxis]
+        yoff = np.array([preamble["YOFF"] for preamble in self.capturepreambles])[:, np.newaxis]
+        yzero = np.array([preamble["YZERO"] for preamble in self.capturepreambles])[:, np.newaxis]
+
+        self.Waveform = {"Time": self.sampleaxis, "Voltage": Oscilloscope.ScaleSamples(self.samples, ymult, yoff, yzero, self.voltagetype)}
+
+        if initial_us is not None and window_size_us is not None and not self.IsArchivedWindow(initial_us, window_size_us): # the analysis window may have changed since the capture
+            self.WindowWaveform(initial_us, window_size_us)
+
+        return self.Waveform
+
+    def IsArchivedWindow(self, initial_us: float, window_size_us: float) -> bool: # if the window is what was transferred there is nothing to cut
+        n = int((initial_us * 1e-6 - self.sampleaxis.t0) / self.sampleaxis.dt)
+        d = int(window_size_us * 1e-6 / self.sampleaxis.dt)
+        return n == 0 and d >= len(self.sampleaxis) - 1
+
+# A VNA that plays back the sweeps of an archive in order instead of sweeping
+class ReplayVNA(VNA.VNA):
+    def __init__(self, reader: ArchiveReader):
+        super().__init__()
+        self.reader = reader
+        self.position = 0 # the next record to play back
+
+    def SweepAsync(self, timeout: float = None) -> Future:
+
+        future = Future()
+        future.set_running_or_notify_cancel()
+
+        if self.position >= len(self.reader.vna):
+            future.set_exception(RuntimeError("No More Archived Sweeps"))
+            return future
+
+        future.set_result(self.reader.VNAData(self.reader.vna[self.position]))
+        self.position += 1
+        return future
+
+# Stands in for the Arduino during a replay, there are no relays to switch
+class ReplayArduino:
+    def IsConnected(self) -> bool:
+        return True
+
+    def Write(self, data: bytes) -> int:
+        return len(data)
+
+    def Read(self, size: int) -> bytes:
+        return b""
+
+    def ReadLine(self) -> bytes:
+        return b""
+
+    def SetChannel(self, channel: int) -> int:
+        return channel
+
+    def SetSettle(self, bank: int, seconds: float) -> None:
+        pass
+
+    def MeasureSettle(self, channel: int) -> float:
+        return 0.0
+
+    def LoadSequence(self, channels: list[int]) -> None:
+        pass
+
+    def StartSequence(self) -> tuple[int, int]: # nothing to step, the tester selects every channel itself
+        return None
+
+    def NextChannel(self) -> tuple[int, int]:
+        return None
+
+    def WaitForLive(self, timeout: float = None) -> tuple[int, int]:
+        return None
+
+    def SetTrigger(self, enabled: bool, delay: float = .001) -> None:
+        pass
+
+    def StopSequence(self) -> None:
+        pass
+
+# Feeds every capture in an archive back through a CatheterTester built on the replay instruments and gives back the results
+# like the frontend's passmap, the tester scores everything with the current thresholds and analysis settings
+def ReplayArchive(reader: ArchiveReader, tester, filename: str) -> dict[str, dict[int, list]]:
+
+    import TesterBackend as tb
+
+    results = {"PulseEcho": {}, "Impedance": {}, "Dongle": {}}
+
+    averages = tb.pulse_echo_averages
+    mode = tb.pulse_echo_average_mode
+
+    try:
+        while tester.scope.position < len(reader.scope):
+            record = reader.scope[tester.scope.position]
+
+            # replay with the averaging the archive was captured with so every test takes the records it made
+            tb.pulse_echo_averages = record["Averages"]
+            tb.pulse_echo_average_mode = "scope" if record["Mode"] == "scope" else "host"
+
+            for channel, result in zip(record["Channels"], tester.PulseEchoTestGroup(record["ScopeChannels"], record["Channels"], filename)):
+                results["PulseEcho"][channel] = result
+    finally:
+        tb.pulse_echo_averages = averages
+        tb.pulse_echo_average_mode = mode
+
+    while tester.vna.position < len(reader.vna):
+        record = reader.vna[tester.vna.position]
+        for test, result in tester.RunVNATests(record["Channel"], filename, record["Tests"]).items():
+            results[test][record["Channel"]] = result
+
+    tester.plotter.Wait()
+    return results
+
+
+# re-score an archive: python Archive.py <archive directory> <output file root>
+
+if __name__ == "__main__":
+
+    import TesterBackend as tb
+
+    reader = ArchiveReader(sys.argv[1])
+    filename = sys.argv[2] if len(sys.argv) > 2 else os.path.join(sys.argv[1], "Replay")
+
+    tester = tb.CatheterTester(ReplayArduino(), ReplayScope(reader), ReplayVNA(reader))
+    tester.archive = None # don't archive the replay into itself
+
+    results = ReplayArchive(reader, tester, filename)
+
+    for test, channels in results.items(): # write a csv of the new results for every test
+        if len(channels) == 0:
+            continue
+
+        with open(filename + test + "Replay.csv", "w", newline = "") as file:
+            writer = csv.writer(file)
+            for channel in sorted(channels):
+                writer.writerow([channel] + list(channels[channel]))
+
+        passed = sum(result[0] for result in channels.values())
+        print(f"{test}: {passed} of {len(channels)} Channels Passed")
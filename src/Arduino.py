@@ -1,29 +1,91 @@
 import serial
 from serial.tools.list_ports import comports
 import time
+import Devices
+
+# The framed protocol main.ino speaks, every command is acknowledged once it is done
+#   host -> arduino: [frame_sync] [sequence] [command] [length] [payload ...] [checksum]
+#   arduino -> host: [ack_sync]   [sequence] [status]  [length] [payload ...] [checksum]
+# the checksum is the sum of the sequence, command/status, length and payload bytes, the low byte of it
+# numbers in payloads are little endian
+
+frame_sync = 0xA5
+ack_sync = 0x5A
+
+command_set_channel = 0x01 # [channel] select the channel and acknowledge once it has settled, gives back [channel]
+command_set_settle = 0x02 # [bank, 4 byte microseconds] how long a relay bank takes to settle, bank 4 is the mux alone
+command_measure_settle = 0x03 # [channel] select the channel and time how long the switched line takes to settle, gives back [4 byte microseconds]
+command_load_sequence = 0x04 # [offset, channels ...] load channels into the sequence from offset, offset 0 starts a new sequence, a resent chunk overwrites itself
+command_start_sequence = 0x05 # [] select the first channel of the sequence once it has settled, gives back [index, channel]
+command_set_trigger = 0x06 # [enabled, 4 byte microseconds] if the trigger pin steps the sequence and how long after the edge
+command_stop_sequence = 0x07 # [] forget the sequence and stop the trigger stepping it
+
+next_byte = ord("N") # sent on its own outside of a frame, steps the sequence to its next channel
+
+status_ok = 0x00
+status_bad_checksum = 0x01
+status_unknown_command = 0x02
+status_no_sequence = 0x03
+status_bad_length = 0x04 # the payload wasn't the length the command takes, the firmware did nothing
+status_live = 0x10 # sent by the firmware on its own when the sequence steps, [index, channel] is now live
+status_sequence_done = 0x11 # sent by the firmware on its own when the sequence is stepped past its last channel
+
+ack_timeout_s = .5 # how long to wait for an acknowledgement
+ack_retries = 2 # how many times to resend a command that wasn't acknowledged
+live_timeout_s = 30 # how long to wait for the sequence to step, a trigger can be a while
+sequence_length = 128 # the most channels the firmware can hold in a sequence
+sequence_chunk = 24 # how many channels to load per frame, the firmware takes payloads up to 32 bytes
+max_payload = 32 # the longest payload the firmware takes, a longer length means a broken frame
+
+relay_banks = 4 # the relay banks selected by bits 4-5 of a channel
+mux_bank = 4 # the settle index of a switch that only moves the mux
+
+def Checksum(data: bytes) -> int:
+    return sum(data) & 0xFF
 
 class Arduino:
-    def __init__(self):
+    def __init__(self, port = None): # port can be a port name or an open serial port like object, None searches for the Arduino
+
+        self.sequence = 0 # the sequence number of the next command
+        self.acktimes = [] # how long every acknowledged command took in seconds
+        self.reports = [] # the sequence steps the firmware reported that haven't been waited for yet
+
+        if port is not None:
+            self.port = serial.Serial(port, baudrate = 115200, timeout = .5) if isinstance(port, str) else port
+            print(f"Connected to Arduino on Port {port}\n")
+            return
+
         all_ports = comports()
+        cached = Devices.Cached("Arduino")
+
+        if cached is not None: # straight to the port it was on last time if the same board is still there
+            for port, info, hwid in all_ports:
+                if port == cached["Port"] and hwid == cached["HWID"]:
+                    self.Open(port, hwid)
+                    return
+
         print("Listing Serial Ports: ")
-        
-        for port, info, _ in all_ports: # for every detected port add it to a set of port names
+
+        for port, info, hwid in all_ports: # for every detected port add it to a set of port names
             print(str(info))
 
-            if "Arduino" in str(info):
-                self.port = serial.Serial(port, baudrate = 115200, timeout = .5)
-                print(f"Connected to Arduino on Port {port}\n")
+            if "Arduino" in str(info) or (cached is not None and hwid == cached["HWID"]): # the remembered board can move ports
+                self.Open(port, hwid)
                 return
 
         print("Could Not Connect To A Valid Arduino Serial Port") # if we couldn't find a working Arduino then print this message
         self.port = None
 
+    def Open(self, port: str, hwid: str) -> None: # opens a port the Arduino was found on and remembers it for next time
+        self.port = serial.Serial(port, baudrate = 115200, timeout = .5)
+        Devices.Remember("Arduino", {"Port": port, "HWID": hwid})
+        print(f"Connected to Arduino on Port {port}\n")
+
     def IsConnected(self) -> bool:
         return self.port is not None
 
     def Write(self, data: bytes) -> int:
         if self.port is not None:
-            time.sleep(.01)
             self.port.write(data)
             return len(data)
 
@@ -36,3 +98,164 @@ class Arduino:
     def ReadLine(self) -> bytes:
         if self.port is not None:
             return self.port.readline()
+
+    # Sends a command and waits for its acknowledgement instead of sleeping, gives back the payload of the acknowledgement
+    def Transact(self, command: int, payload: bytes = b"", timeout: float = None) -> bytes:
+
+        timeout = ack_timeout_s if timeout is None else timeout
+        if self.port.timeout != timeout: # a read gives up when the acknowledgement would be late anyway
+            self.port.timeout = timeout
+
+        for attempt in range(ack_retries + 1):
+            sequence = self.sequence
+            self.sequence = (self.sequence + 1) & 0xFF
+
+            body = bytes([sequence, command, len(payload)]) + payload
+            start = time.perf_counter()
+            self.Write(bytes([frame_sync]) + body + bytes([Checksum(body)]))
+
+            ack = self.ReadAck(sequence, start + timeout)
+            if ack is None: # lost, try again with a new sequence number so a late answer isn't mistaken for this one
+                continue
+
+            status, data = ack
+            if status == status_bad_checksum:
+                continue
+            if status != status_ok:
+                raise RuntimeError(f"Arduino Rejected Command {command} With Status {status}")
+
+            self.acktimes.append(time.perf_counter() - start)
+            return data
+
+        raise TimeoutError(f"Arduino Did Not Acknowledge Command {command}")
+
+    # Reads acknowledgements until the one for sequence comes in, None if it doesn't by the deadline
+    def ReadAck(self, sequence: int, deadline: float) -> tuple[int, bytes]:
+
+        while True:
+            frame = self.ReadFrame(deadline)
+            if frame is None:
+                return None
+
+            if frame[1] in (status_live, status_sequence_done): # a step of the sequence, kept for WaitForLive
+                self.reports.append(frame)
+            elif frame[0] == sequence: # anything else is an answer to an older command
+                return frame[1], frame[2]
+
+    # Reads the next whole frame from the firmware as (sequence, status, payload), None if there isn't one by the deadline
+    def ReadFrame(self, deadline: float) -> tuple[int, int, bytes]:
+
+        while time.perf_counter() < deadline:
+            sync = self.port.read(1)
+            if len(sync) == 0:
+                return None
+            if sync[0] != ack_sync: # not the start of a frame, skip it
+                continue
+
+            header = self.port.read(3)
+            if len(header) < 3:
+                return None
+
+            payload = self.port.read(header[2])
+            checksum = self.port.read(1)
+            if len(payload) < header[2] or len(checksum) == 0:
+                return None
+
+            if Checksum(header + payload) != checksum[0]: # corrupted
+                continue
+
+            return header[0], header[1], payload
+
+        return None
+
+    # Selects a channel and returns once the firmware says the relays have settled, gives back the channel the firmware selected
+    def SetChannel(self, channel: int) -> int:
+        if self.port is None:
+            return None
+
+        return self.Transact(command_set_channel, bytes([channel & 0xFF]))[0]
+
+    # Sets how long the firmware waits for a relay bank to settle before acknowledging, bank mux_bank is a switch within a bank
+    def SetSettle(self, bank: int, seconds: float) -> None:
+        if self.port is not None:
+            self.Transact(command_set_settle, bytes([bank]) + int(seconds * 1e6).to_bytes(4, "little"))
+
+    # Selects a channel and gives back how long the firmware saw the switched line take to settle in seconds
+    def MeasureSettle(self, channel: int) -> float:
+        if self.port is None:
+            return None
+
+        data = self.Transact(command_measure_settle, bytes([channel & 0xFF]), ack_timeout_s + .2) # the measurement can take up to 100ms
+        return int.from_bytes(data[:4], "little") * 1e-6
+
+    # Loads the channels a run will select into the firmware so each one can be selected with a single byte or the trigger pin
+    def LoadSequence(self, channels: list[int]) -> None:
+        if self.port is None:
+            return
+
+        if len(channels) == 0 or len(channels) > sequence_length:
+            raise ValueError(f"A Sequence Has To Have 1 to {sequence_length} Channels")
+
+        for offset in range(0, len(channels), sequence_chunk):
+            self.Transact(command_load_sequence, bytes([offset]) + bytes([channel & 0xFF for channel in channels[offset:offset + sequence_chunk]]))
+
+    # Selects the first channel of the loaded sequence and returns once it has settled, gives back (index, channel)
+    def StartSequence(self) -> tuple[int, int]:
+        if self.port is None:
+            return None
+
+        self.reports = [] # steps of an older sequence don't count
+        data = self.Transact(command_start_sequence)
+        return data[0], data[1]
+
+    # Steps the sequence with a single byte and waits for the firmware to say which channel is live, None once the sequence is done
+    def NextChannel(self) -> tuple[int, int]:
+        if self.port is None:
+            return None
+
+        start = time.perf_counter()
+        self.Write(bytes([next_byte]))
+        live = self.WaitForLive(ack_timeout_s)
+        self.acktimes.append(time.perf_counter() - start)
+        return live
+
+    # Waits for the sequence to step, by NextChannel or the trigger pin, gives back the live (index, channel) or None once the sequence is done
+    def WaitForLive(self, timeout: float = None) -> tuple[int, int]:
+        if self.port is None:
+            return None
+
+        deadline = time.perf_counter() + (live_timeout_s if timeout is None else timeout)
+        while len(self.reports) == 0:
+            frame = self.ReadFrame(deadline)
+            if frame is None and time.perf_counter() >= deadline:
+                raise TimeoutError("Arduino Did Not Report The Next Channel")
+            if frame is not None and frame[1] in (status_live, status_sequence_done):
+                self.reports.append(frame)
+
+        _, status, data = self.reports.pop(0)
+        return None if status == status_sequence_done else (data[0], data[1])
+
+    # Reads every step report that has already come in without waiting, gives back how many are waiting to be picked up
+    def PendingReports(self) -> int:
+        if self.port is None:
+            return 0
+
+        while self.port.in_waiting != 0:
+            frame = self.ReadFrame(time.perf_counter() + ack_timeout_s) # the rest of a frame that has started is right behind it
+            if frame is None:
+                break
+            if frame[1] in (status_live, status_sequence_done):
+                self.reports.append(frame)
+
+        return len(self.reports)
+
+    # Sets if a rising edge on the trigger pin steps the sequence, and how long after the edge so the capture it started isn't cut off
+    def SetTrigger(self, enabled: bool, delay: float = .001) -> None:
+        if self.port is not None:
+            self.Transact(command_set_trigger, bytes([int(enabled)]) + int(delay * 1e6).to_bytes(4, "little"))
+
+    # Forgets the sequence and stops the trigger pin stepping it
+    def StopSequence(self) -> None:
+        if self.port is not None:
+            self.Transact(command_stop_sequence)
+            self.reports = []
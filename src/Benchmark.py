@@ -0,0 +1,181 @@
+import os
+import sys
+import json
+import time
+import TesterBackend as tb
+import Profiler
+import Report
+import Simulator
+import Archive
+import Planner
+
+# Times full runs of the tester on simulated or archived instruments so we can see where the time of a run goes
+# Usage: python Benchmark.py [-scale=<latency scale>] [-channels=<n>] [-mixes=PulseEcho,All] [-archive=<archive directory>]
+#                            [-out=<results file>] [-baseline=<results file to compare against>] [-trace=<chrome trace file>]
+
+# the tests every channel runs in each mix
+benchmark_mixes = {
+    "PulseEcho": ["PulseEcho"],
+    "Impedance": ["Impedance"],
+    "Dongle": ["Dongle"],
+    "VNA": ["Impedance", "Dongle"],
+    "All": ["PulseEcho", "Impedance", "Dongle"],
+}
+
+# the stages in the order they are reported, stages on the VNA and plot threads overlap the others
+benchmark_stages = ["Channel", "Relay Switch", "Sweep", "Sweep Wait", "Parse", "Capture", "Acquire", "FFT", "Analysis", "Analysis Wait", "Plot", "Plot Wait", "Report"]
+
+# a stage or run that got slower than this fraction of the baseline is reported as a regression
+regression_threshold = .1
+
+# where the benchmark writes its plots, sweeps and reports
+benchmark_directory = "Benchmark"
+
+# Runs every channel through the tests on the tester and times it, gives back the timings of the run
+def RunMix(tester: tb.CatheterTester, tests: list[str], channels: int, filename: str) -> dict:
+
+    passmap = Report.EmptyPassMap(channels)
+
+    Profiler.profiler.Reset()
+    Profiler.profiler.Enable()
+    start = time.perf_counter()
+
+    plan = Planner.PlanRun(tester, list(range(1, channels + 1)), tests)
+    tester.StartSequence([channel for channel, _ in plan["Steps"]], tests)
+    for channel, results in tester.RunSteps(plan["Steps"], filename): # the same as running all channels from the frontend without the prompts
+        for test, values in results.items():
+            for c, result in values.items():
+                passmap[test][c - 1] = result
+    tester.StopSequence()
+
+    tester.plotter.Wait() # the run isn't over until every plot is written
+    Report.WriteXLSXReport(passmap, filename + "Report.xlsx")
+
+    timings = Timings(tests, channels, time.perf_counter() - start)
+    timings["Pipeline"] = dict(tester.pipelinestats) # how much of the analysis overlapped measuring
+    timings["Plan"] = {"Name": plan["Name"], "Estimate": plan["Estimate"]["Seconds"]} # what the planner expected the run to take
+    return timings
+
+# Plays an archive back through the tester and times it like a run
+def RunArchive(tester: tb.CatheterTester, reader: Archive.ArchiveReader, filename: str) -> dict:
+
+    Profiler.profiler.Reset()
+    Profiler.profiler.Enable()
+    start = time.perf_counter()
+
+    results = Archive.ReplayArchive(reader, tester, filename)
+
+    channels = max([max(values.keys()) for values in results.values() if len(values) != 0], default = 0)
+    passmap = Report.EmptyPassMap(channels)
+    for test, values in results.items():
+        for channel, result in values.items():
+            passmap[test][channel - 1] = result
+
+    Report.WriteXLSXReport(passmap, filename + "Report.xlsx")
+
+    return Timings([test for test, values in results.items() if len(values) != 0], channels, time.perf_counter() - start)
+
+# The timings of the run that just finished
+def Timings(tests: list[str], channels: int, seconds: float) -> dict:
+
+    Profiler.profiler.Enable(False)
+
+    return {
+        "Tests": tests,
+        "Channels": channels,
+        "Seconds": seconds,
+        "ChannelsPerMinute": 60 * channels / seconds if seconds > 0 else 0,
+        "Stages": Profiler.profiler.Summary(),
+    }
+
+# Prints the timings of every mix, with the change from the baseline if there is one, and gives back the regressions
+def PrintTimings(results: dict[str, dict], baseline: dict[str, dict] = None) -> list[str]:
+
+    baseline = {} if baseline is None else baseline
+    regressions = []
+
+    for mix, timings in results.items():
+        old = baseline.get(mix)
+
+        print(f"\n{mix}: {timings['Channels']} Channels in {timings['Seconds']:.2f}s, {timings['ChannelsPerMinute']:.1f} Channels per Minute")
+        if old is not None:
+            print(f"    Baseline: {old['Seconds']:.2f}s, {old['ChannelsPerMinute']:.1f} Channels per Minute ({Change(old['Seconds'], timings['Seconds'])})")
+            if timings["Seconds"] > old["Seconds"] * (1 + regression_threshold):
+                regressions.append(f"{mix} Run")
+
+        plan = timings.get("Plan")
+        if plan is not None:
+            print(f"    Plan: {plan['Name']}, Estimated {plan['Estimate']:.2f}s")
+
+        pipeline = timings.get("Pipeline", {})
+        if pipeline.get("Analysis", 0) > 0:
+            print(f"    Pipeline: {pipeline['Overlapped']:.2f}s of {pipeline['Analysis']:.2f}s of Analysis Overlapped Measuring")
+
+        print(f"    {'Stage':<14}{'Count':>7}{'Total s':>10}{'Mean ms':>10}{'Max ms':>10}{'Baseline':>12}")
+
+        stages = [stage for stage in benchmark_stages if stage in timings["Stages"]] + [stage for stage in timings["Stages"] if stage not in benchmark_stages]
+        for stage in stages:
+            summary = timings["Stages"][stage]
+            line = f"    {stage:<14}{summary['Count']:>7}{summary['Total']:>10.3f}{summary['Mean'] * 1e3:>10.2f}{summary['Max'] * 1e3:>10.2f}"
+
+            if old is not None and stage in old["Stages"]:
+                before = old["Stages"][stage]["Mean"]
+                line += f"{Change(before, summary['Mean']):>12}"
+                if summary["Mean"] > before * (1 + regression_threshold):
+                    regressions.append(f"{mix} {stage}")
+                    line += "  REGRESSION"
+
+            print(line)
+
+    return regressions
+
+def Change(before: float, after: float) -> str: # the change from before to after as a percentage
+    if before == 0:
+        return "n/a"
+    return f"{100 * (after - before) / before:+.1f}%"
+
+# module main function, benchmarks every mix and compares it to a baseline
+
+if __name__ == "__main__":
+
+    options = dict(arg[1:].split("=", 1) for arg in sys.argv[1:] if arg.startswith("-") and "=" in arg)
+
+    Simulator.latency_scale = float(options.get("scale", Simulator.latency_scale))
+    channels = int(options.get("channels", tb.max_channel))
+    mixes = options["mixes"].split(",") if "mixes" in options else list(benchmark_mixes.keys())
+
+    os.makedirs(benchmark_directory, exist_ok = True)
+    filename = os.path.join(benchmark_directory, "Bench")
+
+    tb.archive_captures = False # the benchmark shouldn't time writing archives of itself
+    results = {}
+
+    if "trace" in options:
+        Profiler.profiler.StartTrace()
+
+    if "archive" in options: # time a replay of a recorded run
+        reader = Archive.ArchiveReader(options["archive"])
+        tester = tb.CatheterTester(Archive.ReplayArduino(), Archive.ReplayScope(reader), Archive.ReplayVNA(reader))
+        results["Replay"] = RunArchive(tester, reader, filename)
+
+    else:
+        tester = tb.CatheterTester(*Simulator.SimulatedInstruments())
+        for mix in mixes:
+            results[mix] = RunMix(tester, benchmark_mixes[mix], channels, filename + mix)
+
+    if "trace" in options:
+        Profiler.profiler.StopTrace(options["trace"])
+
+    baseline = None
+    if "baseline" in options:
+        with open(options["baseline"], "r") as file:
+            baseline = json.load(file)
+
+    regressions = PrintTimings(results, baseline)
+
+    with open(options.get("out", os.path.join(benchmark_directory, "Benchmark.json")), "w") as file:
+        json.dump(results, file, indent = 4)
+
+    if len(regressions) != 0:
+        print(f"\nRegressions: {', '.join(regressions)}")
+        sys.exit(1)
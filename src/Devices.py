@@ -0,0 +1,92 @@
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Remembers the ports and resources the instruments were last found on so startup can go straight to them
+# when a remembered device isn't there anymore every candidate is probed at once with short timeouts instead of one after another
+
+# if the last good devices are remembered and tried first
+use_device_cache = True
+# where the last good devices are kept between runs
+device_cache_file = os.path.join(os.path.expanduser("~"), ".soundcath_devices.json")
+
+# how long probing one candidate can take in seconds, a real instrument answers well inside this
+probe_timeout_s = 1.0
+# the most candidates probed at once
+probe_workers = 8
+
+lock = threading.Lock() # the instruments connect on their own threads
+
+def LoadCache() -> dict[str, dict]:
+    try:
+        with open(device_cache_file, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError): # nothing remembered yet or the file is broken, search for everything
+        return {}
+
+# What was remembered about an instrument, None if it should be searched for
+def Cached(kind: str) -> dict:
+    if not use_device_cache:
+        return None
+
+    with lock:
+        return LoadCache().get(kind)
+
+# Remembers where an instrument was found, identity is whatever is needed to tell it is the same device next time
+def Remember(kind: str, identity: dict) -> None:
+    if not use_device_cache:
+        return
+
+    with lock:
+        cache = LoadCache()
+        if cache.get(kind) == identity:
+            return
+
+        cache[kind] = identity
+        try:
+            with open(device_cache_file, "w") as file:
+                json.dump(cache, file, indent = 4)
+        except OSError as e: # only costs the fast path next time
+            print(f"Could Not Save the Device Cache: {e}")
+
+# Probes every candidate at once, probe gives back None for a candidate that isn't the device
+# gives back (candidate, result) of the earliest candidate in the list that answered, None if none did
+# results that aren't used, including ones that come in late, are handed to discard so they can be closed
+def ProbeParallel(candidates: list, probe, discard = None, timeout: float = None) -> tuple:
+
+    if len(candidates) == 0:
+        return None
+
+    timeout = probe_timeout_s * 2 if timeout is None else timeout # the probes have their own timeouts, this only guards against a hung driver
+    executor = ThreadPoolExecutor(max_workers = min(len(candidates), probe_workers), thread_name_prefix = "Probe")
+    futures = [executor.submit(probe, candidate) for candidate in candidates]
+    deadline = time.perf_counter() + timeout
+
+    def Discard(future) -> None:
+        if discard is not None and not future.cancelled() and future.exception() is None and future.result() is not None:
+            discard(future.result())
+
+    found = None
+    pending = set(futures)
+    while len(pending) != 0 and found is None:
+        done, pending = wait(pending, max(deadline - time.perf_counter(), 0), return_when = FIRST_COMPLETED)
+        if len(done) == 0: # out of time, a hung candidate doesn't stop one that answered from winning
+            found = next((i for i, future in enumerate(futures) if future.done() and future.exception() is None and future.result() is not None), None)
+            break
+
+        for i, future in enumerate(futures): # the first in order wins once everything before it is done
+            if not future.done():
+                break
+            if future.exception() is None and future.result() is not None:
+                found = i
+                break
+
+    for i, future in enumerate(futures):
+        if i != found:
+            future.add_done_callback(Discard) # runs now if it is done, or whenever a late probe finishes
+
+    executor.shutdown(wait = False, cancel_futures = True)
+
+    return None if found is None else (candidates[found], futures[found].result())
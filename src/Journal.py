@@ -0,0 +1,102 @@
+import os
+import json
+import time
+import numpy as np
+
+# A per run journal of every result, appended and synced to disk as each step of the run finishes so a crash or a hung instrument loses nothing
+# kept next to the results as <filename>Journal.jsonl, one json record per line:
+#   {"Kind": "Run", "Channels": [...], "Tests": [...], "Mode": "Run" | "Resume" | "Retest", "Started": time}  a run, resumed and retested runs append their own
+#   {"Kind": "Result", "Channel": c, "Results": {test: {channel: result}}}  the results of a step, later ones replace earlier ones
+#   {"Kind": "Done"}  the run before it got through every step
+# a line cut off by a crash is skipped when it is read back
+
+# if results are synced to disk as they come in, without it the operating system decides when they are written
+journal_sync = True
+
+# Appends the results of a run to its journal
+class JournalWriter:
+    def __init__(self, filename: str, channels: list[int], tests: list[str], mode: str = "Run"):
+        self.filename = filename + "Journal.jsonl"
+        append = mode != "Run" and os.path.exists(self.filename) # a new run starts a new journal
+
+        self.file = open(self.filename, "a" if append else "w")
+        if append and self.file.tell() != 0 and not EndsWithNewline(self.filename): # finish a line a crash cut off so the next record starts on its own line
+            self.file.write("\n")
+
+        self.Write({"Kind": "Run", "Channels": list(channels), "Tests": list(tests), "Mode": mode, "Started": time.time()})
+
+    def Append(self, channel: int, results: dict[str, dict[int, list]]) -> None:
+        self.Write({"Kind": "Result", "Channel": channel, "Results": results})
+
+    def Finish(self) -> None: # every step of the run is in the journal
+        self.Write({"Kind": "Done"})
+
+    def Write(self, record: dict) -> None:
+        self.file.write(json.dumps(record, default = JSONValue) + "\n")
+        self.file.flush()
+        if journal_sync:
+            os.fsync(self.file.fileno())
+
+    def Close(self) -> None:
+        self.file.close()
+
+# Reads a journal back, gives back {"Channels", "Tests", "Results": {test: {channel: result}}, "Runs", "Done"} or None if there is no journal
+# the channels and tests are every one any run of the journal went through and the results are the latest of each
+def ReadJournal(filename: str) -> dict:
+
+    try:
+        with open(filename + "Journal.jsonl", "r") as file:
+            lines = file.readlines()
+    except OSError:
+        return None
+
+    journal = {"Channels": [], "Tests": [], "Results": {}, "Runs": 0, "Done": False}
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError: # cut off by a crash
+            continue
+
+        if record["Kind"] == "Run":
+            journal["Channels"] += [channel for channel in record["Channels"] if channel not in journal["Channels"]]
+            journal["Tests"] += [test for test in record["Tests"] if test not in journal["Tests"]]
+            journal["Runs"] += 1
+            journal["Done"] = False
+
+        elif record["Kind"] == "Result":
+            for test, values in record["Results"].items():
+                for channel, result in values.items():
+                    journal["Results"].setdefault(test, {})[int(channel)] = result # json keys are strings
+
+        elif record["Kind"] == "Done":
+            journal["Done"] = True
+
+    return journal
+
+# The tests every channel of the journal still needs, {channel: tests}, missing results and if failed is set failed ones too
+def Needed(journal: dict, failed: bool = False) -> dict[int, list[str]]:
+
+    needed = {}
+    for channel in journal["Channels"]:
+        for test in journal["Tests"]:
+            result = journal["Results"].get(test, {}).get(channel)
+            if result is None or (failed and not result[0]):
+                needed.setdefault(channel, []).append(test)
+
+    return needed
+
+# Fills passmap in with the results of the journal
+def MergeResults(journal: dict, passmap: dict[str, list[list]]) -> None:
+    for test, values in journal["Results"].items():
+        for channel, result in values.items():
+            passmap[test][channel - 1] = result
+
+def JSONValue(value): # numpy scalars and arrays in the results
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    raise TypeError(f"Can't Journal {type(value).__name__}")
+
+def EndsWithNewline(filename: str) -> bool:
+    with open(filename, "rb") as file:
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) == b"\n"
@@ -1,78 +1,472 @@
-import pyvisa as visa # visa for SCPi Commands
 import numpy as np # for Various Data and Numerical Operations
-from scipy.fft import rfft, rfftfreq # ffts
+import Spectrum # ffts
 import csv  # csv for report data
 import os   # for mkdir and pwd
+import time # for timing and waiting on acquisitions
+import Profiler # stage timing
+import Devices # remembers where the scope was last time
 
 scope_sample_interval_ns = 1 # sampling period of oscilloscope
 
+acquisition_timeout_s = 30 # how long to wait for an acquisition to complete before giving up
+acquisition_poll_start_s = .001 # when polling, the first wait between asking if the scope is busy
+acquisition_poll_max_s = .05 # when polling, the longest wait between asking if the scope is busy
+
+# A time axis that starts at t0 and steps by dt for n samples, acts like a list without storing every time
+class TimeAxis:
+    def __init__(self, t0: float, dt: float, n: int):
+        self.t0 = t0 # the time of the first sample
+        self.dt = dt # the time between samples
+        self.n = n # the number of samples
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __getitem__(self, index):
+
+        if isinstance(index, slice): # slicing gives back another lazy axis
+            start, stop, step = index.indices(self.n)
+            return TimeAxis(self.t0 + start * self.dt, self.dt * step, len(range(start, stop, step)))
+
+        if index < 0:
+            index += self.n
+
+        if index < 0 or index >= self.n:
+            raise IndexError("TimeAxis index out of range")
+
+        return self.t0 + index * self.dt
+
+    def __iter__(self):
+        return iter(self.ToArray())
+
+    def __array__(self, dtype = None, copy = None) -> np.ndarray: # lets numpy and matplotlib use the axis like an array
+        return self.ToArray() if dtype is None else self.ToArray().astype(dtype)
+
+    def ToArray(self) -> np.ndarray: # build every time, only call this when they are really needed
+        return self.t0 + self.dt * np.arange(self.n)
+
+# Turns raw scope samples into voltages in one vectorized operation
+def ScaleSamples(samples: np.ndarray, ymult: float, yoff: float, yzero: float, dtype = np.float64) -> np.ndarray:
+    voltage = samples.astype(dtype) # one copy into the float type
+    voltage -= dtype(yoff)
+    voltage *= dtype(ymult)
+    voltage += dtype(yzero)
+    return voltage
+
+# The first sample and number of samples of a time window in a record, the same rounding as WindowWaveform, None if it doesn't fit
+def WindowSampleRange(initial_us: float, window_size_us: float, xinc: float, num_samples: int) -> tuple[int, int]:
+
+    n = int(initial_us * 1e-6 / xinc) # we want to start the window as close to the start point as possible
+    d = int(window_size_us * 1e-6 / xinc) # we want to make the width of the window as close to the desired width as possible
+
+    if n < 0 or d <= 0 or n + d >= num_samples:
+        return None
+
+    return n, d
+
+# The part of a spectrum from start_freq to start_freq + window_size, a stack of spectra is windowed along the frequency
+def WindowSpectrum(fft: dict[str, np.ndarray], start_freq: float, window_size: float) -> dict[str, np.ndarray]:
+
+    deltaf = fft["Frequency"][1] - fft["Frequency"][0] # we want to get the start as close to the desired star as possible
+    f0 = fft["Frequency"][0]
+
+    n = int((start_freq - f0) / deltaf)
+    d = int(window_size / deltaf)
+
+    if n < 0 or n + d >= len(fft["Frequency"]):
+        print("Window Outside of Range")
+        return fft
+
+    return { "Frequency": fft["Frequency"][n: n + d], "Amplitude": fft["Amplitude"][..., n: n + d] } # views, nothing is copied
+
+# the fields of the WFMOUTPRE? response in order, as Tektronix DPO/MSO scopes send them with HEADER OFF
+preamble_fields = ["BYT_NR", "BIT_NR", "ENCDG", "BN_FMT", "BYT_OR", "WFID", "NR_PT", "PT_FMT", "XUNIT", "XINCR", "XZERO", "PT_OFF", "YUNIT", "YMULT", "YOFF", "YZERO"]
+
+# Pulls the scaling values out of a WFMOUTPRE? response, None if it isn't in the format we expect
+# other families order the fields differently, e.g. the TDS sends XINCR;PT_OFF;XZERO and YMULT;YZERO;YOFF, so the labels
+# have to be where this order puts them before any of the numbers are trusted
+def ParsePreamble(response: str) -> dict[str, float]:
+
+    values = next(csv.reader([response.strip()], delimiter=';', quotechar='"')) # the waveform id is quoted and can have anything in it
+
+    if len(values) < len(preamble_fields):
+        return None
+
+    fields = dict(zip(preamble_fields, values))
+
+    if fields["ENCDG"].strip().upper() not in ("BIN", "BINARY") or fields["XUNIT"].strip().lower() != "s" or fields["YUNIT"].strip().upper() != "V":
+        return None
+
+    try:
+        return {key: float(fields[key]) for key in ("XINCR", "XZERO", "YMULT", "YOFF", "YZERO")}
+    except ValueError:
+        return None
+
+# Welford's running mean and variance over fixed size buffers, nothing is allocated per update
+class RunningStats:
+    def __init__(self, shape):
+        self.count = 0
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape) # the sum of squared differences from the mean
+        self.delta = np.zeros(shape) # scratch space
+        self.scratch = np.zeros(shape)
+
+    def Update(self, value) -> None:
+        self.count += 1
+        np.subtract(value, self.mean, out=self.delta) # the difference from the old mean
+        np.divide(self.delta, self.count, out=self.scratch)
+        self.mean += self.scratch
+        np.subtract(value, self.mean, out=self.scratch) # the difference from the new mean
+        self.scratch *= self.delta
+        self.m2 += self.scratch
+
+    def Variance(self) -> np.ndarray: # the sample variance, nan until there are two samples
+        if self.count < 2:
+            return np.full(self.mean.shape, np.nan)
+        return self.m2 / (self.count - 1)
+
+    def ConfidenceInterval(self, z: float = 1.96) -> np.ndarray: # the half width of the confidence interval of the mean
+        return z * np.sqrt(self.Variance() / max(self.count, 1))
+
+# Opens a VISA resource and asks who it is with a short timeout, gives back (resource, idn) or None if it isn't the scope
+def ProbeScope(rm, dev: str, idn: str = None) -> tuple:
+
+    import pyvisa as visa
+
+    try:
+        scope = rm.open_resource(dev, open_timeout = int(Devices.probe_timeout_s * 1000)) # open the device for use
+    except visa.VisaIOError:
+        return None
+
+    try:
+        previous = scope.timeout
+        scope.timeout = Devices.probe_timeout_s * 1000
+        answer = scope.query("*IDN?").strip()
+        scope.timeout = previous
+    except visa.VisaIOError: # if we run into an error it isn't the scope
+        scope.close()
+        return None
+
+    if idn is not None and answer != idn: # something else is on the remembered resource now
+        scope.close()
+        return None
+
+    return scope, answer
+
 # Oscilloscope Class Wrapper for VISA operations
 class Oscilloscope:
-    def __init__(self):
-        rm = visa.ResourceManager() # create a VISA device manager
-        devlist = rm.list_resources()  # print out all of the possible VISA Devices
-        print(f"Listing VISA Devices: {devlist}")
-        self.Waveform = {"Time": [], "Voltage": []} # a dictionary of Lists
+    def __init__(self, resource = None): # resource can be a VISA resource name or an open resource like object, None searches for the scope
+        self.Waveform = {"Time": TimeAxis(0.0, 1.0, 0), "Voltage": np.zeros(0)} # the time axis and the voltage array
+        self.samples = np.zeros(0, dtype=np.int8) # the raw samples from the last capture
+        self.sampleaxis = TimeAxis(0.0, 1.0, 0) # the times of the raw samples
+        self.voltagetype = np.float64 # the type to scale the voltages to, float32 halves the memory of long records
         self.fft = {"Frequency": [], "Amplitude": []}
+        self.spectrum = Spectrum.SpectrumAnalyzer() # the fft engine, keeps its windows and axes between captures
         self.scope = None # a visa handle for the scope device
-        
-        for dev in devlist:
-            try:
-                if not "ASRL" in dev: # if the device is not on the serial port
-                    self.scope = rm.open_resource(dev) # open the device for use
-                
-                if self.scope is not None: # if the scope was found
-                    print("Connected To a Scope: {}".format(dev)) # print a status message
-                    print("Scope ID: " + self.scope.query("*IDN?"))
-                    return                # if we found the scope we are good to leave
-            
-            except visa.VisaIOError: # if we fun into an error move on to the next device that was found
-                self.scope = None
-                continue
-            
-        print("Did Not Find A Valid Scope")  # If we didnt find a 
-        self.scope = None
+        self.settings = {} # the last value we sent for every setting so we only send changes
+        self.preambles = {} # the waveform scaling of every channel of this capture
+        self.preamble = {} # the waveform scaling of the last capture
+        self.capturepreambles = [] # the waveform scaling of every channel in the last capture
+        self.Statistics = {"Mean": np.zeros(0), "Variance": np.zeros(0), "Count": 0} # the running statistics of the last averaged capture
+        self.recordlength = None # the number of samples in a record
+        self.counts = {"Writes": 0, "Queries": 0} # how many commands and round trips we have sent to the scope
+        self.capturecounts = {"Writes": 0, "Queries": 0} # the commands and round trips of the last capture
+        self.completionmode = "opc" # how to find out an acquisition finished [opc / srq / poll]
+        self.acquisitiontimes = [] # how long every acquisition took to complete in seconds
+        self.freerun = True # if the scope goes back to running after a capture, while held its trigger out only fires for our acquisitions
+
+        if resource is not None and not isinstance(resource, str): # already open, e.g. a simulated scope
+            self.scope = resource
+            print("Scope ID: " + self.scope.query("*IDN?"))
+            return
+
+        import pyvisa as visa # visa for SCPi Commands, slow to import so only once there is a real scope to look for
+        rm = visa.ResourceManager() # create a VISA device manager
+
+        found = None
+        cached = Devices.Cached("Scope") if resource is None else None
+        if cached is not None: # straight to the scope we used last time if it still answers the same
+            probe = ProbeScope(rm, cached["Resource"], cached["IDN"])
+            found = None if probe is None else (cached["Resource"], probe)
+
+        if found is None:
+            devlist = rm.list_resources() if resource is None else [resource] # print out all of the possible VISA Devices
+            print(f"Listing VISA Devices: {devlist}")
+
+            candidates = [dev for dev in devlist if not "ASRL" in dev] # if the device is not on the serial port
+            found = Devices.ProbeParallel(candidates, lambda dev: ProbeScope(rm, dev), lambda probe: probe[0].close()) # every candidate at once
+
+        if found is None:
+            print("Did Not Find A Valid Scope")  # If we didnt find a 
+            self.scope = None
+            return
+
+        dev, (self.scope, idn) = found
+        Devices.Remember("Scope", {"Resource": dev, "IDN": idn})
+        print("Connected To a Scope: {}".format(dev)) # print a status message
+        print("Scope ID: " + idn)
 
     def IsConnected(self) -> bool: # if we have an active conection to the scope, aka a visa handle
         return self.scope is not None
 
-    def CaptureWaveform(self, channel: int) -> dict[str, list[float]]: # we capture the waveform using standard VISA / SCPI Commands
+    def SetVoltageType(self, dtype = np.float64) -> None: # the float type voltages are scaled to
+        self.voltagetype = dtype
+
+    # Writes a command to the scope and counts it
+    def Write(self, command: str) -> None:
+        self.counts["Writes"] += 1
+        self.scope.write(command)
+
+    # Queries the scope and counts the round trip
+    def Query(self, command: str) -> str:
+        self.counts["Queries"] += 1
+        return self.scope.query(command)
+
+    # Queries binary data from the scope into an array and counts the round trip
+    def QueryBinary(self, command: str) -> np.ndarray:
+        self.counts["Queries"] += 1
+        return self.scope.query_binary_values(command, datatype='b', container=np.array)
+
+    # Sets a scope setting, only sending the command if the value is different from what we last sent
+    def Set(self, header: str, value) -> None:
+        if self.settings.get(header) != str(value):
+            self.Write(f"{header} {value}")
+            self.settings[header] = str(value)
+
+    # Forgets everything we know about the scope settings, call this if someone may have changed them on the front panel
+    def InvalidateCache(self) -> None:
+        self.settings = {}
+        self.preambles = {}
+        self.recordlength = None
+
+    def SetVerticalScale(self, channel: int, volts_per_div: float) -> None:
+        self.Set(f"CH{channel}:SCALE", volts_per_div)
+        self.preambles.pop(channel, None) # the y scaling of that channel changed
+
+    def SetHorizontalScale(self, seconds_per_div: float) -> None:
+        self.Set("HORIZONTAL:SCALE", seconds_per_div)
+        self.preambles = {} # the x increment of every channel changed
+        self.recordlength = None
+
+    def SetRecordLength(self, num_samples: int) -> None:
+        self.Set("HORIZONTAL:RECORDLENGTH", num_samples)
+        self.preambles = {}
+        self.recordlength = None
+
+    # Gets the waveform scaling of the selected source channel, asking the scope for the whole preamble in one query if we don't have it this capture
+    def Preamble(self, channel: int) -> dict[str, float]:
+
+        if channel in self.preambles:
+            return self.preambles[channel]
+
+        self.Set("DATa:SOU", f"CH{channel}") # the preamble describes the selected source
+        preamble = ParsePreamble(self.Query("WFMOUTPRE?"))
+
+        if preamble is None: # this scope formats its preamble differently, ask for the values one at a time
+            preamble = {
+                "XINCR": float(self.Query("WFMOUTPRE:XINCR?")), # we will find what the current x increment is
+                "YMULT": float(self.Query("WFMOUTPRE:YMULT?")), # we find out what the y scaling is 
+                "YOFF": float(self.Query("WFMOUTPRE:YOFF?")), # we find what the y offset is 
+                "YZERO": float(self.Query("WFMOUTPRE:YZERO?")), # we find out where the y zero is at
+            }
+
+        self.preambles[channel] = preamble
+        return preamble
+
+    # Holds the scope stopped between captures so its trigger out only pulses once per acquisition we ask for, e.g. when it steps a relay sequence
+    # releasing it puts it back to running so the screen keeps updating
+    def HoldBetweenCaptures(self, hold: bool) -> None:
+        self.freerun = not hold
+        if self.scope is None:
+            return
+
+        if hold:
+            self.Write("ACQUIRE:STATE OFF") # stop a free running scope before anything listens to its trigger out
+        else:
+            self.Set("ACQUIRE:STOPAFTER", "RUNSTOP")
+            self.Write("ACQUIRE:STATE RUN")
+
+    def SetCompletionMode(self, mode: str = "opc") -> None: # how to find out an acquisition finished [opc / srq / poll]
+        self.completionmode = mode
+
+    # Starts a single acquisition and waits for the scope to say it is done without hammering it with queries
+    @Profiler.Timed("Acquire")
+    def Acquire(self) -> float:
+
+        start = time.perf_counter()
+
+        if self.completionmode == "srq":
+            self.Write("*CLS") # clear the old status so only this acquisition raises the request
+            self.Set("*ESE", 1) # operation complete sets the event status bit
+            self.Set("*SRE", 32) # and the event status bit raises a service request
+            self.Write("ACQUIRE:STATE RUN;*OPC") # capture the waveform and flag operation complete when it is done
+
+            if not self.WaitForSRQ():
+                self.PollForAcquisition(start) # the interface doesn't do service requests, fall back to polling
+
+        elif self.completionmode == "opc":
+            self.Write("ACQUIRE:STATE RUN") # capture the waveform
+            self.WaitForOPC()
+
+        else:
+            self.Write("ACQUIRE:STATE RUN") # capture the waveform
+            self.PollForAcquisition(start)
+
+        elapsed = time.perf_counter() - start
+        self.acquisitiontimes.append(elapsed) # keep track of how long every acquisition took
+        return elapsed
+
+    # *OPC? does not answer until the acquisition is done, the thread sleeps in the read instead of spinning
+    def WaitForOPC(self) -> None:
+
+        import pyvisa as visa
+
+        previous = self.scope.timeout
+        self.scope.timeout = acquisition_timeout_s * 1000 # the answer can take as long as the trigger does
+
+        try:
+            self.Query("*OPC?")
+        except visa.VisaIOError:
+            raise TimeoutError("Scope Acquisition Timed Out")
+        finally:
+            self.scope.timeout = previous
+
+    # Waits for the service request the scope raises when the acquisition completes, False if the interface can't do it
+    def WaitForSRQ(self) -> bool:
+
+        import pyvisa as visa
+
+        try:
+            self.scope.wait_for_srq(acquisition_timeout_s * 1000)
+        except AttributeError: # not every kind of VISA resource has service requests
+            return False
+        except visa.VisaIOError:
+            raise TimeoutError("Scope Acquisition Timed Out")
+
+        self.scope.read_stb() # clear the request
+        self.Query("*ESR?") # and the event status register
+        return True
+
+    # Asks if the scope is busy, waiting longer and longer between asking so we don't tie up the bus
+    def PollForAcquisition(self, start: float) -> None:
+
+        interval = acquisition_poll_start_s
+
+        while self.Query('BUSY?') == '1': # while the waveform is capturing wait for it to finish
+            if time.perf_counter() - start > acquisition_timeout_s:
+                raise TimeoutError("Scope Acquisition Timed Out")
+
+            time.sleep(interval)
+            interval = min(interval * 2, acquisition_poll_max_s)
+
+    # The number of samples in a record
+    def RecordLength(self) -> int:
+        if self.recordlength is None:
+            self.recordlength = int(self.Query("HORIZONTAL:RECORD?"))
+        return self.recordlength
+
+    # we capture the waveform using standard VISA / SCPI Commands, with a window only the samples inside it are transferred
+    def CaptureWaveform(self, channel: int, initial_us: float = None, window_size_us: float = None) -> dict[str, np.ndarray]:
+
+        self.CaptureWaveforms([channel], initial_us, window_size_us)
+
+        self.samples = self.samples[0] # one channel gives back one waveform instead of a stack of them
+        self.Waveform = {"Time": self.Waveform["Time"], "Voltage": self.Waveform["Voltage"][0]}
+
+        return self.Waveform
+
+    # captures one acquisition and transfers every channel in the list from it, the voltages come back as a channels x samples array
+    # averages asks the scope to average that many acquisitions into the record
+    @Profiler.Timed("Capture")
+    def CaptureWaveforms(self, channels: list[int], initial_us: float = None, window_size_us: float = None, averages: int = 1) -> dict[str, np.ndarray]:
+
+        start = dict(self.counts)
         
-        self.scope.write("HEADER OFF")
-
-        self.scope.write(f"DATa:SOU CH{channel}") # get the waeform from the channel specified in the argument
-        self.scope.write("DATa:ENCdg RIBBINARY") # We want the data as binary signed integers
-        self.scope.write("DATA WIDTH 1") # we want one byte per point
-              
-        xinc = float(self.scope.query("WFMOUTPRE:XINCR?")) # we will find what the current x increment is
-        ymult = float(self.scope.query('WFMOUTPRE:YMULT?')) # we find out what the y scaling is 
-        yoff = float(self.scope.query('WFMOUTPRE:YOFF?')) # we find what the y offset is 
-        yzero = float(self.scope.query('WFMOUTPRE:YZERO?')) # we find out where the y zero is at
-
-        self.scope.write("ACQUIRE:STATE OFF")   # stop any waveform capture
-        self.scope.write("ACQUIRE:MODE NORMALSAMPLE") # set the capture mode to capture the screen normally like a trigger
-        self.scope.write("ACQUIRE:STOPAFTER SEQUENCE")  # set the capture to stop updating the screen after the capture
+        self.Set("HEADER", "OFF")
+        self.Set("DATa:ENCdg", "RIBBINARY") # We want the data as binary signed integers
+        self.Set("DATA WIDTH", 1) # we want one byte per point
+
+        self.preambles = {} # the volts per division can be changed on the front panel between captures, read the scaling again every capture
+        self.capturepreambles = [self.Preamble(channel) for channel in channels] # the scaling of every channel we want
+        self.preamble = self.capturepreambles[-1]
+        xinc = self.preamble["XINCR"] # every channel shares the timebase
+
+        self.Write("ACQUIRE:STATE OFF")   # stop any waveform capture
+        if averages > 1:
+            self.Set("ACQUIRE:MODE", "AVERAGE") # have the scope average the acquisitions
+            self.Set("ACQUIRE:NUMAVG", averages) # a single sequence finishes once this many are averaged
+        else:
+            self.Set("ACQUIRE:MODE", "NORMALSAMPLE") # set the capture mode to capture the screen normally like a trigger
+        self.Set("ACQUIRE:STOPAFTER", "SEQUENCE")  # set the capture to stop updating the screen after the capture
         
-        self.scope.write("ACQUIRE:STATE RUN") # capture the waveform
+        self.Acquire() # capture the waveform and wait for it to finish
+
+        num_samples = self.RecordLength() # how many samples were captured
+
+        window = None
+        if initial_us is not None and window_size_us is not None: # only ask the scope for the samples in the window
+            window = WindowSampleRange(initial_us, window_size_us, xinc, num_samples)
+            if window is None:
+                print("Window Outside of Record, Transferring the Whole Waveform")
+
+        first, count = window if window is not None else (0, num_samples)
+
+        self.Set("DATA:START", first + 1)  # start getting the data from the start of the window, the scope counts from 1
+        self.Set("DATA:STOP", first + count) # set the end of the data to the end of the window
+
+        records = []
+        for channel in channels: # every channel comes from the same acquisition
+            self.Set("DATa:SOU", f"CH{channel}") # get the waeform from the channel
+            records.append(self.QueryBinary('CURV?').astype(np.int8, copy=False)) # get the captured waveform straight into an int8 array
+
+        self.samples = records[0][np.newaxis] if len(records) == 1 else np.stack(records) # one row per channel
+
+        # according to Tektronix this is how a raw V is calculated, every row with the scaling of its channel
+        ymult = np.array([preamble["YMULT"] for preamble in self.capturepreambles])[:, np.newaxis]
+        yoff = np.array([preamble["YOFF"] for preamble in self.capturepreambles])[:, np.newaxis]
+        yzero = np.array([preamble["YZERO"] for preamble in self.capturepreambles])[:, np.newaxis]
 
-        while self.scope.query('BUSY?') == '1': # while the waveform is capturing wait for it to finish
-            pass
+        self.sampleaxis = TimeAxis(first * xinc, xinc, self.samples.shape[1]) # the time of every raw sample, even if we window them after
+        self.Waveform = {
+            "Time": self.sampleaxis, # the time axis is described by its start, step and length instead of a list
+            "Voltage": ScaleSamples(self.samples, ymult, yoff, yzero, self.voltagetype)
+        }
 
-        self.scope.write("DATA:START 1")  # start getting the data from the beginning
-        num_samples = int(self.scope.query("HORIZONTAL:RECORD?")) # read how many samples were captured
-        self.scope.write("DATA:STOP {}".format(num_samples)) # set the end of the data to the end of the waveform
+        if self.freerun:
+            self.Set("ACQUIRE:STOPAFTER", "RUNSTOP") # set the scope to start capture when a signal is sent
+            self.Write("ACQUIRE:STATE RUN") # start capture again
 
-        values = self.scope.query_binary_values('CURV?', datatype='b') # get the captured waveform
+        if initial_us is not None and window_size_us is not None and window is None: # the scope couldn't window it so do it here
+            self.WindowWaveform(initial_us, window_size_us)
 
-        timeaxis = [i * xinc for i in range(len(values))] # generate a list to represent the time access
+        self.capturecounts = {key: self.counts[key] - start[key] for key in self.counts} # how much talking to the scope this capture took
 
-        voltage = [ymult * (values[i] - yoff) + yzero for i in range(len(values))] # generate a list of the voltages according to Tektronix this is how a raw V is calculated
+        return self.Waveform
+
+    # takes count acquisitions of every channel and averages them, host averaging keeps a running mean and variance in fixed buffers
+    # scope averaging lets the scope average and transfers one record, so there is no variance
+    # callback is given every shot as it comes in when averaging on the host
+    def CaptureAveraged(self, channels: list[int], count: int, initial_us: float = None, window_size_us: float = None, mode: str = "host", callback = None) -> dict[str, np.ndarray]:
+
+        if mode == "scope":
+            self.CaptureWaveforms(channels, initial_us, window_size_us, count)
+            self.Statistics = {"Mean": self.Waveform["Voltage"], "Variance": np.full(self.Waveform["Voltage"].shape, np.nan), "Count": count}
+            return self.Waveform
+
+        stats = None
+        for _ in range(count):
+            self.CaptureWaveforms(channels, initial_us, window_size_us)
+
+            if stats is None: # size the buffers off of the first shot, every shot after reuses them
+                stats = RunningStats(self.Waveform["Voltage"].shape)
 
-        self.Waveform["Time"] = timeaxis # export the data to the class member
-        self.Waveform["Voltage"] = voltage
+            stats.Update(self.Waveform["Voltage"])
 
-        self.scope.write("ACQUIRE:STOPAFTER RUNSTOP") # set the scope to start capture when a signal is sent
-        self.scope.write("ACQUIRE:STATE RUN") # start capture again
+            if callback is not None:
+                callback(self.Waveform)
+
+        self.Statistics = {"Mean": stats.mean, "Variance": stats.Variance(), "Count": stats.count}
+        self.Waveform = {"Time": self.Waveform["Time"], "Voltage": stats.mean.astype(self.voltagetype, copy=False)} # the averaged waveform is what gets analyzed
 
         return self.Waveform
 
@@ -88,7 +482,7 @@ class Oscilloscope:
             print("Window Outside of Range")
             return self.Waveform
 
-        self.Waveform = { "Time": self.Waveform["Time"][n: n + d], 'Voltage': self.Waveform["Voltage"][n: n + d] } # window the waveform and time axis
+        self.Waveform = { "Time": self.Waveform["Time"][n: n + d], 'Voltage': self.Waveform["Voltage"][..., n: n + d] } # window the waveform and time axis, both are views so nothing is copied
         return self.Waveform
 
     def GetWaveform(self) -> dict[str, list]:
@@ -96,27 +490,13 @@ class Oscilloscope:
 
     def CalculateFFT(self) -> dict[str, list]:
 
-        amp = np.abs(rfft(self.Waveform["Voltage"]))  # run the fft on the voltage values get the magnitude of the amplitude
-        freqaxis = rfftfreq(len(self.Waveform["Time"]), self.Waveform["Time"][1] - self.Waveform["Time"][0])  # scale the axis to the sampling period
-        
-        self.fft["Frequency"] = freqaxis
-        self.fft["Amplitude"] = amp
+        self.fft = self.spectrum.FFT(self.Waveform["Voltage"], self.Waveform["Time"].dt) # the spectrum of every channel in one batched fft
 
         return self.fft
 
     def WindowFFT(self, start_freq: float, window_size: float) -> dict[str, list[float]]:
 
-        deltaf = self.fft["Frequency"][1] - self.fft["Frequency"][0] # we want to get the start as close to the desired star as possible
-        f0 = self.fft["Frequency"][0]
-
-        n = int((start_freq - f0) / deltaf)
-        d = int(window_size / deltaf)
-
-        if n < 0 or n + d >= len(self.fft["Frequency"]):
-            print("Window Outside of Range")
-            return self.fft
-
-        self.fft = { "Frequency": self.fft["Frequency"][n: n + d], "Amplitude": self.fft["Amplitude"][n: n + d] }
+        self.fft = WindowSpectrum(self.fft, start_freq, window_size)
         return self.fft
 
     def GetFFT(self) -> dict[str, list]:
@@ -143,11 +523,11 @@ if __name__ == "__main__":
 
     scope = Oscilloscope()
         
-    scope.CaptureWaveform(1) # capture the waveform from the screen
-    data = scope.WindowWaveform(4.95, .10)
+    data = scope.CaptureWaveform(1, 4.95, .10) # capture the window of the waveform from the screen
+    print(f"Capture Took {scope.capturecounts['Writes']} Writes and {scope.capturecounts['Queries']} Round Trips, Acquisition Took {scope.acquisitiontimes[-1] * 1e3: .1f}ms")
 
-    minimum = min(data["Voltage"]) # find the minimum voltage of the waveform
-    maximum = max(data["Voltage"]) # find the maximum voltage of the waveform
+    minimum = np.min(data["Voltage"]) # find the minimum voltage of the waveform
+    maximum = np.max(data["Voltage"]) # find the maximum voltage of the waveform
         
     vpp = maximum - minimum # get the peak to peak maximum 
 
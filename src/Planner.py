@@ -0,0 +1,134 @@
+import numpy as np
+import Arduino
+import TesterBackend as tb
+
+# Picks the order a run goes through its channels and tests in so switching relays costs the least
+# a plan is a list of steps, (channel, tests), run in order, every plan runs every test on every channel once so the results are the same
+# the costs come from what the tester has measured so far, the defaults stand in until it has
+
+# if runs of several channels go in the order the planner picks instead of channel by channel
+plan_runs = True
+
+# what things cost before the tester has measured them, in seconds
+planner_defaults = {
+    "Command": .002, # a round trip to the Arduino on top of the settle time
+    "PulseEcho": .05, # capturing and transferring a pulse echo
+    "Sweep": 3.0, # a VNA sweep
+}
+# the orders the planner compares
+planner_orders = ["Channel Major", "Test Major", "Instrument Major"]
+
+# The cost of everything the tester does, from what it has measured or the defaults
+def Costs(tester: tb.CatheterTester) -> dict[str, object]:
+
+    acktimes = getattr(tester.arduino, "acktimes", [])
+    pulseecho = tester.steptimes.get("PulseEcho", [])
+    sweeps = tester.steptimes.get("Sweep", [])
+
+    return {
+        "Command": min(acktimes) if len(acktimes) != 0 else planner_defaults["Command"], # the fastest acknowledgement didn't wait on any relays
+        "Settle": list(tester.relaysettle), # per relay bank and last for the mux alone
+        "PulseEcho": float(np.median(pulseecho)) if len(pulseecho) != 0 else planner_defaults["PulseEcho"],
+        "Sweep": float(np.median(sweeps)) if len(sweeps) != 0 else planner_defaults["Sweep"], # every sweep starts the VNA app so changing it costs nothing more
+    }
+
+# The steps of an order, pulse echo only runs on the first channel of each group of scope inputs like RunChannel
+def Steps(order: str, channels: list[int], tests: list[str]) -> list[tuple[int, list[str]]]:
+
+    group = len(tb.pulse_echo_scope_channels)
+    pulseecho = ["PulseEcho"] if "PulseEcho" in tests else []
+    sweeps = [group for _, group in tb.PlanVNAMeasurements([test for test in tests if test != "PulseEcho"])] # tests that share a sweep stay together
+
+    def PulseEchoOn(channel: int) -> list[str]:
+        return pulseecho if (channel - 1) % group == 0 else []
+
+    vnatests = [test for group in sweeps for test in group]
+
+    if order == "Channel Major":
+        steps = [(channel, PulseEchoOn(channel) + vnatests) for channel in channels]
+
+    else:
+        passes = [pulseecho] if len(pulseecho) != 0 else []
+        if order == "Test Major":
+            passes += sweeps # a pass per sweep
+        elif len(sweeps) != 0:
+            passes.append(vnatests) # one pass of the VNA
+
+        steps = []
+        for p, tests in enumerate(passes):
+            walk = channels if p % 2 == 0 else channels[::-1] # back the way we came so the relay banks don't swing back
+            for channel in walk:
+                steps.append((channel, PulseEchoOn(channel) if tests == pulseecho else list(tests)))
+
+    return [(channel, tests) for channel, tests in steps if len(tests) != 0]
+
+# Keeps only the tests of the steps that needed, {channel: tests}, asks for, a pulse echo stays if any channel of its group needs it
+def Restrict(steps: list[tuple[int, list[str]]], needed: dict[int, list[str]]) -> list[tuple[int, list[str]]]:
+
+    group = len(tb.pulse_echo_scope_channels)
+
+    def Needs(channel: int, test: str) -> bool:
+        if test == "PulseEcho":
+            return any(test in needed.get(c, []) for c in range(channel, channel + group))
+        return test in needed.get(channel, [])
+
+    steps = [(channel, [test for test in tests if Needs(channel, test)]) for channel, tests in steps]
+    return [(channel, tests) for channel, tests in steps if len(tests) != 0]
+
+# Estimates how long the steps take, and how many switches they make
+def Estimate(steps: list[tuple[int, list[str]]], costs: dict[str, object]) -> dict[str, float]:
+
+    estimate = {"Seconds": 0.0, "Switches": 0, "Bank Changes": 0}
+    current = None # the channel byte the relays are on
+
+    for channel, tests in steps:
+        relay = tb.RelayChannel(channel - 1)
+        if relay != current:
+            bank = (relay >> 4) & 0x3
+            moved = current is None or bank != (current >> 4) & 0x3
+            estimate["Seconds"] += costs["Command"] + costs["Settle"][bank if moved else Arduino.mux_bank]
+            estimate["Switches"] += 1
+            estimate["Bank Changes"] += int(moved)
+            current = relay
+
+        if "PulseEcho" in tests:
+            estimate["Seconds"] += costs["PulseEcho"]
+
+        estimate["Seconds"] += costs["Sweep"] * len(tb.PlanVNAMeasurements([test for test in tests if test != "PulseEcho"]))
+
+    return estimate
+
+# Plans every order for the run and gives back the cheapest one, {"Name", "Steps", "Estimate"}, printing them all
+# needed, {channel: tests}, limits the run to those tests, for finishing or retesting part of a run
+def PlanRun(tester: tb.CatheterTester, channels: list[int], tests: list[str], verbose: bool = True, needed: dict[int, list[str]] = None) -> dict[str, object]:
+
+    costs = Costs(tester)
+    plans = []
+    for order in (planner_orders if plan_runs else planner_orders[:1]): # channel major is how a run went before there was a planner
+        steps = Steps(order, channels, tests)
+        if needed is not None:
+            steps = Restrict(steps, needed)
+        plans.append({"Name": order, "Steps": steps, "Estimate": Estimate(steps, costs)})
+
+    best = min(plans, key = lambda plan: plan["Estimate"]["Seconds"]) # the first of equal plans, channel major, wins a tie
+
+    if verbose:
+        print(f"Test Plan for {len(channels) if needed is None else len(needed)} Channels of {', '.join(tests)}:")
+        for plan in plans:
+            estimate = plan["Estimate"]
+            print(f"  {'*' if plan is best else ' '} {plan['Name']:<36}{estimate['Seconds']:>9.1f}s  {estimate['Switches']} Switches, "
+                  f"{estimate['Bank Changes']} Bank Changes")
+        print(f"Running {best['Name']}, About {best['Estimate']['Seconds']:.1f}s")
+
+    return best
+
+# module main function, prints the plans for a run of every channel on the simulated bench
+
+if __name__ == "__main__":
+
+    import sys
+    import Simulator
+
+    tests = sys.argv[1].split(",") if len(sys.argv) > 1 else ["PulseEcho", "Impedance", "Dongle"]
+    tester = tb.CatheterTester(*Simulator.SimulatedInstruments())
+    PlanRun(tester, list(range(1, tb.max_channel + 1)), tests)
@@ -0,0 +1,65 @@
+import numpy as np # for Various Data and Numerical Operations
+from concurrent.futures import ThreadPoolExecutor, wait # for rendering off of the test thread
+import Profiler # stage timing
+
+# Renders and saves line plots on a pool of worker threads so the test loop doesn't wait on them
+class PlotWorker:
+    def __init__(self, mode: str = "background", workers: int = 2):
+        self.mode = mode # [sync / background / defer / skip] draw now, draw on the workers, queue until Wait, or don't draw at all
+        self.pool = ThreadPoolExecutor(max_workers = workers, thread_name_prefix = "Plot")
+        self.pending = [] # futures of the plots being drawn
+        self.deferred = [] # plots waiting for Wait when deferring
+
+    def SetMode(self, mode: str = "background") -> None:
+        self.mode = mode
+
+    # Hands a plot to the workers, the data is copied so the caller can reuse its buffers
+    def Submit(self, filename: str, x, y, xlabel: str, ylabel: str) -> None:
+
+        if self.mode == "skip":
+            return
+
+        job = (filename, np.array(x), np.array(y), xlabel, ylabel)
+
+        if self.mode == "sync":
+            SavePlot(*job)
+        elif self.mode == "defer":
+            self.deferred.append(job)
+        else:
+            self.pending.append(self.pool.submit(SavePlot, *job))
+
+    # Waits for every plot handed over so far to be written, deferred plots are drawn now
+    def Wait(self) -> None:
+
+        for job in self.deferred:
+            self.pending.append(self.pool.submit(SavePlot, *job))
+        self.deferred = []
+
+        with Profiler.Stage("Plot Wait"):
+            done, _ = wait(self.pending)
+        self.pending = []
+
+        for future in done: # let someone know if a plot couldn't be saved
+            if future.exception() is not None:
+                print(f"Could Not Save Plot: {future.exception()}")
+
+    def Pending(self) -> int: # how many plots have not been written yet
+        return sum(not future.done() for future in self.pending) + len(self.deferred)
+
+# Draws a single line plot and saves it as an image
+@Profiler.Timed("Plot")
+def SavePlot(filename: str, x: np.ndarray, y: np.ndarray, xlabel: str, ylabel: str) -> None:
+
+    # matplotlib is imported on the first plot so startup doesn't wait on it
+    from matplotlib.figure import Figure # the object oriented API, no global pyplot state so figures can be drawn on any thread
+    from matplotlib.backends.backend_agg import FigureCanvasAgg # renders straight to image files without a GUI
+
+    figure = Figure()
+    FigureCanvasAgg(figure) # attach a renderer to the figure
+    plot = figure.add_subplot()
+
+    plot.plot(x, y)
+    plot.set_xlabel(xlabel)
+    plot.set_ylabel(ylabel)
+
+    figure.savefig(filename)
@@ -0,0 +1,128 @@
+import os
+import time
+import json
+import threading
+import functools
+import collections
+
+# Times the stages of a run, every module records into the one profiler below
+# when it is disabled a stage costs one flag check so the timers can stay in the hot paths
+# while tracing every stage is also kept as an event of a Chrome trace, open the file in chrome://tracing or ui.perfetto.dev
+
+# the most times kept of every stage, the oldest are dropped so a long running GUI doesn't grow forever
+profile_max_samples = 100000
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock() # stages finish on the VNA and plot threads too
+        self.timings = {} # stage -> how long the latest runs of it took in seconds, only while enabled
+        self.tracing = False
+        self.events = [] # the trace event of every stage since the trace started
+        self.threads = {} # thread id -> name of every thread that ran a stage
+        self.origin = time.perf_counter() # trace times are counted from here
+
+    def Enable(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+
+    def Reset(self) -> None:
+        with self.lock:
+            self.timings = {}
+
+    def Record(self, stage: str, start: float, end: float, args: dict = None) -> None:
+        with self.lock:
+            if self.enabled: # a trace on its own only needs the events, which are dropped when it stops
+                if stage not in self.timings:
+                    self.timings[stage] = collections.deque(maxlen = profile_max_samples)
+                self.timings[stage].append(end - start)
+
+            if self.tracing: # a complete event, times are in microseconds
+                thread = threading.current_thread()
+                self.threads[thread.ident] = thread.name
+
+                event = {"name": stage, "ph": "X", "ts": (start - self.origin) * 1e6, "dur": (end - start) * 1e6, "pid": os.getpid(), "tid": thread.ident}
+                if args is not None:
+                    event["args"] = args
+                self.events.append(event)
+
+    # A context manager that times what runs inside it as the stage, args are shown with the stage in a trace
+    def Stage(self, name: str, args: dict = None):
+        return StageTimer(self, name, args) if self.enabled or self.tracing else nullstage
+
+    # Starts keeping every stage for a trace, stages are timed while tracing even if the profiler is disabled
+    def StartTrace(self) -> None:
+        with self.lock:
+            self.events = []
+            self.threads = {}
+            self.origin = time.perf_counter()
+            self.tracing = True
+
+    # Stops tracing and writes the trace as Chrome trace json
+    def StopTrace(self, filename: str) -> None:
+        with self.lock:
+            self.tracing = False
+            events = self.events
+            threads = self.threads
+            self.events = []
+
+        names = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}} for tid, name in threads.items()]
+
+        with open(filename, "w") as file:
+            json.dump({"traceEvents": names + events, "displayTimeUnit": "ms"}, file)
+
+    # The count, total, mean and longest time of every stage
+    def Summary(self) -> dict[str, dict[str, float]]:
+        with self.lock:
+            return {
+                stage: {"Count": len(times), "Total": sum(times), "Mean": sum(times) / len(times), "Max": max(times)}
+                for stage, times in self.timings.items()
+            }
+
+class StageTimer:
+    __slots__ = ("profiler", "name", "args", "start")
+
+    def __init__(self, profiler: Profiler, name: str, args: dict = None):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception) -> bool:
+        self.profiler.Record(self.name, self.start, time.perf_counter(), self.args)
+        return False
+
+class NullStage: # what a stage is when the profiler is off
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception) -> bool:
+        return False
+
+nullstage = NullStage()
+
+profiler = Profiler() # the profiler every module records into
+
+def Stage(name: str, args: dict = None):
+    return profiler.Stage(name, args)
+
+# Decorates a function so every call of it is timed as the stage
+def Timed(name: str):
+
+    def Decorate(function):
+
+        @functools.wraps(function)
+        def Wrapper(*args, **kwargs):
+            if not (profiler.enabled or profiler.tracing):
+                return function(*args, **kwargs)
+
+            with StageTimer(profiler, name):
+                return function(*args, **kwargs)
+
+        return Wrapper
+
+    return Decorate
@@ -0,0 +1,145 @@
+import os
+from copy import copy
+import Profiler
+
+# where the report templates are kept
+templatepath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "docs")
+
+# The results of every test before anything has run, [passed, values...] for every channel
+def EmptyPassMap(channels: int) -> dict[str, list[list]]:
+    return { "Impedance": [[False, None, None]] * channels, "PulseEcho": [[False, None, None, None, None, None, None]] * channels, "Dongle": [[False, None, None]] * channels}
+
+# Fills out the report templates with the results in passmap and saves it as filename, no GUI needed
+@Profiler.Timed("Report")
+def WriteXLSXReport(passmap: dict[str, list[list]], filename: str) -> None:
+
+    import openpyxl # only needed once there is a report to write, imported here to keep startup quick
+    from openpyxl.styles import fills, colors
+
+    report = openpyxl.Workbook() # create a new excel sheet with multiple pages
+    
+    # load all of the templates into sheets
+    donglereporttemplate = openpyxl.load_workbook(filename = os.path.join(templatepath, "DongleTemplate.xlsx"))
+    impedancereporttemplate = openpyxl.load_workbook(filename = os.path.join(templatepath, "ImpedanceTemplate.xlsx"))
+    pereporttemplate = openpyxl.load_workbook(filename = os.path.join(templatepath, "PETemplate.xlsx"))
+    
+    # copy all of the templates into the new excel sheet and name the sheets accordingly
+    donglereport = report.active
+    donglereport.title = "Dongle"
+    copy_sheet(donglereporttemplate.active, donglereport)
+    impedancereport = report.create_sheet("Impedance")
+    copy_sheet(impedancereporttemplate.active, impedancereport)
+    pereport = report.create_sheet("Pulse Echo")
+    copy_sheet(pereporttemplate.active, pereport)
+    
+    red = colors.Color("00FF0000")
+    green = colors.Color("0000FF00")
+    failcolor = fills.PatternFill(patternType = 'solid', fgColor = red)
+    passcolor = fills.PatternFill(patternType = 'solid', fgColor = green)
+    
+    # fill out the sheet with the data from the pulse echo test results
+    for i in range(8, 8 + len(passmap["PulseEcho"])):
+        
+        data = passmap["PulseEcho"][i - 8] # get the channel test results for PE
+        if None in data:
+            continue
+        
+        pereport["D" + str(i)] = f"{data[1] * 1e3: .2f}" # put the vpp in mV
+        pereport["E" + str(i)] = f"{data[3] * 1e-6: .2f}" # put the bandwidth in MHz
+        pereport["F" + str(i)] = "Pass" if data[0] else "Fail" # if the channel passed put "Pass"
+        pereport["G" + str(i)] = "True" if data[1] == 0 else "" # if the channel is dead say so
+        pereport["H" + str(i)] = f"{data[2] * 1e-6:.2f}" # put the center frequency in MHz
+        
+        color = passcolor if data[0] == True else failcolor # fill the rows with the correct color based on the pass or fail
+        rowcells = pereport.iter_cols(min_col = 3, max_col = 8, min_row = i, max_row = i)
+        for row in rowcells:
+            for cols in row: 
+                cols.fill = color
+    
+    # fill out the sheet with the impedance test results 
+    for i in range(11, 11 + len(passmap["Impedance"])):    
+
+        data = passmap["Impedance"][i - 11]
+        if None in data:
+            continue
+        
+        impedancereport["D" + str(i)] = f"{data[1] * 1e12: .2f}" # put the capacitance in pF
+        impedancereport["E" + str(i)] = "Pass" if data[0] else "Fail"  # put if the channel passed or failed
+        impedancereport["F" + str(i)] = "Open" if data[1] > 10e-12 and data[1] < 600e-12 else "Short" if data[1] < 0 else "" # Put if the channel is Open or Short based on criteria       
+        
+        color = passcolor if data[0] == True else failcolor # highlight the rows with the correct color based on if they passed or failed
+        rowcells = impedancereport.iter_cols(min_col = 3, max_col = 6, min_row = i, max_row = i)
+        for row in rowcells:
+            for cols in row: 
+                cols.fill = color
+
+    # fill out the sheet with the dongle test results
+    for i in range(11, 11 + len(passmap["Dongle"])):    
+        
+        data = passmap["Dongle"][i - 11]
+        if None in data:
+            continue
+            
+        donglereport["D" + str(i)] = f"{data[1] * 1e12: .2f}" # put the capacitance in pF
+        donglereport["E" + str(i)] = "Pass" if data[0] else "Fail" # mark if the channel passed or failed
+        donglereport["F" + str(i)] = "Open" if data[1] > 10e-12 and data[1] < 180e-12 else "Short" if data[1] < 0 else "" # mark if the channel is open or short based on criteria
+        
+        color = passcolor if data[0] == True else failcolor # color the rows according to passing or failing
+        rowcells = donglereport.iter_cols(min_col = 3, max_col = 6, min_row = i, max_row = i)
+        for row in rowcells:
+            for cols in row: 
+                cols.fill = color
+            
+    report.save(filename) # save the report
+
+
+# Straight from SO on copying whole sheets
+def copy_sheet(source_sheet, target_sheet):
+    copy_cells(source_sheet, target_sheet)  # copy all the cel values and styles
+    copy_sheet_attributes(source_sheet, target_sheet)
+
+def copy_sheet_attributes(source_sheet, target_sheet):
+    target_sheet.sheet_format = copy(source_sheet.sheet_format)
+    target_sheet.sheet_properties = copy(source_sheet.sheet_properties)
+    target_sheet.merged_cells = copy(source_sheet.merged_cells)
+    target_sheet.page_margins = copy(source_sheet.page_margins)
+    target_sheet.freeze_panes = copy(source_sheet.freeze_panes)
+
+    # set row dimensions
+    # So you cannot copy the row_dimensions attribute. Does not work (because of meta data in the attribute I think). So we copy every row's row_dimensions. That seems to work.
+    for rn in range(len(source_sheet.row_dimensions)):
+        target_sheet.row_dimensions[rn] = copy(source_sheet.row_dimensions[rn])
+
+    if source_sheet.sheet_format.defaultColWidth is None:
+        print('Unable to copy default column wide')
+    else:
+        target_sheet.sheet_format.defaultColWidth = copy(source_sheet.sheet_format.defaultColWidth)
+
+    # set specific column width and hidden property
+    # we cannot copy the entire column_dimensions attribute so we copy selected attributes
+    for key, value in source_sheet.column_dimensions.items():
+        target_sheet.column_dimensions[key].min = copy(source_sheet.column_dimensions[key].min)   # Excel actually groups multiple columns under 1 key. Use the min max attribute to also group the columns in the targetSheet
+        target_sheet.column_dimensions[key].max = copy(source_sheet.column_dimensions[key].max)  # https://stackoverflow.com/questions/36417278/openpyxl-can-not-read-consecutive-hidden-columns discussed the issue. Note that this is also the case for the width, not onl;y the hidden property
+        target_sheet.column_dimensions[key].width = copy(source_sheet.column_dimensions[key].width) # set width for every column
+        target_sheet.column_dimensions[key].hidden = copy(source_sheet.column_dimensions[key].hidden)
+
+def copy_cells(source_sheet, target_sheet):
+    for (row, col), source_cell in source_sheet._cells.items():
+        target_cell = target_sheet.cell(column=col, row=row)
+
+        target_cell._value = source_cell._value
+        target_cell.data_type = source_cell.data_type
+
+        if source_cell.has_style:
+            target_cell.font = copy(source_cell.font)
+            target_cell.border = copy(source_cell.border)
+            target_cell.fill = copy(source_cell.fill)
+            target_cell.number_format = copy(source_cell.number_format)
+            target_cell.protection = copy(source_cell.protection)
+            target_cell.alignment = copy(source_cell.alignment)
+
+        if source_cell.hyperlink:
+            target_cell._hyperlink = copy(source_cell.hyperlink)
+
+        if source_cell.comment:
+            target_cell.comment = copy(source_cell.comment)
@@ -0,0 +1,224 @@
+import time
+import queue
+import threading
+import traceback
+import Report
+import Planner
+import Journal
+
+# Runs the tests on a worker thread so the Tk main loop never waits on the instruments
+# the GUI puts commands on one queue and polls the events the worker puts on the other with root.after, the worker never touches Tk
+# pause and abort take effect between channels and while waiting for a capture trigger, a channel that has started is finished
+# runs of several channels journal every result as it comes in, so a run that was cut off can be finished or its failures retested
+
+# how long to give the operator to fire the pulser before a capture when captures aren't prompted
+unprompted_trigger_s = 5
+# how often the worker checks for an abort while it waits
+abort_check_s = .1
+
+class RunAborted(Exception): # unwinds a channel that was waiting for its trigger
+    pass
+
+class TestScheduler:
+    def __init__(self, backend):
+        self.backend = backend
+        self.commands = queue.Queue() # (command, arguments) for the worker
+        self.events = queue.Queue() # (event, data) for the GUI
+        self.resumed = threading.Event() # cleared while paused
+        self.aborted = threading.Event()
+        self.triggered = threading.Event() # set when the operator fires a capture
+        self.prompt = True # if the run waits for the operator's trigger instead of a fixed time
+        self.resumed.set()
+
+        self.thread = threading.Thread(target = self.Worker, name = "Tests", daemon = True)
+        self.thread.start()
+
+    # Runs the tests on the 1 indexed channels, passmap is updated and written out as the report after a run of several channels
+    def Run(self, channels: list[int], tests: list[str], filename: str, prompt: bool, passmap: dict[str, list[list]] = None) -> None:
+        self.aborted.clear()
+        self.resumed.set()
+        self.commands.put(("Run", (channels, tests, filename, prompt, passmap)))
+
+    # Finishes the run journaled under filename, measuring only what it has no results for, the journal's results are merged into passmap
+    def ContinueRun(self, filename: str, prompt: bool, passmap: dict[str, list[list]] = None) -> None:
+        self.aborted.clear()
+        self.resumed.set()
+        self.commands.put(("Recover", (filename, prompt, passmap, False)))
+
+    # Measures again only the channels of the run journaled under filename that failed or have no results and merges them into passmap
+    def RetestFailures(self, filename: str, prompt: bool, passmap: dict[str, list[list]] = None) -> None:
+        self.aborted.clear()
+        self.resumed.set()
+        self.commands.put(("Recover", (filename, prompt, passmap, True)))
+
+    # Selects a 1 indexed channel on the worker, a missed acknowledgement is retried there instead of freezing the GUI
+    def SelectChannel(self, channel: int) -> None:
+        self.commands.put(("Select", (channel,)))
+
+    # Writes the report of passmap on the worker, after every plot of the run is saved
+    def Report(self, passmap: dict[str, list[list]], filename: str) -> None:
+        self.commands.put(("Report", (passmap, filename)))
+
+    def Pause(self) -> None:
+        self.resumed.clear()
+        self.Post("Paused")
+
+    def Resume(self) -> None:
+        self.resumed.set()
+        self.Post("Resumed")
+
+    def Abort(self) -> None:
+        self.aborted.set()
+        self.resumed.set() # a paused run has to wake up to stop
+        self.triggered.set()
+
+    def Trigger(self) -> None: # the operator fired the pulser
+        self.triggered.set()
+
+    def Stop(self) -> None: # ends the worker once it has finished what it was given
+        self.commands.put(("Stop", None))
+
+    # Every event the worker posted since the last call
+    def Poll(self) -> list[tuple[str, object]]:
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def Post(self, event: str, data = None) -> None:
+        self.events.put((event, data))
+
+    def Worker(self) -> None:
+
+        while True:
+            command, arguments = self.commands.get()
+            if command == "Stop":
+                return
+
+            try:
+                if command == "Run":
+                    self.RunJob(*arguments)
+                elif command == "Recover":
+                    self.RecoverJob(*arguments)
+                elif command == "Report":
+                    self.WriteReport(*arguments)
+                elif command == "Select":
+                    self.Select(*arguments)
+            except Exception as e: # tell the GUI instead of killing the worker
+                traceback.print_exc()
+                self.Post("Error", str(e))
+
+            if self.commands.empty():
+                self.Post("Idle") # everything the GUI asked for is done
+
+    # Runs the tests on the channels, mode is "Run" for a new run or "Resume" and "Retest" to add to its journal, needed limits them like PlanRun
+    def RunJob(self, channels: list[int], tests: list[str], filename: str, prompt: bool, passmap: dict[str, list[list]], mode: str = "Run", needed: dict[int, list[str]] = None) -> None:
+
+        start = time.perf_counter()
+        self.prompt = prompt
+
+        if self.backend.scope.IsConnected(): # the scope settings may have been changed on the front panel since the last run
+            self.backend.scope.InvalidateCache()
+
+        single = len(channels) == 1 and mode == "Run"
+        journal = None if single else Journal.JournalWriter(filename, channels, tests, mode) # a single channel doesn't replace the journal of the last run
+
+        runname = filename if mode == "Run" else filename + mode # a resumed or retested run keeps the archive and trace of the first
+        self.backend.StartArchive(runname) # save the raw captures of the run so it can be re-scored later
+        self.backend.StartTrace(runname) # and a timeline of where the time went
+
+        steps = [(channel, tests) for channel in channels]
+        if not single:
+            steps = Planner.PlanRun(self.backend, channels, tests, needed = needed)["Steps"] # the order that switches and reconfigures the least
+            self.backend.StartSequence([channel for channel, _ in steps], tests) # the Arduino steps through the channels itself
+
+        self.Post("Started", {"Count": len(steps)})
+        done = 0
+
+        def Proceed(channel: int) -> bool: # asked before every step is measured
+            if not self.WaitWhilePaused():
+                return False
+
+            print(f"Running Test on Channel: {channel}")
+            self.Post("Channel", {"Channel": channel, "Index": done, "Count": len(steps)})
+            return True
+
+        try:
+            for channel, results in self.backend.RunSteps(steps, filename, self.WaitForTrigger, single, Proceed): # in plan order
+                if passmap is not None:
+                    for test, values in results.items():
+                        for c, result in values.items():
+                            passmap[test][c - 1] = result # record the results
+
+                if journal is not None:
+                    journal.Append(channel, results) # on disk before the next channel starts
+
+                done += 1
+                self.Post("Results", {"Channel": channel, "Results": results, "Index": done, "Count": len(steps)})
+
+            if journal is not None and not self.aborted.is_set():
+                journal.Finish()
+
+        except RunAborted:
+            pass
+
+        finally:
+            self.backend.StopSequence()
+            self.backend.StopArchive()
+            self.backend.StopTrace()
+            if journal is not None:
+                journal.Close()
+
+        aborted = self.aborted.is_set()
+        if not single and not aborted and passmap is not None: # after all channels have been run then generate a report of the findings
+            self.WriteReport(passmap, filename + "Report.xlsx")
+
+        self.Post("Done", {"Aborted": aborted, "Channels": done, "Seconds": time.perf_counter() - start})
+
+    # Picks a journaled run back up, everything it is missing or with failed set everything that failed too
+    def RecoverJob(self, filename: str, prompt: bool, passmap: dict[str, list[list]], failed: bool) -> None:
+
+        journal = Journal.ReadJournal(filename)
+        if journal is None:
+            raise FileNotFoundError(f"No Run Journaled as {filename}")
+
+        if passmap is not None:
+            Journal.MergeResults(journal, passmap) # the results from before, even if the GUI that measured them is gone
+
+        needed = Journal.Needed(journal, failed)
+        if len(needed) == 0:
+            self.Post("Status", "Every Channel Passed" if failed else "The Run Was Already Finished")
+            return
+
+        print(f"{'Retesting' if failed else 'Resuming'} {len(needed)} of {len(journal['Channels'])} Channels")
+        self.RunJob(journal["Channels"], journal["Tests"], filename, prompt, passmap, "Retest" if failed else "Resume", needed)
+
+    def Select(self, channel: int) -> None:
+        self.Post("Selected", {"Channel": channel, "Byte": self.backend.SetChannel(channel - 1)}) # the firmware acknowledges what it selected
+
+    def WriteReport(self, passmap: dict[str, list[list]], filename: str) -> None:
+
+        self.Post("Status", "Writing Report")
+        self.backend.plotter.Wait() # make sure every plot of the run has been written before reporting
+        Report.WriteXLSXReport(passmap, filename) # save the report
+        self.Post("Report", filename)
+
+    def WaitWhilePaused(self) -> bool: # False if the run was aborted
+        self.resumed.wait() # abort sets it too
+        return not self.aborted.is_set()
+
+    # Waits for the operator to fire the pulser before a pulse echo capture, as an event instead of spinning
+    def WaitForTrigger(self) -> None:
+
+        self.triggered.clear()
+        self.Post("Waiting", self.prompt)
+
+        deadline = None if self.prompt else time.perf_counter() + unprompted_trigger_s
+        while not self.triggered.wait(abort_check_s):
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+
+        if self.aborted.is_set():
+            raise RunAborted()
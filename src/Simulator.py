@@ -0,0 +1,496 @@
+import os
+import sys
+import time
+import threading
+import numpy as np # for Various Data and Numerical Operations
+import Arduino
+import Oscilloscope
+import VNA
+
+# Simulated stand ins for the bench so the whole tester can run on any machine
+# the mux answers like main.ino, the scope answers the SCPI the Oscilloscope class sends and the VNA runs VNWAStub.py
+# everything waits like the real instruments would so full runs can be timed, scale the waits with latency_scale
+
+# how long every simulated operation takes in seconds
+simulated_latencies = {
+    "SerialByte": 10 / 115200, # one byte on the wire at 115200 baud
+    "SerialResponse": .001, # the firmware reading a frame and sending its acknowledgement
+    "RelaySettle": 1.0, # the fraction of the relay settle times that is really waited
+    "ScopeCommand": .0005, # a write to the scope
+    "ScopeQuery": .002, # a query round trip
+    "ScopeAcquisition": .01, # one triggered acquisition
+    "PulserInterval": .005, # between the pulser shots a running scope triggers on
+    "ScopeByte": 1 / 10e6, # one sample of a curve transfer
+    "VNAStartup": 2.0, # starting the VNA app
+    "VNAPoint": 1.0, # the fraction of the VNA time per point a sweep really takes
+}
+
+# multiplies every latency, 0 runs the simulation as fast as it can
+latency_scale = 1.0
+
+# the simulated transducer array, every element gets its own response drawn from these
+simulated_elements = 256 # how many elements the mux can select
+simulated_seed = 1 # the same seed gives the same array every run
+simulated_amplitude_v = .05 # the mean peak amplitude of an echo
+simulated_amplitude_spread = .1 # the spread of the amplitude as a fraction of it
+simulated_center_hz = 6.5e6 # the mean center frequency of an echo
+simulated_center_spread_hz = .2e6
+simulated_pulse_width_s = .15e-6 # how long an echo rings
+simulated_echo_delay_s = 50e-6 # when the echo arrives after the trigger
+simulated_noise_v = .002 # the rms noise of a single acquisition
+simulated_dead_fraction = .02 # the fraction of elements that give no echo
+simulated_resistance = 5.0 # the series resistance of every element in ohms
+simulated_capacitance = 725e-12 # the mean series capacitance of an element in farads
+simulated_capacitance_spread = 8e-12
+simulated_relay_settle_s = [.0021, .0028, .0024, .0031] # how long the switched line of every relay bank really takes to settle
+simulated_mux_settle_s = 20e-6 # and a switch of the mux alone
+simulated_settle_jitter = .05 # the spread of a settle time from switch to switch as a fraction of it
+
+simulated_record_length = 100000 # the samples in a record
+simulated_sample_interval_s = 1e-9 # the time between samples
+simulated_volts_per_div = .02 # the vertical scale of every channel until it is set
+
+# Sleeps unless the latency is nothing
+def Wait(seconds: float) -> None:
+    if seconds > 0:
+        time.sleep(seconds)
+
+# The latencies multiplied by the scale
+def ScaledLatencies(latencies: dict[str, float] = None, scale: float = None) -> dict[str, float]:
+    latencies = simulated_latencies if latencies is None else latencies
+    scale = latency_scale if scale is None else scale
+    return {key: value * scale for key, value in latencies.items()}
+
+# The simulated fixture, holds the channel the mux selected and the response of every element
+class SimulatedBench:
+    def __init__(self, seed: int = None):
+        rng = np.random.default_rng(simulated_seed if seed is None else seed)
+
+        self.value = 0 # the last byte the mux was sent
+        self.enabled = False # the mux enables itself after the first byte like main.ino
+
+        self.amplitude = simulated_amplitude_v * (1 + simulated_amplitude_spread * rng.standard_normal(simulated_elements))
+        self.amplitude[rng.random(simulated_elements) < simulated_dead_fraction] = 0 # dead elements
+        self.center = simulated_center_hz + simulated_center_spread_hz * rng.standard_normal(simulated_elements)
+        self.capacitance = simulated_capacitance + simulated_capacitance_spread * rng.standard_normal(simulated_elements)
+        self.settletimes = simulated_relay_settle_s + [simulated_mux_settle_s] # indexed like the firmware settle times
+        self.rng = rng
+        self.listeners = [] # called with the time of every trigger, like the wire from the scope's trigger out
+
+    def Select(self, value: int) -> None:
+        self.value = value
+        self.enabled = True
+
+    def Trigger(self, at: float) -> None:
+        for listener in self.listeners:
+            listener(at)
+
+    # How long a switch with this settle index takes to settle this time
+    def Settle(self, bank: int) -> float:
+        return self.settletimes[bank] * (1 + simulated_settle_jitter * abs(self.rng.standard_normal()))
+
+    # The element the mux has selected, undoing the relay mapping CatheterTester.SetChannel applies
+    def Element(self, offset: int = 0) -> int:
+
+        relay_ch = (self.value & 0x30) >> 4
+        if relay_ch == 0x3:
+            relay_ch = 0x2
+        elif relay_ch == 0x2:
+            relay_ch = 0x3
+
+        return ((self.value & 0x0F) | (relay_ch << 4)) + offset
+
+    # The voltage of the echo of an element at the times t, nothing if the mux is off or the element is None
+    def Echo(self, element: int, t: np.ndarray) -> np.ndarray:
+
+        if not self.enabled or element is None or element >= simulated_elements:
+            return np.zeros(len(t))
+
+        envelope = np.exp(-((t - simulated_echo_delay_s) / simulated_pulse_width_s) ** 2)
+        return self.amplitude[element] * envelope * np.sin(2 * np.pi * self.center[element] * (t - simulated_echo_delay_s))
+
+# A serial port that answers the framed protocol like main.ino, acknowledging every command once the relays would have settled
+class SimulatedSerial:
+    def __init__(self, bench: SimulatedBench, latencies: dict[str, float] = None, timeout: float = .5):
+        self.bench = bench
+        self.latencies = ScaledLatencies() if latencies is None else latencies
+        self.timeout = timeout
+        self.received = b"" # bytes of a frame that hasn't all come in yet
+        self.replies = [] # (time it is ready, bytes) of every reply the host hasn't read
+        self.settle = [5000e-6] * Arduino.relay_banks + [50e-6] # the settle times the firmware waits, the same defaults as main.ino
+        self.current = None # the channel the firmware selected
+        self.sequence = [] # the loaded channel sequence
+        self.sequenceindex = 0
+        self.reports = 0 # the sequence numbers of the steps the firmware reports on its own
+        self.trigger = False # if the trigger pin steps the sequence
+        self.triggerdelay = 1000e-6
+        self.busy = 0.0 # when the firmware is done with what it is doing
+        self.resync = False # dropping everything up to the next frame sync after a broken frame, like main.ino
+        self.lock = threading.RLock() # the trigger wire steps the sequence from the scope's thread
+        bench.listeners.append(self.Trigger)
+
+    def __str__(self) -> str:
+        return "Simulated Serial Mux"
+
+    @property
+    def in_waiting(self) -> int:
+        now = time.perf_counter()
+        return sum(len(reply) for ready, reply in self.replies if ready <= now)
+
+    def write(self, data: bytes) -> int:
+
+        Wait(len(data) * self.latencies["SerialByte"])
+        self.received += data
+
+        with self.lock:
+            while True: # answer every whole frame that has come in
+                frame = self.NextFrame()
+                if frame is None:
+                    break
+                self.Execute(*frame)
+
+        return len(data)
+
+    # Takes the next whole frame off of what was received, None if there isn't one yet, a next byte before it steps the sequence
+    # unless a broken frame came before it
+    def NextFrame(self) -> tuple[int, int, bytes, bool]:
+
+        while True:
+            start = self.received.find(bytes([Arduino.frame_sync]))
+            if not self.resync:
+                for _ in range(self.received[:start if start >= 0 else len(self.received)].count(Arduino.next_byte)):
+                    self.Step(self.latencies["SerialResponse"])
+
+            if start < 0:
+                self.received = b""
+                return None
+
+            self.resync = False
+            self.received = self.received[start:]
+            if len(self.received) >= 4 and self.received[3] > Arduino.max_payload: # not a frame, look for the next one
+                self.received = self.received[1:]
+                self.resync = True
+                continue
+
+            break
+
+        if len(self.received) < 4 or len(self.received) < 5 + self.received[3]:
+            return None
+
+        length = self.received[3]
+        body = self.received[1:4 + length]
+        checksum = self.received[4 + length]
+        self.received = self.received[5 + length:]
+
+        return body[0], body[1], body[3:], Arduino.Checksum(body) == checksum
+
+    # Does what main.ino does with a command and queues its acknowledgement for when it would be sent
+    def Execute(self, sequence: int, command: int, payload: bytes, valid: bool) -> None:
+
+        delay = self.latencies["SerialResponse"]
+
+        if not valid:
+            self.Reply(sequence, Arduino.status_bad_checksum, b"", delay)
+            self.resync = True
+
+        elif not self.ValidLength(command, payload):
+            known = Arduino.command_set_channel <= command <= Arduino.command_stop_sequence
+            self.Reply(sequence, Arduino.status_bad_length if known else Arduino.status_unknown_command, b"", delay)
+
+        elif command == Arduino.command_set_channel:
+            bank = self.Select(payload[0])
+            self.Reply(sequence, Arduino.status_ok, bytes([payload[0]]), delay + self.settle[bank] * self.latencies["RelaySettle"])
+
+        elif command == Arduino.command_set_settle:
+            if payload[0] <= Arduino.mux_bank:
+                self.settle[payload[0]] = int.from_bytes(payload[1:5], "little") * 1e-6
+            self.Reply(sequence, Arduino.status_ok, b"", delay)
+
+        elif command == Arduino.command_measure_settle:
+            bank = self.Select(payload[0])
+            settle = self.bench.Settle(bank)
+            self.Reply(sequence, Arduino.status_ok, int(settle * 1e6).to_bytes(4, "little"), delay + settle * self.latencies["RelaySettle"])
+
+        elif command == Arduino.command_load_sequence:
+            self.sequence = self.sequence[:payload[0]] + list(payload[1:])
+            self.sequenceindex = 0
+            self.Reply(sequence, Arduino.status_ok, b"", delay)
+
+        elif command == Arduino.command_start_sequence:
+            if len(self.sequence) == 0:
+                self.Reply(sequence, Arduino.status_no_sequence, b"", delay)
+            else:
+                self.sequenceindex = 0
+                bank = self.Select(self.sequence[0])
+                self.Reply(sequence, Arduino.status_ok, bytes([0, self.current]), delay + self.settle[bank] * self.latencies["RelaySettle"])
+
+        elif command == Arduino.command_set_trigger:
+            self.trigger = payload[0] != 0
+            self.triggerdelay = int.from_bytes(payload[1:5], "little") * 1e-6
+            self.Reply(sequence, Arduino.status_ok, b"", delay)
+
+        elif command == Arduino.command_stop_sequence:
+            self.sequence = []
+            self.trigger = False
+            self.Reply(sequence, Arduino.status_ok, b"", delay)
+
+        else:
+            self.Reply(sequence, Arduino.status_unknown_command, b"", delay)
+
+    def ValidLength(self, command: int, payload: bytes) -> bool: # the payload checks of main.ino's valid_length
+
+        if command in (Arduino.command_set_channel, Arduino.command_measure_settle):
+            return len(payload) == 1
+        if command in (Arduino.command_set_settle, Arduino.command_set_trigger):
+            return len(payload) == 5
+        if command == Arduino.command_load_sequence:
+            return len(payload) >= 2 and payload[0] <= len(self.sequence) and payload[0] + len(payload) - 1 <= Arduino.sequence_length
+        if command in (Arduino.command_start_sequence, Arduino.command_stop_sequence):
+            return len(payload) == 0
+        return False
+
+    # Steps the sequence like main.ino and reports the live channel once it settles
+    def Step(self, delay: float) -> None:
+
+        if self.sequenceindex + 1 >= len(self.sequence):
+            self.Reply(self.reports, Arduino.status_sequence_done, bytes([self.sequenceindex, self.current or 0]), delay)
+        else:
+            self.sequenceindex += 1
+            bank = self.Select(self.sequence[self.sequenceindex])
+            self.Reply(self.reports, Arduino.status_live, bytes([self.sequenceindex, self.current]), delay + self.settle[bank] * self.latencies["RelaySettle"])
+
+        self.reports = (self.reports + 1) & 0xFF
+
+    def Trigger(self, at: float) -> None: # an edge on the trigger pin at the time at
+        with self.lock:
+            if self.trigger and len(self.sequence) != 0:
+                self.Step(max(at - time.perf_counter(), 0) + self.triggerdelay * self.latencies["RelaySettle"])
+
+    def Select(self, channel: int) -> int: # selects the channel, gives back the settle index of the switch like main.ino
+
+        bank = (channel >> 4) & 0x3
+        if self.current is not None and bank == (self.current >> 4) & 0x3:
+            bank = Arduino.mux_bank
+
+        self.current = channel
+        self.bench.Select(channel)
+        return bank
+
+    def Reply(self, sequence: int, status: int, payload: bytes, delay: float) -> None: # the firmware does one thing at a time
+        body = bytes([sequence, status, len(payload)]) + payload
+        self.busy = max(self.busy, time.perf_counter()) + delay
+        self.replies.append((self.busy, bytes([Arduino.ack_sync]) + body + bytes([Arduino.Checksum(body)])))
+
+    def read(self, size: int = 1) -> bytes:
+
+        if len(self.replies) == 0: # nothing is coming, wait out the timeout like a real port
+            Wait(self.timeout)
+            return b""
+
+        data = b""
+        while len(data) < size and len(self.replies) != 0:
+            ready, reply = self.replies.pop(0)
+            Wait(ready - time.perf_counter())
+
+            if len(data) + len(reply) > size: # put back what wasn't asked for
+                self.replies.insert(0, (ready, reply[size - len(data):]))
+                reply = reply[:size - len(data)]
+
+            data += reply
+
+        return data
+
+    def readline(self) -> bytes: # the firmware doesn't send lines anymore, everything it sends is read with read
+        return self.read(self.in_waiting or 1)
+
+    def reset_input_buffer(self) -> None:
+        self.replies = []
+
+    def close(self) -> None:
+        pass
+
+# A VISA resource that answers the SCPI the Oscilloscope class sends like a Tektronix scope, synthesizing pulse echo records
+class SimulatedScope:
+    def __init__(self, bench: SimulatedBench, latencies: dict[str, float] = None, recordlength: int = None, seed: int = None):
+        self.bench = bench
+        self.latencies = ScaledLatencies() if latencies is None else latencies
+        self.rng = np.random.default_rng(seed)
+        self.timeout = 2000 # ms like pyvisa
+        self.settings = {
+            "HORIZONTAL:RECORDLENGTH": str(simulated_record_length if recordlength is None else recordlength),
+            "DATA:SOURCE": "CH1", "DATA:START": "1", "DATA:STOP": str(simulated_record_length if recordlength is None else recordlength),
+            "ACQUIRE:MODE": "NORMALSAMPLE", "ACQUIRE:NUMAVG": "1", "ACQUIRE:STOPAFTER": "RUNSTOP",
+        }
+        self.done = 0.0 # when the acquisition in progress finishes
+        self.acquisitions = 0 # how many acquisitions were triggered
+        self.element = None # the element the mux had selected when the last acquisition triggered
+        self.running = False # if the scope is free running, triggering on every pulser shot until it is stopped
+
+    def __str__(self) -> str:
+        return "Simulated Scope"
+
+    # the long and short forms of the headers the Oscilloscope class uses
+    aliases = {"DATA:SOU": "DATA:SOURCE", "DATA:ENCDG": "DATA:ENCODING", "HORIZONTAL:RECORD": "HORIZONTAL:RECORDLENGTH"}
+
+    def Header(self, header: str) -> str:
+        header = header.upper()
+        return self.aliases.get(header, header)
+
+    def write(self, command: str) -> None:
+
+        Wait(self.latencies["ScopeCommand"])
+
+        for part in command.split(";"): # several commands can be sent at once
+            items = part.strip().split(maxsplit=1)
+            if len(items) == 0:
+                continue
+
+            header = self.Header(items[0])
+            if len(items) > 1:
+                self.settings[header] = items[1].strip()
+
+            if header == "ACQUIRE:STATE" and self.settings[header] in ("RUN", "1") and self.settings["ACQUIRE:STOPAFTER"] == "SEQUENCE":
+                self.running = False
+                self.done = time.perf_counter() + self.latencies["ScopeAcquisition"] * self.Averages()
+                self.acquisitions += 1
+                self.element = self.bench.Element() if self.bench.enabled else None # the record is of what was selected at the trigger
+                self.bench.Trigger(self.done) # the trigger out
+
+            elif header == "ACQUIRE:STATE" and self.settings[header] in ("RUN", "1"):
+                if not self.running:
+                    self.running = True
+                    threading.Thread(target = self.FreeRun, name = "Scope Free Run", daemon = True).start()
+
+            elif header == "ACQUIRE:STATE":
+                self.running = False
+
+    def FreeRun(self) -> None: # a running scope pulses its trigger out on every shot of the pulser, like the real one
+        while self.running:
+            Wait(max(self.latencies["PulserInterval"], .001))
+            if self.running:
+                self.bench.Trigger(time.perf_counter())
+
+    def query(self, command: str) -> str:
+
+        Wait(self.latencies["ScopeQuery"])
+        header = self.Header(command.strip().rstrip("?"))
+
+        if header == "*IDN":
+            return "TEKTRONIX,SIMULATED,0,0"
+        if header == "*OPC": # answers once the acquisition is done
+            Wait(self.done - time.perf_counter())
+            return "1"
+        if header == "*ESR":
+            return "1"
+        if header == "BUSY":
+            return "1" if time.perf_counter() < self.done else "0"
+        if header == "WFMOUTPRE":
+            preamble = self.Preamble()
+            return f'1;8;BIN;RI;MSB;"{self.settings["DATA:SOURCE"]}, DC coupling";{self.Points()};Y;"s";{preamble["XINCR"]};0;0;"V";{preamble["YMULT"]};0;0'
+        if header.startswith("WFMOUTPRE:"):
+            return str(self.Preamble()[header.split(":")[1]])
+        if header in self.settings:
+            return self.settings[header]
+
+        import pyvisa as visa # for the errors a real VISA resource raises
+        raise visa.VisaIOError(visa.constants.StatusCode.error_timeout) # a real scope doesn't answer what it doesn't know
+
+    def query_binary_values(self, command: str, datatype: str = "b", container = list):
+
+        points = self.Points()
+        Wait(self.latencies["ScopeQuery"] + points * self.latencies["ScopeByte"])
+
+        return container(self.Curve())
+
+    def read_stb(self) -> int:
+        return 64
+
+    def wait_for_srq(self, timeout: int = None) -> None:
+        Wait(self.done - time.perf_counter())
+
+    def close(self) -> None:
+        pass
+
+    def Averages(self) -> int: # how many acquisitions make up one record
+        return int(self.settings["ACQUIRE:NUMAVG"]) if self.settings["ACQUIRE:MODE"].upper().startswith("AVE") else 1
+
+    def Channel(self) -> int: # the source channel number
+        return int(self.settings["DATA:SOURCE"].upper().replace("CH", ""))
+
+    def Preamble(self) -> dict[str, float]:
+        volts = float(self.settings.get(f"CH{self.Channel()}:SCALE", simulated_volts_per_div))
+        return {"XINCR": simulated_sample_interval_s, "YMULT": volts / 25, "YOFF": 0.0, "YZERO": 0.0} # 25 levels per division
+
+    def Range(self) -> tuple[int, int]: # the first and one past the last sample transferred
+        length = int(self.settings["HORIZONTAL:RECORDLENGTH"])
+        start = min(max(int(self.settings["DATA:START"]), 1), length)
+        stop = min(max(int(self.settings["DATA:STOP"]), start), length)
+        return start - 1, stop
+
+    def Points(self) -> int:
+        start, stop = self.Range()
+        return stop - start
+
+    # The samples of the source channel from DATA:START to DATA:STOP of the last acquisition
+    def Curve(self) -> np.ndarray:
+
+        start, stop = self.Range()
+        preamble = self.Preamble()
+
+        t = np.arange(start, stop) * preamble["XINCR"]
+        element = self.bench.Element() if self.acquisitions == 0 else self.element
+        voltage = self.bench.Echo(None if element is None else element + self.Channel() - 1, t) # input n sees the element n - 1 past the selected one
+        voltage += self.rng.normal(0, simulated_noise_v / np.sqrt(self.Averages()), len(t)) # averaging beats the noise down
+
+        return np.clip(np.round(voltage / preamble["YMULT"]), -128, 127).astype(np.int8)
+
+# A VNA running VNWAStub.py, every sweep measures the element the mux has selected
+class SimulatedVNA(VNA.VNA):
+    def __init__(self, bench: SimulatedBench, latencies: dict[str, float] = None):
+        super().__init__()
+        latencies = ScaledLatencies() if latencies is None else latencies
+
+        self.bench = bench
+        stub = os.path.join(os.path.dirname(os.path.abspath(__file__)), "VNWAStub.py")
+        self.executable = [sys.executable, stub, f"-startup={latencies['VNAStartup']}", f"-pointscale={latencies['VNAPoint']}"]
+
+    def SweepCommands(self) -> list[str]: # the load is picked when the sweep is started, like the relays would be
+        element = self.bench.Element()
+        capacitance = self.bench.capacitance[element] if element < simulated_elements else simulated_capacitance
+        return [f"load {simulated_resistance} {capacitance}"] + super().SweepCommands()
+
+# An Arduino, Oscilloscope and VNA on one simulated bench
+def SimulatedInstruments(latencies: dict[str, float] = None, recordlength: int = None, seed: int = None) -> tuple[Arduino.Arduino, Oscilloscope.Oscilloscope, VNA.VNA]:
+
+    latencies = ScaledLatencies() if latencies is None else latencies
+    bench = SimulatedBench(seed)
+
+    arduino = Arduino.Arduino(SimulatedSerial(bench, latencies))
+    scope = Oscilloscope.Oscilloscope(SimulatedScope(bench, latencies, recordlength, seed))
+    vna = SimulatedVNA(bench, latencies)
+
+    return arduino, scope, vna
+
+# module main function for testing, runs a few channels on the simulated bench and times them
+
+if __name__ == "__main__":
+
+    import TesterBackend as tb
+
+    latency_scale = float(sys.argv[1]) if len(sys.argv) > 1 else latency_scale
+    channels = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    tester = tb.CatheterTester(*SimulatedInstruments())
+    filename = os.path.join("Simulation", "Sim")
+    os.makedirs("Simulation", exist_ok = True)
+
+    start = time.perf_counter()
+    for channel in range(1, channels + 1):
+        tester.SetChannel(channel - 1)
+
+        result = tester.PulseEchoTest(1, channel, filename)
+        results = tester.RunVNATests(channel, filename, ["Impedance"])
+        print(f"Channel {channel}: Pulse Echo {'Passed' if result[0] else 'Failed'} Impedance {'Passed' if results['Impedance'][0] else 'Failed'}")
+
+    tester.plotter.Wait()
+    print(f"{channels} Channels Took {time.perf_counter() - start: .2f}s")
@@ -1,24 +1,27 @@
 
-from tkinter import StringVar, ttk, Tk, IntVar, Toplevel
 import time
+startup = time.perf_counter() # when the program started, to report how long startup took
+
+from tkinter import StringVar, ttk, Tk, IntVar, Toplevel
 import TesterBackend as tb
 import csv
 import os
-import threading
-import openpyxl
-from openpyxl.styles import fills, colors
-from copy import copy
+import sys
+import Report
+import Scheduler
 
 vnachanneloffset = 1 << 7
 scopechanneloffset = 1 << 6
 
+poll_ms = 50 # how often the GUI picks up what the test worker posted
+
 class TesterFrontEnd:  # a GUI front end for the test
 
     def __init__(self):
         # Configure the GUI Basic Parts
         self.root = Tk() # setup the GUI base
         self.root.title("Catheter Tester Script")
-        self.root.geometry("600x400")
+        self.root.geometry("600x540")
 
         self.style = ttk.Style()
         self.style.configure("TCheckbutton", font = ("Arial", 16))
@@ -36,9 +39,12 @@ class TesterFrontEnd:  # a GUI front end for the test
         self.text = StringVar(self.root, "Channel " + str(self.channel)) # the string to display the channel
 
         # Variable to Store the Results of all of the Tests
-        self.passmap = { "Impedance": [[False, None]] * tb.max_channel, "PulseEcho": [[False, None, None, None]] * tb.max_channel, "Dongle": [[False, None]] * tb.max_channel}
+        self.passmap = Report.EmptyPassMap(tb.max_channel)
         self.backend = tb.CatheterTester() # Backend tester that does the actual work 
-        self.triggered = IntVar(self.root, 0)
+        self.scheduler = Scheduler.TestScheduler(self.backend) # runs the tests off of the GUI thread
+        self.capturewindow = None # the capture prompt of the run
+        self.paused = False
+        self.status = StringVar(self.root, "Ready") # what the run is doing
 
         self.window = ttk.Frame(self.root)  # All widget elements
         
@@ -57,6 +63,13 @@ class TesterFrontEnd:  # a GUI front end for the test
 
         self.runbutton = ttk.Button(self.root, text = "Run Tests", command = self.RunTests) # all of the buttons to actually run the tests and get results and stuff
         self.reportbutton = ttk.Button(self.root, text = "Generate Report", command = self.GenerateXLSXReport)
+        self.resumebutton = ttk.Button(self.root, text = "Resume Run", command = self.ContinueRun) # finish a run that was cut off from its journal
+        self.retestbutton = ttk.Button(self.root, text = "Retest Failures", command = self.RetestFailures)
+        self.pausebutton = ttk.Button(self.root, text = "Pause", command = self.TogglePause, state = "disabled")
+        self.abortbutton = ttk.Button(self.root, text = "Abort", command = self.scheduler.Abort, state = "disabled")
+
+        self.progress = ttk.Progressbar(self.root, maximum = 1.0) # how far along the run is
+        self.statuslabel = ttk.Label(self.root, textvariable = self.status, font = ("Arial", 12))
 
     def Draw(self) -> None: # positions and draws all of the widgets in the frame
 
@@ -75,28 +88,30 @@ class TesterFrontEnd:  # a GUI front end for the test
         self.filenamelabel.place(x = 50, y = 200)
         self.filename.place(x = 300, y = 200, height = 50, width = 250)
 
+        self.resumebutton.place(x = 50, y = 360)
+        self.retestbutton.place(x = 400, y = 360)
+        self.pausebutton.place(x = 50, y = 420)
+        self.abortbutton.place(x = 400, y = 420)
+        self.progress.place(x = 50, y = 480, width = 500, height = 20)
+        self.statuslabel.place(x = 50, y = 505)
+
+        self.root.after(poll_ms, self.Poll) # pick up what the test worker posts
         self.window.mainloop()
             
-    def RunSingleChannelTest(self, channel, filename) -> None:
-
-        if(self.impedancetest.get() != 0 or self.dongletest.get() != 0 or self.pulseechotest.get() != 0): # repeat the same process with the impedance test/dongle test
-            channel &= ~vnachanneloffset
-        else:
-            channel |= vnachanneloffset     # if we are running a test then mark the box to connect to the VNA/scope
+    def SelectedTests(self) -> list[str]: # the tests to run, the backend runs tests that need the same sweep off of one measurement
 
-        self.backend.SetChannel(channel - 1) # set the channel to be the 0 indexed channel vs the 1 indexed channel
-
-        print(f"Running Test on Channel: {channel}")
-    
+        tests = []
         if self.pulseechotest.get() != 0:
-            self.passmap["PulseEcho"][channel - 1] = self.RunPulseEchoTest(channel, filename) # Run the Tests and record the Results
+            tests.append("PulseEcho")
 
         if self.impedancetest.get() != 0:
-            self.passmap["Impedance"][channel - 1] = self.RunImpedanceTest(channel, filename) 
+            tests.append("Impedance")
 
         if self.dongletest.get() != 0:
-            self.passmap["Dongle"][channel - 1] =  self.RunDongleTest(channel, filename) 
-    
+            tests.append("Dongle")
+
+        return tests
+
     def RunTests(self) -> None:
         
         if(self.impedancetest.get() == 0 and self.dongletest.get() == 0 and self.pulseechotest.get() == 0): # repeat the same process with the impedance test/dongle test
@@ -107,66 +122,126 @@ class TesterFrontEnd:  # a GUI front end for the test
 
         os.makedirs(path, exist_ok=True) # if the directory isn't there create it
 
-        window = None
         if self.promptcapture.get() and self.pulseechotest.get():   # if we want to prompt capture then open up a capture window
-            window = self.CapturePopup()
-        
-        if self.allchannels.get() != 0:
-            for i in range(tb.max_channel):
-                self.RunSingleChannelTest(i + 1, filename)  # run every channel
-            
-            self.GenerateXLSXReport() # after all channels have been run then generate a report of the findings
+            self.capturewindow = self.CapturePopup()
 
+        channels = list(range(1, tb.max_channel + 1)) if self.allchannels.get() != 0 else [self.channel] # every channel or only the one selected
+
+        self.SetRunning(True)
+        self.scheduler.Run(channels, self.SelectedTests(), filename, self.promptcapture.get() != 0, self.passmap) # the report is written after a run of every channel
+
+    def ContinueRun(self) -> None: # measures whatever the journaled run under the filename didn't get to
+        self.RecoverRun(False)
+
+    def RetestFailures(self) -> None: # measures the channels of the journaled run that failed or didn't get measured again
+        self.RecoverRun(True)
+
+    def RecoverRun(self, failed: bool) -> None:
+
+        filename = os.getcwd() + '\\' + self.filename.get() # the capture window opens if the journaled run has captures to prompt
+
+        self.SetRunning(True)
+        if failed:
+            self.scheduler.RetestFailures(filename, self.promptcapture.get() != 0, self.passmap) # the report is written again with the new results
         else:
-            self.RunSingleChannelTest(self.channel, filename) # run only one channel
+            self.scheduler.ContinueRun(filename, self.promptcapture.get() != 0, self.passmap)
 
-        if self.promptcapture.get() and self.pulseechotest.get(): # after we are done destroy the capture window if we are using it
-            window.destroy()
-            
     def CapturePopup(self) -> Toplevel: 
         
         window = Toplevel() # a secondary window
-        
-        def CaptureButtonCB() -> None:
-            self.triggered.set(1) # mark the channel is triggered
                 
-        button = ttk.Button(window, text = "Capture", command = CaptureButtonCB) # create a button, when pushed trigger the scope to capture
+        button = ttk.Button(window, text = "Capture", command = self.scheduler.Trigger) # create a button, when pushed trigger the scope to capture
         button.pack() # place the button in the window
-        button.wait_variable(self.triggered) # wait for the button to be pressed
 
         return window
 
-    def RunImpedanceTest(self, channel, filename) -> tuple[bool, float, float, float]:
-        print("Running Impedance Test")
-        return self.backend.ImpedanceTest(channel, filename) # run the test with the filename
+    # Shows what the test worker has posted since the last poll and polls again
+    def Poll(self) -> None:
+
+        for event, data in self.scheduler.Poll():
+            if event == "Started":
+                self.progress["value"] = 0
+
+            elif event == "Channel":
+                self.status.set(f"Testing Channel {data['Channel']}, {data['Index'] + 1} of {data['Count']}")
+
+            elif event == "Waiting":
+                if data and self.capturewindow is None:
+                    self.capturewindow = self.CapturePopup()
+                self.status.set("Press Capture Once the Pulser Fires" if data else f"Capturing in {Scheduler.unprompted_trigger_s}s")
+
+            elif event == "Results":
+                self.progress["value"] = data["Index"] / data["Count"]
+                verdicts = [f"{test} {'Passed' if values[c][0] else 'Failed'}" for test, values in data["Results"].items() for c in values]
+                self.status.set(f"Channel {data['Channel']}: {', '.join(verdicts)}")
+
+            elif event == "Paused":
+                self.status.set("Paused After This Channel")
+
+            elif event == "Resumed":
+                self.status.set("Resuming")
+
+            elif event == "Done":
+                self.status.set(f"{'Aborted' if data['Aborted'] else 'Finished'} After {data['Channels']} Channels in {data['Seconds']:.1f}s")
 
-    def RunPulseEchoTest(self, channel, filename) -> tuple[bool, float]:    
-        if not self.promptcapture.get():
-            time.sleep(5)
+            elif event == "Selected":
+                print(f"Selected Channel Byte: {data['Byte']}")
+                if data["Channel"] == 0:
+                    self.status.set("No Channel Selected")
+                else:
+                    self.status.set(f"Selected Channel {data['Channel']}" if data["Byte"] is not None else f"Could Not Select Channel {data['Channel']}")
+
+            elif event == "Status":
+                self.status.set(data)
+
+            elif event == "Report":
+                self.status.set(f"Saved {os.path.basename(data)}")
+
+            elif event == "Error":
+                self.status.set(f"Error: {data}")
+
+            elif event == "Idle":
+                self.SetRunning(False)
+
+        self.root.after(poll_ms, self.Poll)
+
+    def SetRunning(self, running: bool) -> None: # only pause and abort can be used while the worker has the instruments
+
+        for button in [self.runbutton, self.reportbutton, self.resumebutton, self.retestbutton, self.upbutton, self.downbutton]:
+            button.config(state = "disabled" if running else "normal")
+
+        for button in [self.pausebutton, self.abortbutton]:
+            button.config(state = "normal" if running else "disabled")
+
+        if not running:
+            self.paused = False
+            self.pausebutton.config(text = "Pause")
+
+            if self.capturewindow is not None: # after we are done destroy the capture window if we are using it
+                self.capturewindow.destroy()
+                self.capturewindow = None
+
+    def TogglePause(self) -> None:
+
+        self.paused = not self.paused
+        self.pausebutton.config(text = "Resume" if self.paused else "Pause")
+
+        if self.paused:
+            self.scheduler.Pause()
         else:
-            self.triggered.set(0) # mark the the channel as untriggered
-            while not self.triggered.get(): # wait for the button to be pressed
-                pass
-        print("Running Pulse Echo Test")
-        return self.backend.PulseEchoTest(1, channel, filename) # run the test on scope channel 1 with file name filename
-        
-    def RunDongleTest(self, channel, filename) -> tuple[bool, float]:
-        print("Running Dongle Test")
-        return self.backend.DongleTest(channel, filename) # Run the Dongle test with the Filename as its file name
+            self.scheduler.Resume()
 
     def IncChannel(self) -> None: # increments the channel and displays the change
         if(self.channel < tb.max_channel):
             self.channel += 1
             self.text.set("Channel " + str(self.channel))
-            self.backend.SetChannel(self.channel - 1)
-            print(self.backend.arduino.ReadLine())
+            self.scheduler.SelectChannel(self.channel) # the worker switches the relays so the GUI never waits on the Arduino
 
     def DecChannel(self) -> None: # Decrements the channel and display the change
         if(self.channel > 0):
             self.channel -= 1
             self.text.set("Channel " + str(self.channel))
-            self.backend.SetChannel(self.channel - 1)
-            print(self.backend.arduino.ReadLine())
+            self.scheduler.SelectChannel(self.channel)
             
     def GenerateCSVReport(self) -> None: # Generates a CSV Report with all of the results
 
@@ -176,7 +251,7 @@ class TesterFrontEnd:  # a GUI front end for the test
         with open(filename + 'PEReport.csv', 'w') as pefile:
             pewriter = csv.writer(pefile)
             
-            pewriter.writerow(["Channel", "Passed", "Vpp", "Bandwidth", "Center Frequency"])
+            pewriter.writerow(["Channel", "Passed", "Vpp", "Bandwidth", "Center Frequency", "Vpp CI", "Bandwidth CI", "Center Frequency CI"])
             for channel in channels:
                 print(self.passmap["PulseEcho"][channel - 1])
                 data = self.passmap["PulseEcho"][channel - 1]
@@ -186,7 +261,7 @@ class TesterFrontEnd:  # a GUI front end for the test
         with open(filename + 'ZReport.csv', 'w') as zfile:
             zwriter = csv.writer(zfile)
             
-            zwriter.writerow(["Channel", "Passed", "Capacitance"])
+            zwriter.writerow(["Channel", "Passed", "Capacitance", "Fit Residual"])
             for channel in channels:
                 print(self.passmap["Impedance"][channel - 1])
                 data = self.passmap["Impedance"][channel - 1]
@@ -196,145 +271,18 @@ class TesterFrontEnd:  # a GUI front end for the test
         with open(filename + "DongleReport", 'w') as donglefile:
             donglewriter = csv.writer(donglefile)
             
-            donglewriter.writerow(["Channel", "Passed", "Capacitance"])
+            donglewriter.writerow(["Channel", "Passed", "Capacitance", "Fit Residual"])
             for channel in channels:
                 print(self.passmap["Dongle"][channel - 1])
                 data = self.passmap["Dongle"][channel - 1]
                 data.insert(0, channel)
                 donglewriter.writerow(data)
 
-    def GenerateXLSXReport(self) -> None:
+    def GenerateXLSXReport(self) -> None: # the worker waits for the plots and writes it so the GUI doesn't freeze
 
-        report = openpyxl.Workbook() # create a new excel sheet with multiple pages
-        
-        # load all of the templates into sheets
-        templatepath = os.path.dirname(os.path.abspath(__file__)) + "\\..\\docs\\"
-        donglereporttemplate = openpyxl.load_workbook(filename = templatepath + "DongleTemplate.xlsx")
-        impedancereporttemplate = openpyxl.load_workbook(filename = templatepath + "ImpedanceTemplate.xlsx")
-        pereporttemplate = openpyxl.load_workbook(filename = templatepath + "PETemplate.xlsx")
-        
-        # copy all of the templates into the new excel sheet and name the sheets accordingly
-        donglereport = report.active
-        donglereport.title = "Dongle"
-        copy_sheet(donglereporttemplate.active, donglereport)
-        impedancereport = report.create_sheet("Impedance")
-        copy_sheet(impedancereporttemplate.active, impedancereport)
-        pereport = report.create_sheet("Pulse Echo")
-        copy_sheet(pereporttemplate.active, pereport)
-        
-        red = colors.Color("00FF0000")
-        green = colors.Color("0000FF00")
-        failcolor = fills.PatternFill(patternType = 'solid', fgColor = red)
-        passcolor = fills.PatternFill(patternType = 'solid', fgColor = green)
-        
-        # fill out the sheet with the data from the pulse echo test results
-        for i in range(8, 8 + tb.max_channel):
-            
-            data = self.passmap["PulseEcho"][i - 8] # get the channel test results for PE
-            if None in data:
-                continue
-            
-            pereport["D" + str(i)] = f"{data[1] * 1e3: .2f}" # put the vpp in mV
-            pereport["E" + str(i)] = f"{data[3] * 1e-6: .2f}" # put the bandwidth in MHz
-            pereport["F" + str(i)] = "Pass" if data[0] else "Fail" # if the channel passed put "Pass"
-            pereport["G" + str(i)] = "True" if data[1] == 0 else "" # if the channel is dead say so
-            pereport["H" + str(i)] = f"{data[2] * 1e-6:.2f}" # put the center frequency in MHz
-            
-            color = passcolor if data[0] == True else failcolor # fill the rows with the correct color based on the pass or fail
-            rowcells = pereport.iter_cols(min_col = 3, max_col = 8, min_row = i, max_row = i)
-            for row in rowcells:
-                for cols in row: 
-                    cols.fill = color
-        
-        # fill out the sheet with the impedance test results 
-        for i in range(11, 11 + tb.max_channel):    
+        self.SetRunning(True)
+        self.scheduler.Report(self.passmap, os.getcwd() + '\\' + self.filename.get() + "Report.xlsx") # save the report
 
-            data = self.passmap["Impedance"][i - 11]
-            if None in data:
-                continue
-            
-            impedancereport["D" + str(i)] = f"{data[1] * 1e12: .2f}" # put the capacitance in pF
-            impedancereport["E" + str(i)] = "Pass" if data[0] else "Fail"  # put if the channel passed or failed
-            impedancereport["F" + str(i)] = "Open" if data[1] > 10e-12 and data[1] < 600e-12 else "Short" if data[1] < 0 else "" # Put if the channel is Open or Short based on criteria       
-            
-            color = passcolor if data[0] == True else failcolor # highlight the rows with the correct color based on if they passed or failed
-            rowcells = impedancereport.iter_cols(min_col = 3, max_col = 6, min_row = i, max_row = i)
-            for row in rowcells:
-                for cols in row: 
-                    cols.fill = color
-
-        # fill out the sheet with the dongle test results
-        for i in range(11, 11 + tb.max_channel):    
-            
-            data = self.passmap["Dongle"][i - 11]
-            if None in data:
-                continue
-                
-            donglereport["D" + str(i)] = f"{data[1] * 1e12: .2f}" # put the capacitance in pF
-            donglereport["E" + str(i)] = "Pass" if data[0] else "Fail" # mark if the channel passed or failed
-            donglereport["F" + str(i)] = "Open" if data[1] > 10e-12 and data[1] < 180e-12 else "Short" if data[1] < 0 else "" # mark if the channel is open or short based on criteria
-            
-            color = passcolor if data[0] == True else failcolor # color the rows according to passing or failing
-            rowcells = donglereport.iter_cols(min_col = 3, max_col = 6, min_row = i, max_row = i)
-            for row in rowcells:
-                for cols in row: 
-                    cols.fill = color
-                
-        filename = os.getcwd() + '\\' + self.filename.get() + "Report.xlsx" # save the report
-        report.save(filename)
-
-
-# Straight from SO on copying whole sheets
-def copy_sheet(source_sheet, target_sheet):
-    copy_cells(source_sheet, target_sheet)  # copy all the cel values and styles
-    copy_sheet_attributes(source_sheet, target_sheet)
-
-def copy_sheet_attributes(source_sheet, target_sheet):
-    target_sheet.sheet_format = copy(source_sheet.sheet_format)
-    target_sheet.sheet_properties = copy(source_sheet.sheet_properties)
-    target_sheet.merged_cells = copy(source_sheet.merged_cells)
-    target_sheet.page_margins = copy(source_sheet.page_margins)
-    target_sheet.freeze_panes = copy(source_sheet.freeze_panes)
-
-    # set row dimensions
-    # So you cannot copy the row_dimensions attribute. Does not work (because of meta data in the attribute I think). So we copy every row's row_dimensions. That seems to work.
-    for rn in range(len(source_sheet.row_dimensions)):
-        target_sheet.row_dimensions[rn] = copy(source_sheet.row_dimensions[rn])
-
-    if source_sheet.sheet_format.defaultColWidth is None:
-        print('Unable to copy default column wide')
-    else:
-        target_sheet.sheet_format.defaultColWidth = copy(source_sheet.sheet_format.defaultColWidth)
-
-    # set specific column width and hidden property
-    # we cannot copy the entire column_dimensions attribute so we copy selected attributes
-    for key, value in source_sheet.column_dimensions.items():
-        target_sheet.column_dimensions[key].min = copy(source_sheet.column_dimensions[key].min)   # Excel actually groups multiple columns under 1 key. Use the min max attribute to also group the columns in the targetSheet
-        target_sheet.column_dimensions[key].max = copy(source_sheet.column_dimensions[key].max)  # https://stackoverflow.com/questions/36417278/openpyxl-can-not-read-consecutive-hidden-columns discussed the issue. Note that this is also the case for the width, not onl;y the hidden property
-        target_sheet.column_dimensions[key].width = copy(source_sheet.column_dimensions[key].width) # set width for every column
-        target_sheet.column_dimensions[key].hidden = copy(source_sheet.column_dimensions[key].hidden)
-
-def copy_cells(source_sheet, target_sheet):
-    for (row, col), source_cell in source_sheet._cells.items():
-        target_cell = target_sheet.cell(column=col, row=row)
-
-        target_cell._value = source_cell._value
-        target_cell.data_type = source_cell.data_type
-
-        if source_cell.has_style:
-            target_cell.font = copy(source_cell.font)
-            target_cell.border = copy(source_cell.border)
-            target_cell.fill = copy(source_cell.fill)
-            target_cell.number_format = copy(source_cell.number_format)
-            target_cell.protection = copy(source_cell.protection)
-            target_cell.alignment = copy(source_cell.alignment)
-
-        if source_cell.hyperlink:
-            target_cell._hyperlink = copy(source_cell.hyperlink)
-
-        if source_cell.comment:
-            target_cell.comment = copy(source_cell.comment)
-            
 
 # the default script starts here
 
@@ -343,7 +291,11 @@ if __name__ == "__main__":
     import atexit
     atexit.register(input, "Press Any Key To Continue")
 
+    if "-simulate" in sys.argv: # run on simulated instruments, no bench needed
+        tb.simulate_instruments = True
+
     gui = TesterFrontEnd()
+    print(f"Started in {time.perf_counter() - startup:.2f}s")
     gui.Draw()
 
     
@@ -0,0 +1,69 @@
+import numpy as np # for Various Data and Numerical Operations
+# scipy is imported where it is first used, scipy.signal alone takes most of a second to import and startup shouldn't wait on it
+
+# Computes amplitude spectra of one waveform or a stack of them, reusing windows, axes and transforms between calls
+class SpectrumAnalyzer:
+    def __init__(self, taper: str = "boxcar", pad: bool = True):
+        self.taper = taper # the window function applied before the transform, any name scipy.signal.get_window knows
+        self.pad = pad # if we zero pad to the next length scipy's fft is fast at
+        self.tapers = {} # (taper, length) -> window
+        self.axes = {} # (length, sample period) -> frequency axis
+        self.zooms = {} # (length, start, stop, points, sample rate) -> chirp-z transform
+
+    def SetTaper(self, taper: str = "boxcar") -> None:
+        self.taper = taper
+
+    def SetPadding(self, pad: bool = True) -> None:
+        self.pad = pad
+
+    # The taper for a waveform length, built once per length
+    def Taper(self, n: int) -> np.ndarray:
+
+        key = (self.taper, n)
+        if key not in self.tapers:
+            from scipy.signal import get_window # tapers
+            self.tapers[key] = get_window(self.taper, n, fftbins=False)
+
+        return self.tapers[key]
+
+    # Tapers the waveforms along their last axis, the boxcar taper is left out since it changes nothing
+    def Apply(self, voltage: np.ndarray) -> np.ndarray:
+
+        if self.taper == "boxcar":
+            return voltage
+
+        return voltage * self.Taper(voltage.shape[-1])
+
+    # The amplitude spectrum of every waveform along the last axis in one batched transform
+    def FFT(self, voltage: np.ndarray, dt: float) -> dict[str, np.ndarray]:
+
+        from scipy.fft import rfft, rfftfreq, next_fast_len # ffts
+
+        voltage = np.asarray(voltage)
+        n = voltage.shape[-1]
+        nfft = next_fast_len(n, real=True) if self.pad else n # pad out to a length with small prime factors
+
+        key = (nfft, dt)
+        if key not in self.axes:
+            self.axes[key] = rfftfreq(nfft, dt) # scale the axis to the sampling period
+
+        amp = np.abs(rfft(self.Apply(voltage), n=nfft, axis=-1, workers=-1)) # run the fft on every waveform get the magnitude of the amplitude
+
+        return {"Frequency": self.axes[key], "Amplitude": amp}
+
+    # The amplitude spectrum of only the band from start to start + width with points frequencies, using a zoom fft
+    # the spacing is width / points no matter how short the waveform is
+    def BandFFT(self, voltage: np.ndarray, dt: float, start: float, width: float, points: int) -> dict[str, np.ndarray]:
+
+        voltage = np.asarray(voltage)
+        n = voltage.shape[-1]
+
+        key = (n, start, start + width, points, 1 / dt)
+        if key not in self.zooms:
+            from scipy.signal import ZoomFFT # chirp-z band transforms
+            self.zooms[key] = ZoomFFT(n, [start, start + width], points, fs=1 / dt, endpoint=False)
+
+        amp = np.abs(self.zooms[key](self.Apply(voltage), axis=-1))
+        frequency = start + np.arange(points) * (width / points)
+
+        return {"Frequency": frequency, "Amplitude": amp}
@@ -1,10 +1,19 @@
 import Arduino
 import Oscilloscope
+import Analysis
 import os
 import numpy as np
 import VNA
 import math
-import matplotlib.pyplot as plt
+import time
+import collections
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+import Spectrum
+import Plotter
+import Archive
+import Simulator
+import Profiler
 
 # user edittable pass fail criterion
 # the number of channels we are testing
@@ -24,6 +33,17 @@ channel_lower_thresh = 700e-12
 # frequency to test the impedance at
 channel_freq = 800e3
 
+# how the capacitance is measured: "point" reads it at the test frequency, "fit" fits a series RC model over a band around it
+capacitance_mode = "point"
+# point mode: the VNA time per point of the single point sweep
+capacitance_point_timeperpoint = 10
+# fit mode: the width of the band around the test frequency as a fraction of the test frequency
+capacitance_fit_span = .2
+# fit mode: the number of points to sweep across the band
+capacitance_fit_points = 21
+# fit mode: the VNA time per point, the fit averages the noise over all of the points so this can be lower than a single point
+capacitance_fit_timeperpoint = 2
+
 # pulse echo when to start the waveform capture
 scope_window_start_us = 49.6
 # pulse echo how wide of a window to examine
@@ -33,6 +53,10 @@ scope_window_width_us = .9
 fft_window_start = 2e6
 # pulse echo fft the window of the fft we want to look at
 fft_window_width = 8e6
+# pulse echo fft the taper applied to the waveform first, any scipy window name e.g. "hann", "boxcar" for none
+fft_taper = "boxcar"
+# pulse echo fft the number of frequencies to compute across the window with a zoom fft, 0 computes the whole fft and windows it
+fft_zoom_points = 0
 
 # pulse echo vpp lower threshold, must be higher than this
 vpp_lower_thresh = 50.0e-3
@@ -51,182 +75,714 @@ peak_freq_upper_thresh = 8e6
 
 scope_sample_interval_ns = 1 # sampling period of oscilloscope
 
+# the scope inputs the fixture routes elements to, element channel + i goes to input pulse_echo_scope_channels[i]
+# with more than one input several elements are tested from each trigger
+pulse_echo_scope_channels = [1]
+
+# the number of acquisitions to average for the pulse echo test, 1 uses a single shot
+pulse_echo_averages = 1
+# where to average: "host" keeps running statistics so the metrics get confidence intervals, "scope" averages on the scope
+pulse_echo_average_mode = "host"
+# the z score of the confidence intervals of the pulse echo metrics, 1.96 for 95%
+confidence_z = 1.96
+
+# the float type the scope's voltages are scaled to, "float32" halves the memory of long records and of averaging them
+scope_voltage_type = "float64"
+# how to find out a scope acquisition finished: "opc" waits on *OPC?, "srq" waits on a service request, "poll" asks if it is busy
+scope_completion_mode = "opc"
+
+# how to save the pulse echo plots: "background" draws them on worker threads, "sync" draws them before the test returns
+# "defer" holds them until the report is generated, "skip" doesn't save them
+plot_mode = "background"
+
+# if every run writes a Chrome trace of its stages, open it in chrome://tracing or ui.perfetto.dev
+trace_runs = True
+
+# how the firmware's relay settle delays are chosen: "fixed" uses relay_settle_s, "measure" times every relay bank when the tester starts
+relay_settle_mode = "fixed"
+# the settle delay of every relay bank and, last, of a switch of the mux alone in seconds
+relay_settle_s = [.005, .005, .005, .005, 50e-6]
+# measure mode: how many switches to time for every bank and how much longer than the slowest one the delay is
+relay_settle_measurements = 5
+relay_settle_margin = 1.5
+# measure mode: the shortest settle time a measurement is believed, per relay bank and the mux, a faster one means the sense line
+# didn't see the switch, e.g. it isn't wired, and the fixed relay_settle_s delay is used instead
+relay_settle_floor_s = [.0005, .0005, .0005, .0005, 5e-6]
+
+# how a run of every channel selects them: "host" sends every channel in its own command
+# "firmware" loads the run into the Arduino first and steps it with a single byte per channel
+# "trigger" has the trigger pin step a single shot pulse echo run after every capture, wire the scope's trigger out to it, other runs step like firmware
+sequence_mode = "firmware"
+# trigger mode: how long after the trigger edge the firmware steps, longer than a record so the capture isn't cut off
+sequence_trigger_delay_s = .001
+
+# run on the simulated instruments in Simulator.py instead of the bench
+simulate_instruments = False
+
+# if every raw capture of a run is saved to an archive that can be replayed and re-scored later
+archive_captures = True
+
+# if a run measures the next channel while the pulse echo of the last one is analyzed and plotted on the analysis thread
+pipeline_channels = True
+# how many channels can be waiting on their analysis before measuring waits for the oldest one
+pipeline_depth = 2
+
+# how long to wait for a VNA sweep before giving up on it and failing the channel, in seconds
+vna_sweep_timeout_s = 60
+
 # do not edit past here #
 
 vnachanneloffset = 1 << 7
 scopechanneloffset = 1 << 6
 
 class CatheterTester:
-    def __init__(self):
-        self.arduino = Arduino.Arduino() # we have an arduino 
-        self.scope = Oscilloscope.Oscilloscope() # an oscilloscope
-        self.vna = VNA.VNA() # and a VNA
+    def __init__(self, arduino = None, scope = None, vna = None): # the instruments can be passed in to replay or simulate them
+        if simulate_instruments and arduino is None and scope is None and vna is None:
+            arduino, scope, vna = Simulator.SimulatedInstruments()
+
+        self.startuptimes = {} # how long connecting to every instrument took in seconds
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers = 2, thread_name_prefix = "Connect") as connect: # the searches wait on the ports and the bus, not each other
+            arduino = connect.submit(self.Connect, "Arduino", Arduino.Arduino, arduino)
+            scope = connect.submit(self.Connect, "Scope", Oscilloscope.Oscilloscope, scope)
+
+        self.arduino = arduino.result() # we have an arduino 
+        self.scope = scope.result() # an oscilloscope
+        self.scope.SetVoltageType(np.dtype(scope_voltage_type).type)
+        self.scope.SetCompletionMode(scope_completion_mode)
+        self.vna = self.Connect("VNA", VNA.VNA, vna) # and a VNA
+        self.plotter = Plotter.PlotWorker(plot_mode) # draws the plots off of the test thread
+        self.analysis = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "Analysis") # one thread keeps the analysis in channel order
+        self.analysisspectrum = Spectrum.SpectrumAnalyzer() # the analysis thread's own fft engine, the scope's is used by the captures
+        self.pipelinestats = {} # how much analysis the last RunChannels did and how much of it overlapped measuring
+        self.steptimes = {"PulseEcho": [], "Sweep": []} # how long every capture and sweep took in seconds, the planner's costs
+        self.archive = None # where the raw captures of the run are saved
+        self.tracefile = None # where the trace of the run is written
         self.channel = -1 # start with no channel being connected 
+        self.sequence = [] # the 1 indexed channels of the run loaded into the firmware, empty selects every channel from here
+        self.sequenceindex = -1 # the index of the live channel of the sequence
+        self.sequencetrigger = False # if the trigger pin steps the sequence instead of us
 
         if not self.arduino.IsConnected():  # if could not connect to the arduino
             print("Could Not Connect To the Arduino, Exiting")
             input("Press Any Key To Exit")
             exit() # leave the program
+
+        try:
+            self.relaysettle = self.ConfigureRelaySettle() # the settle delay of every relay bank and the mux in seconds
+        except TimeoutError: # firmware from before the framed protocol never acknowledges anything
+            print("The Arduino Did Not Acknowledge a Command, Its Firmware Is Out of Date, Flash src/main/main.ino To It With the Arduino IDE")
+            input("Press Any Key To Exit")
+            exit()
+        print(f"Connected to the Instruments in {time.perf_counter() - start:.2f}s: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.startuptimes.items()))
+
+    # Connects to an instrument unless one was passed in and times how long it took
+    def Connect(self, name: str, create, instrument = None):
+        start = time.perf_counter()
+        instrument = create() if instrument is None else instrument
+        self.startuptimes[name] = time.perf_counter() - start
+        return instrument
             
-    def DongleTest(self, channel, filename: str = None) -> list[bool, float]:
+    # Starts saving every raw capture of a run next to its results
+    def StartArchive(self, filename: str) -> None:
+        self.StopArchive()
+        if archive_captures:
+            self.archive = Archive.ArchiveWriter(filename + "Archive")
+
+    def StopArchive(self) -> None:
+        if self.archive is not None:
+            self.archive.Close()
+            self.archive = None
+
+    # Starts tracing every stage of a run, the trace is written next to the results when it stops
+    def StartTrace(self, filename: str) -> None:
+        if trace_runs:
+            self.tracefile = filename + "Trace.json"
+            Profiler.profiler.StartTrace()
+
+    def StopTrace(self) -> None:
+        if self.tracefile is not None:
+            Profiler.profiler.StopTrace(self.tracefile)
+            self.tracefile = None
+
+    # Saves the raw samples of the last scope transfer
+    def ArchiveCapture(self, scopechannels: list[int], channels: list[int], averages: int = 1, mode: str = "single") -> None:
+        if self.archive is not None:
+            self.archive.AppendScope(channels, scopechannels, self.scope.samples, self.scope.capturepreambles, self.scope.sampleaxis, averages, mode)
+
+    # Saves the data of a sweep once it comes in and passes it on
+    def ArchiveSweep(self, channel: int, tests: list[str], data: dict[str, dict]) -> dict[str, dict]:
+        if self.archive is not None:
+            self.archive.AppendVNA(channel, tests, data)
+        return data
+
+    # Loads the 1 indexed channels a run will go through into the firmware, after this RunChannel steps to them instead of sending each one
+    # in trigger mode only the channels that capture are loaded and the trigger pin steps them, standing in for the operator
+    def StartSequence(self, channels: list[int], tests: list[str]) -> None:
+
+        self.StopSequence()
+        if sequence_mode == "host":
+            return
+
+        trigger = sequence_mode == "trigger" and tests == ["PulseEcho"] and pulse_echo_averages == 1 # every shot of an average would step it
+        if trigger:
+            group = len(pulse_echo_scope_channels)
+            channels = [channel for channel in channels if (channel - 1) % group == 0]
+
+        channels = [channel for i, channel in enumerate(channels) if i == 0 or channels[i - 1] != channel] # a plan can stay on a channel for its next step
+
+        if trigger: # a free running scope pulses its trigger out on every shot and would run the sequence ahead of the captures
+            self.scope.HoldBetweenCaptures(True)
+
+        try:
+            self.arduino.LoadSequence([RelayChannel(channel - 1) for channel in channels]) # remapped like SetChannel
+            self.arduino.SetTrigger(trigger, sequence_trigger_delay_s)
+            with Profiler.Stage("Relay Switch"):
+                live = self.arduino.StartSequence()
+        except (TimeoutError, RuntimeError, ValueError) as e: # the host selects every channel instead
+            print(f"Could Not Load the Channel Sequence: {e}")
+            live = None
+
+        if live is None and trigger:
+            self.scope.HoldBetweenCaptures(False)
+
+        if live is not None:
+            self.sequence = list(channels)
+            self.sequenceindex = live[0]
+            self.sequencetrigger = trigger
+
+    def StopSequence(self) -> None:
+        if len(self.sequence) != 0:
+            try:
+                self.arduino.StopSequence()
+            except (TimeoutError, RuntimeError) as e:
+                print(f"Could Not Stop the Channel Sequence: {e}")
+
+        if self.sequencetrigger:
+            self.scope.HoldBetweenCaptures(False)
+
+        self.sequence = []
+        self.sequenceindex = -1
+        self.sequencetrigger = False
+
+    # Selects a 1 indexed channel for a run, stepping the loaded sequence up to it if it is in there
+    # a plan can go through a channel more than once, the next time it comes up from the live channel on is the one stepped to
+    def SelectChannel(self, channel: int) -> None:
+
+        index = next((i for i in range(max(self.sequenceindex, 0), len(self.sequence)) if self.sequence[i] == channel), None)
+        if index is None:
+            if not self.sequencetrigger: # a trigger run only goes through the channels that capture
+                self.SetChannel(channel - 1)
+            return
+
+        with Profiler.Stage("Relay Switch"):
+            try:
+                while self.sequenceindex < index: # the firmware says which channel is live after every step
+                    live = self.arduino.WaitForLive() if self.sequencetrigger else self.arduino.NextChannel()
+                    if live is None:
+                        break
+
+                    expected = self.sequenceindex + 1 # every step goes one channel on, anything else means we lost count of the steps
+                    if live[0] != expected or live[1] != RelayChannel(self.sequence[expected] - 1):
+                        print(f"Sequence Stepped to Index {live[0]} Channel Byte {live[1]} Instead of Index {expected}")
+                        break
+                    self.sequenceindex = expected
+
+                if self.sequencetrigger and self.sequenceindex == index and self.arduino.PendingReports() != 0: # stepped again before we captured
+                    print(f"Sequence Ran Ahead of the Captures at Channel {channel}")
+                    self.sequenceindex = -1
+            except (TimeoutError, RuntimeError) as e:
+                print(f"Sequence Did Not Step to Channel {channel}: {e}")
+
+        if self.sequenceindex != index: # lost track of the sequence, select the rest of the run from here
+            self.StopSequence()
+            self.SetChannel(channel - 1)
+
+    # Runs the tests on a channel, 1 indexed, the way a run of the tester does and gives back {test: {channel: result}}
+    # pulse echo also tests the elements routed to the other scope inputs, unless single only the first channel of each group captures
+    # trigger is called before the pulse echo capture so the operator can fire the pulser, unless the trigger pin steps the sequence
+    def RunChannel(self, channel: int, filename: str, tests: list[str], trigger = None, single: bool = True) -> dict[str, dict[int, list]]:
+        return self.StartChannel(channel, filename, tests, trigger, single).result()
+
+    # Measures a channel like RunChannel and gives back a future of its results once everything that needs the channel selected is done
+    # in pipeline mode the pulse echo is analyzed and plotted on the analysis thread, next to the VNA sweep and the channels after it
+    def StartChannel(self, channel: int, filename: str, tests: list[str], trigger = None, single: bool = True) -> Future:
+
+        with Profiler.Stage("Channel", {"Channel": channel}):
+            self.SelectChannel(channel)
+            results = {}
+            analysis = None # the future of the pulse echo results
+
+            if "PulseEcho" in tests:
+                group = len(pulse_echo_scope_channels) # with several scope inputs one trigger tests the next few elements too
+                if single or (channel - 1) % group == 0:
+                    channels = [c for c in range(channel, channel + group) if c <= max_channel]
+                    if trigger is not None and not self.sequencetrigger:
+                        trigger()
+                    print("Running Pulse Echo Test")
+                    analysis = self.StartPulseEchoTestGroup(pulse_echo_scope_channels[:len(channels)], channels, filename)
+                    results["PulseEcho"] = None # keeps the order of the tests in the results
+
+            vnatests = [test for test in tests if test != "PulseEcho"] # the backend runs tests that need the same sweep off of one measurement
+            if len(vnatests) != 0:
+                print(f"Running {' and '.join(vnatests)} Test")
+                for test, result in self.RunVNATests(channel, filename, vnatests).items():
+                    results[test] = {channel: result}
+
+        if analysis is None:
+            return CompletedFuture(results)
+
+        def Combine(pulseecho: dict[int, list]) -> dict[str, dict[int, list]]:
+            results["PulseEcho"] = pulseecho
+            return results
+
+        return ChainFuture(analysis, Combine)
+
+    # Runs the channels in order and yields (channel, results) in the same order, so the passmap comes out the same in any mode
+    # in pipeline mode up to pipeline_depth channels are analyzed while the next one is measured, proceed is asked before every channel
+    # and returning False stops the run, the channels that were measured are still given back, as they are before a channel's error is raised
+    def RunChannels(self, channels: list[int], filename: str, tests: list[str], trigger = None, single: bool = False, proceed = None):
+        return self.RunSteps([(channel, tests) for channel in channels], filename, trigger, single, proceed)
+
+    # Runs the steps of a plan, (channel, tests), in order like RunChannels, yielding (channel, results) for every step
+    def RunSteps(self, steps: list[tuple[int, list[str]]], filename: str, trigger = None, single: bool = False, proceed = None):
+
+        start = time.perf_counter()
+        self.pipelinestats = {"Analysis": 0.0, "Waiting": 0.0}
+        pending = collections.deque() # (channel, future) in step order
+
+        try:
+            for channel, tests in steps:
+                if proceed is not None and not proceed(channel):
+                    break
+
+                pending.append((channel, self.StartChannel(channel, filename, tests, trigger, single)))
+
+                while len(pending) > pipeline_depth or (len(pending) != 0 and pending[0][1].done()):
+                    yield self.NextResult(pending)
+
+        except Exception: # e.g. an abort at the capture prompt, the channels already measured still get to the caller first
+            while len(pending) != 0:
+                yield self.NextResult(pending)
+            raise
+
+        while len(pending) != 0:
+            yield self.NextResult(pending)
+
+        self.ReportOverlap(time.perf_counter() - start)
+
+    def NextResult(self, pending: collections.deque) -> tuple[int, dict[str, dict[int, list]]]: # waits for the oldest channel
+
+        channel, future = pending.popleft()
+
+        start = time.perf_counter()
+        with Profiler.Stage("Analysis Wait", {"Channel": channel}):
+            results = future.result()
+        self.pipelinestats["Waiting"] += time.perf_counter() - start
+
+        return channel, results
+
+    # Prints how much of the analysis ran while the next channels were measured instead of holding them up
+    def ReportOverlap(self, seconds: float) -> dict[str, float]:
+
+        stats = self.pipelinestats
+        stats["Run"] = seconds
+        stats["Overlapped"] = max(stats["Analysis"] - stats["Waiting"], 0.0) # whatever measuring didn't wait for ran next to it
+
+        if stats["Analysis"] > 0:
+            print(f"Pipeline: {stats['Analysis']:.2f}s of Analysis, {stats['Overlapped']:.2f}s ({100 * stats['Overlapped'] / stats['Analysis']:.0f}%) of it Overlapped Measuring, "
+                  f"{100 * stats['Overlapped'] / seconds:.0f}% of the {seconds:.2f}s Run")
+
+        return stats
+
+    def DongleTest(self, channel, filename: str = None) -> list[bool, float, float]:
         
         if self.vna is None:  # if we didnt initialze the VNA we can't run the test
             return False
-        
-        self.vna.SetStartFreq(dongle_freq) # we only want to test one frequency
-        self.vna.SetStopFreq(dongle_freq)
-        self.vna.SetNumPoints(1)
-        self.vna.SetSweepParameters(["s11"]) # we want to test for impedance, which is calculated from S11
-  
-        self.vna.SetFileName(filename + str(channel + 1) + "dongle") # set the filename to what was provided as well as the channel and dongle indicator 
-            
-        self.vna.Sweep() # run the sweep 
-  
-        data = VNA.GrabS1PData(filename + str(channel + 1) + "dongles11.s1p") # pull the data from the s1p file, write it to CSV
-
-        print(data)
 
-        i = data["Frequency"].index(dongle_freq) # find the index from the data with the test frequency
+        return self.RunVNATests(channel, filename, ["Dongle"])["Dongle"]
 
-        if i is not None:
-            c = -1 / (2 * math.pi * data["Z"][i].imag * dongle_freq) # if there is an entry with the test frequency calculate the capacitance
-            print(f"Capacitance: {c * 1e12: .2f}pF")
-            if c < dongle_upper_thresh and c > dongle_lower_thresh: # 1 / wC = im(Z)  # if we are within the thresholds then we are good
-                return [True, c] # Passed the test
-                
-            return [False, c] # Failed the Test
-
-        return [False, 0]
+    # Starts the dongle sweep in the background and gives back a future of the test result
+    def StartDongleTest(self, channel, filename: str = None) -> Future:
+        return self.StartVNATests(channel, filename, ["Dongle"])["Dongle"]
         
-    def ImpedanceTest(self, channel = 1, filename: str = None) -> list[bool, float]:
+    def ImpedanceTest(self, channel = 1, filename: str = None) -> list[bool, float, float]:
 
         if self.vna is None:
             return False # if the VNA wasn't initialized we can't pass the test
-        
-        self.vna.SetFileName(filename + str(channel)) # set the filename to "{filename} {channel} s11.s1p"
-        
-        self.vna.SetStartFreq(channel_freq) # we only want to test one frequency
-        self.vna.SetStopFreq(channel_freq)
-        self.vna.SetNumPoints(1)
-        self.vna.SetSweepParameters(["s11"]) # we are looking for impedance
-        
-        self.vna.Sweep() # sweep and save the values to an s1p file
-        
-        data = VNA.GrabS1PData(filename + str(channel) + "s11.s1p") # convert the generated csv file and pull the data
 
-        print(data)
+        return self.RunVNATests(channel, filename, ["Impedance"])["Impedance"]
 
-        i = data["Frequency"].index(channel_freq) # if we find the frequency we wanted in the data set
+    # Starts the impedance sweep in the background and gives back a future of the test result
+    def StartImpedanceTest(self, channel = 1, filename: str = None) -> Future:
+        return self.StartVNATests(channel, filename, ["Impedance"])["Impedance"]
 
-        if i is not None:
-            c = -1 / (2 * math.pi * data["Z"][i].imag * channel_freq) # if there is an entry with the test frequency calculate the capacitance
-            print(f"Capacitance: {c * 1e12: .2f} pF")
-            if c < channel_upper_thresh and c > channel_lower_thresh: # 1 / wC = im(Z)  # if we are within the thresholds then we are good
-                return [True, c] # Passed the test
-                
-        return [False, c] # if we didnt pass we failed
-        
+    # Runs the VNA tests on a channel and waits for the results, tests that need the same sweep share one
+    def RunVNATests(self, channel, filename: str, tests: list[str]) -> dict[str, list[bool, float, float]]:
+
+        start = time.perf_counter()
+        results = {}
+        for test, future in self.StartVNATests(channel, filename, tests).items():
+            try:
+                with Profiler.Stage("Sweep Wait", {"Channel": channel, "Test": test}):
+                    results[test] = future.result() # wait for the sweep and the verdict
+            except (TimeoutError, RuntimeError, OSError, ValueError, KeyError) as e: # a hung or missing VNA, or a sweep file it cut off, fails the channel instead of stopping the run
+                print(f"{test} Test Failed to Sweep: {e}")
+                results[test] = [False, 0, math.nan]
+
+        sweeps = len(PlanVNAMeasurements(tests))
+        if sweeps != 0:
+            self.steptimes["Sweep"].append((time.perf_counter() - start) / sweeps) # setting the sweep up included
+
+        return results
+
+    # Starts one sweep for every distinct sweep the tests need and gives back a future of every test result
+    def StartVNATests(self, channel, filename: str, tests: list[str]) -> dict[str, Future]:
+
+        futures = {}
+
+        for sweep, group in PlanVNAMeasurements(tests):
+            start, stop, points, params, timeperpoint = sweep
+
+            self.vna.SetStartFreq(start)
+            self.vna.SetStopFreq(stop)
+            self.vna.SetNumPoints(points)
+            self.vna.SetSweepParameters(list(params))
+            self.vna.SetTimePerPoint(timeperpoint) # every sweep sets its own so it doesn't inherit the last one's
+            self.vna.SetFileName(VNATestFileName(group[0], channel, filename)) # the sweep is saved under the first test that needs it
+
+            if len(group) > 1:
+                print(f"Running {', '.join(group)} Tests From One Sweep")
+
+            acquisition = SharedFuture(ChainFuture(self.vna.SweepAsync(vna_sweep_timeout_s), lambda data, group = group: self.ArchiveSweep(channel, group, data))) # one sweep for the whole group
+
+            for test in group: # every test in the group gets its verdict from the same data
+                config = VNATestConfig(test)
+                futures[test] = acquisition.Chain(lambda data, config = config: EvaluateCapacitance(data["s11"], config["Frequency"], config["Lower"], config["Upper"]))
+
+        return futures
         
     def PulseEchoTest(self, scopechannel: int = 1, channel = 1, filename: str = "cath.csv") -> list[bool, float, float, float]:
         
         if not self.scope.IsConnected(): # if we aren't connected to the scope then we automatically fail
             return False, None, None, None
-        
-        self.scope.CaptureWaveform(scopechannel) # capture the waveform from the screen
-        self.scope.WindowWaveform(scope_window_start_us, scope_window_width_us)
-        data = self.scope.GetWaveform()
 
-        minimum = min(data["Voltage"]) # find the minimum voltage of the waveform
-        maximum = max(data["Voltage"]) # find the maximum voltage of the waveform
-        
-        vpp = maximum - minimum # get the peak to peak maximum 
+        return self.PulseEchoTestGroup([scopechannel], [channel], filename)[0]
 
-        self.scope.CalculateFFT() # calculate the fft of the waveform      
-        self.scope.WindowFFT(fft_window_start, fft_window_width)
-        fft = self.scope.GetFFT()
+    # Runs the pulse echo test on several elements from one trigger, the element channels[i] is routed to scope input scopechannels[i]
+    def PulseEchoTestGroup(self, scopechannels: list[int], channels: list[int], filename: str = "cath.csv") -> list[list[bool, float, float, float, float, float, float]]:
 
-        
-        #self.scope.WriteDataToCSVFile(filename + str(self.channel + 1)) # Save all of the Data to a CSV File
+        if not self.scope.IsConnected(): # if we aren't connected to the scope then we automatically fail
+            return [[False, None, None, None, None, None, None] for _ in channels]
 
-        # plot the waveform and fft and save it
-        plt.plot(data["Time"], data["Voltage"])
-        plt.xlabel("Time")
-        plt.ylabel("Voltage")
-        plt.savefig(filename + "wave" + str(channel) + ".png")
-        plt.close()
-
-        plt.plot(fft["Frequency"], fft["Amplitude"])
-        plt.xlabel("Frequency")
-        plt.ylabel("Amplitude")
-        plt.savefig(filename + "fft" + str(channel) + ".png")
-        plt.close()
-
-        # Get the FFT
-        fft = self.scope.GetFFT()
-        maxamp = fft["Amplitude"].max() # find the maximum amplitude over the spectrum
-        maxindex = np.where(fft['Amplitude'] == maxamp)[0][0] # find where the maximum amplitude is at
-
-        thresh = .707 * maxamp # -3db cutoff
-        
-        left = maxindex # start the bandedges at the center frequency
-        right = maxindex 
+        data, shots = self.MeasurePulseEcho(scopechannels, channels)
+        return self.AnalyzePulseEcho(data, shots, channels, filename)
 
-        while fft["Amplitude"][left] > thresh: # we go until we hit -3db going left
-            if left <= 0:
-                break
-            left -= 1
+    # Captures the group like PulseEchoTestGroup and gives back a future of {channel: result}, analyzed on the analysis thread in pipeline mode
+    def StartPulseEchoTestGroup(self, scopechannels: list[int], channels: list[int], filename: str) -> Future:
 
-        while fft["Amplitude"][right] > thresh: # we go until we hit -3db going right
-            if right >= len(fft["Amplitude"]) - 1:
-                break 
-            right += 1
+        if not self.scope.IsConnected():
+            return CompletedFuture(dict(zip(channels, self.PulseEchoTestGroup(scopechannels, channels, filename))))
 
-        # left edge is on the lower band edge and right is on the upper band edge
+        start = time.perf_counter()
+        data, shots = self.MeasurePulseEcho(scopechannels, channels) # the captured waveforms aren't touched by the next capture
+        self.steptimes["PulseEcho"].append(time.perf_counter() - start)
 
-        bandwidth = fft["Frequency"][right] - fft["Frequency"][left] # bandwidth is the distance between the upper and lower bandedges
-        peak = fft["Frequency"][maxindex] # the center frequency is where the maximum is
+        def Analyze() -> dict[int, list]:
+            start = time.perf_counter()
+            results = dict(zip(channels, self.AnalyzePulseEcho(data, shots, channels, filename, self.analysisspectrum)))
+            self.pipelinestats["Analysis"] = self.pipelinestats.get("Analysis", 0.0) + time.perf_counter() - start
+            return results
 
-        print(f"Vpp: {vpp} Bandwidth: {bandwidth} Peak Frequency: {peak}")        # debug message
-        
-        # check all of the thresholds and return if it passed and the tested values
+        if pipeline_channels:
+            return self.analysis.submit(Analyze)
 
-        # if vpp < .04 we have a dead element and thus return failure, the rest of the values dont matter
-        if vpp <= .04:
-            return [False, 0, 0, 0]
+        start = time.perf_counter()
+        results = Analyze()
+        self.pipelinestats["Waiting"] = self.pipelinestats.get("Waiting", 0.0) + time.perf_counter() - start # measuring waited on all of it
+        return CompletedFuture(results)
 
-        if vpp < vpp_lower_thresh or vpp > vpp_upper_thresh:
-            return [False, vpp, bandwidth, peak]
+    # Captures the waveforms of the group from one trigger, gives back the waveforms and the running statistics of the metrics of every shot
+    # the statistics only have shots when averaging on the host, the metrics reported are then their mean so the intervals describe them
+    def MeasurePulseEcho(self, scopechannels: list[int], channels: list[int]) -> tuple[dict[str, np.ndarray], Oscilloscope.RunningStats]:
 
-        if bandwidth < bandwidth_lower_thresh or bandwidth > bandwidth_upper_thresh:
-            return [False, vpp, bandwidth, peak]
+        shots = Oscilloscope.RunningStats((len(channels), 3)) # the spread of vpp, bandwidth and peak frequency from shot to shot
 
-        if peak < peak_freq_lower_thresh or peak > peak_freq_upper_thresh:
-            return [False, vpp, bandwidth, peak]
-        
-        return [True, vpp, bandwidth, peak]
+        def ScoreShot(shot: dict[str, np.ndarray]) -> None:
+            self.ArchiveCapture(scopechannels, channels, pulse_echo_averages, "host")
+            fft = self.PulseEchoSpectrum() # the spectrum of this shot
+            metrics = Analysis.PulseEchoMetrics(shot["Voltage"], fft["Frequency"], fft["Amplitude"]) # every element in one call
+            shots.Update(np.column_stack([metrics["Vpp"], metrics["Bandwidth"], metrics["Peak"]]))
+
+        if pulse_echo_averages > 1: # average out the noise over several acquisitions
+            self.scope.CaptureAveraged(scopechannels, pulse_echo_averages, scope_window_start_us, scope_window_width_us, pulse_echo_average_mode, ScoreShot)
+            if pulse_echo_average_mode == "scope":
+                self.ArchiveCapture(scopechannels, channels, pulse_echo_averages, "scope")
+        else:
+            self.scope.CaptureWaveforms(scopechannels, scope_window_start_us, scope_window_width_us) # capture only the window of every waveform from one acquisition
+            self.ArchiveCapture(scopechannels, channels)
+
+        return self.scope.GetWaveform(), shots
 
-    def SetChannel(self, channel: int):
+    # Scores the captured waveforms of the group and saves their plots, needs nothing of the scope so it can run on another thread
+    # with shots from host averaging the metrics are the mean of every shot's, the same estimator their confidence intervals are of
+    def AnalyzePulseEcho(self, data: dict[str, np.ndarray], shots: Oscilloscope.RunningStats, channels: list[int], filename: str, spectrum: Spectrum.SpectrumAnalyzer = None) -> list[list]:
+
+        fft = self.PulseEchoSpectrum(data, spectrum) # calculate the fft of every waveform      
+
+        if shots.count > 0: # the averaged waveform is only plotted
+            metrics = {"Vpp": shots.mean[:, 0], "Bandwidth": shots.mean[:, 1], "Peak": shots.mean[:, 2]}
+        else:
+            metrics = Analysis.PulseEchoMetrics(data["Voltage"], fft["Frequency"], fft["Amplitude"]) # score every element at once
+        intervals = shots.ConfidenceInterval(confidence_z) # nan when there weren't enough shots to tell
+
+        verdicts = Analysis.PulseEchoVerdicts(metrics, PulseEchoLimits())
+
+        results = []
+        for i, channel in enumerate(channels):
+            self.PlotPulseEcho({"Time": data["Time"], "Voltage": data["Voltage"][i]}, {"Frequency": fft["Frequency"], "Amplitude": fft["Amplitude"][i]}, channel, filename)
+            results.append(PulseEchoResult(metrics, verdicts, i, intervals[i].tolist()))
+
+        return results
+
+    # The spectrum of the band we check of every captured waveform, in one batched call
+    # data and spectrum default to the last capture and the scope's fft engine
+    @Profiler.Timed("FFT")
+    def PulseEchoSpectrum(self, data: dict[str, np.ndarray] = None, spectrum: Spectrum.SpectrumAnalyzer = None) -> dict[str, np.ndarray]:
+
+        data = self.scope.GetWaveform() if data is None else data
+        spectrum = self.scope.spectrum if spectrum is None else spectrum
+        spectrum.SetTaper(fft_taper)
+
+        if fft_zoom_points > 0: # only compute the band we look at
+            return spectrum.BandFFT(data["Voltage"], data["Time"].dt, fft_window_start, fft_window_width, fft_zoom_points)
+
+        return Oscilloscope.WindowSpectrum(spectrum.FFT(data["Voltage"], data["Time"].dt), fft_window_start, fft_window_width)
+
+    # Saves the plots of one element's waveform and spectrum
+    def PlotPulseEcho(self, data: dict[str, np.ndarray], fft: dict[str, np.ndarray], channel: int, filename: str) -> None:
+
+        #self.scope.WriteDataToCSVFile(filename + str(self.channel + 1)) # Save all of the Data to a CSV File
+
+        # plot the waveform and fft and save them, the plotter draws them in the background
+        self.plotter.Submit(filename + "wave" + str(channel) + ".png", data["Time"], data["Voltage"], "Time", "Voltage")
+        self.plotter.Submit(filename + "fft" + str(channel) + ".png", fft["Frequency"], fft["Amplitude"], "Frequency", "Amplitude")
+
+    # Selects a channel and returns once the firmware says the relays have settled, gives back the channel byte the firmware selected
+    @Profiler.Timed("Relay Switch")
+    def SetChannel(self, channel: int) -> int:
 
         if(channel < 0):
-            return
+            return None
+
+        try:
+            return self.arduino.SetChannel(RelayChannel(channel))
+        except (TimeoutError, RuntimeError) as e: # keep the run going, the channel's results will show if it didn't switch
+            print(f"Could Not Switch to Channel {channel + 1}: {e}")
+            return None
+
+    # Gives the firmware the relay settle delays, timing every relay bank first in measure mode
+    def ConfigureRelaySettle(self) -> list[float]:
+
+        settle = self.MeasureRelaySettle() if relay_settle_mode == "measure" else relay_settle_s
+
+        for bank, seconds in enumerate(settle):
+            self.arduino.SetSettle(bank, seconds)
+
+        return settle
+
+    # Times how long every relay bank, and last the mux alone, takes to settle and gives back the delays to use in seconds
+    def MeasureRelaySettle(self) -> list[float]:
+
+        settle = []
+        for bank in range(Arduino.relay_banks + 1):
+            target = 0x01 if bank == Arduino.mux_bank else bank << 4 # a channel in the bank, or a channel next to the last one for the mux
+            before = 0x00 if bank == Arduino.mux_bank else ((bank + 1) % Arduino.relay_banks) << 4 # start from another bank so the relays move
+
+            times = []
+            for _ in range(relay_settle_measurements):
+                self.arduino.SetChannel(before)
+                times.append(self.arduino.MeasureSettle(target))
+
+            name = 'Mux' if bank == Arduino.mux_bank else f'Relay Bank {bank}'
+            if max(times) < relay_settle_floor_s[bank]: # too fast to be the relays, the sense line isn't following the switch
+                settle.append(relay_settle_s[bank])
+                print(f"{name} Settled in {max(times) * 1e3:.3f}ms, Faster Than Relays Can, Check the Sense Wire, Waiting the Fixed {settle[-1] * 1e3:.2f}ms")
+                continue
+
+            settle.append(max(times) * relay_settle_margin)
+            print(f"{name} Settles in {max(times) * 1e3:.2f}ms, Waiting {settle[-1] * 1e3:.2f}ms")
+
+        return settle
+
+# The channel byte the firmware is sent for a 0 indexed channel, the relay bank in bits 4-5 is remapped to how the relays are wired
+def RelayChannel(channel: int) -> int:
+
+    relay_ch = (channel & 0x30) >> 4 # get the two bit relay channel 
+    channel &= ~0x30 # clear the bits of the relay channel
+    
+    # custom relay channel mapping, see Jesus
+    if relay_ch == 0x3:
+        relay_ch = 0x2
+    elif relay_ch == 0x2:
+        relay_ch = 0x3
+    elif relay_ch == 0x1:
+        relay_ch = 0x1
+    else:
+        relay_ch = 0x0
+
+    channel |= relay_ch << 4 # put the correct index in
+    return channel
+
+# The pulse echo thresholds as the limits the analysis checks against
+def PulseEchoLimits() -> dict[str, float]:
+    return {
+        "Dead": .04, # if vpp <= .04 we have a dead element
+        "VppLower": vpp_lower_thresh, "VppUpper": vpp_upper_thresh,
+        "BandwidthLower": bandwidth_lower_thresh, "BandwidthUpper": bandwidth_upper_thresh,
+        "PeakLower": peak_freq_lower_thresh, "PeakUpper": peak_freq_upper_thresh,
+    }
+
+# The result of element i, [passed, vpp, bandwidth, peak frequency] followed by the confidence interval of each of the three
+def PulseEchoResult(metrics: dict[str, np.ndarray], verdicts: np.ndarray, i: int, intervals: list[float]) -> list[bool, float, float, float, float, float, float]:
+
+    vpp = float(metrics["Vpp"][i])
+    bandwidth = float(metrics["Bandwidth"][i])
+    peak = float(metrics["Peak"][i])
+
+    print(f"Vpp: {vpp} Bandwidth: {bandwidth} Peak Frequency: {peak}")        # debug message
+
+    if not math.isnan(intervals[0]):
+        print(f"Confidence Intervals Vpp: +/-{intervals[0]} Bandwidth: +/-{intervals[1]} Peak Frequency: +/-{intervals[2]}")
 
-        relay_ch = (channel & 0x30) >> 4 # get the two bit relay channel 
-        channel &= ~0x30 # clear the bits of the relay channel
+    # if we have a dead element return failure, the rest of the values dont matter
+    if vpp <= PulseEchoLimits()["Dead"]:
+        return [False, 0, 0, 0] + intervals
+
+    return [bool(verdicts[i]), vpp, bandwidth, peak] + intervals
+
+# The sweep and pass criteria a VNA test needs, read when the test runs so edits to the thresholds take effect
+def VNATestConfig(test: str) -> dict:
+
+    if test == "Impedance":
+        return {"Sweep": CapacitanceSweep(channel_freq), "Frequency": channel_freq, "Lower": channel_lower_thresh, "Upper": channel_upper_thresh}
+
+    if test == "Dongle":
+        return {"Sweep": CapacitanceSweep(dongle_freq), "Frequency": dongle_freq, "Lower": dongle_lower_thresh, "Upper": dongle_upper_thresh}
+
+    raise ValueError(f"Unknown VNA Test: {test}")
+
+# The sweep (start, stop, points, parameters, time per point) to measure a capacitance at a frequency
+def CapacitanceSweep(freq: float) -> tuple:
+
+    if capacitance_mode == "fit": # a short band around the test frequency
+        return (freq * (1 - capacitance_fit_span / 2), freq * (1 + capacitance_fit_span / 2), capacitance_fit_points, ("s11",), capacitance_fit_timeperpoint)
+
+    return (freq, freq, 1, ("s11",), capacitance_point_timeperpoint) # only the test frequency
+
+# The root of the file name a VNA test saves its sweep under
+def VNATestFileName(test: str, channel: int, filename: str) -> str:
+
+    if test == "Dongle":
+        return filename + str(channel + 1) + "dongle" # the filename as well as the channel and dongle indicator 
+
+    return filename + str(channel) # "{filename} {channel} s11.s1p"
+
+# Groups the VNA tests by the sweep they need, in the order they were asked for, so each distinct sweep only runs once
+def PlanVNAMeasurements(tests: list[str]) -> list[tuple[tuple, list[str]]]:
+
+    plan = {} # sweep configuration -> the tests it satisfies
+
+    for test in tests:
+        plan.setdefault(VNATestConfig(test)["Sweep"], []).append(test)
+
+    return list(plan.items())
+
+# Calculates the capacitance at a test frequency from parsed s11 data and checks it against the thresholds
+def EvaluateCapacitance(data: dict[str, np.ndarray], freq: float, lower: float, upper: float) -> list[bool, float, float]:
+
+    if capacitance_mode == "fit" and len(data["Frequency"]) > 1: # fit the whole band if we swept one
+        _, c, residual = FitSeriesRC(data["Frequency"], data["Z"])
+        c = float(c)
+        residual = float(residual)
+        print(f"Capacitance: {c * 1e12: .2f}pF Fit Residual: {residual * 100: .2f}%")
+
+    else:
+        i = int(np.argmin(np.abs(data["Frequency"] - freq))) # find the index of the point closest to the test frequency, the VNA may snap it
+        c = float(-1 / (2 * math.pi * data["Z"][i].imag * data["Frequency"][i])) # calculate the capacitance at that point, 1 / wC = -im(Z)
+        residual = math.nan # a single point has nothing to fit
+        print(f"Capacitance: {c * 1e12: .2f}pF")
+
+    if c < upper and c > lower: # if we are within the thresholds then we are good
+        return [True, c, residual] # Passed the test
         
-        # custom relay channel mapping, see Jesus
-        if relay_ch == 0x3:
-            relay_ch = 0x2
-        elif relay_ch == 0x2:
-            relay_ch = 0x3
-        elif relay_ch == 0x1:
-            relay_ch = 0x1
-        else:
-            relay_ch = 0x0
+    return [False, c, residual] # Failed the Test
+
+# Least squares fit of a series RC model, Z = R - j / (2 pi f C), to impedance data
+# Z can hold one sweep or a stack of sweeps along its first axis, gives back R, C and the rms residual relative to the model
+def FitSeriesRC(frequency: np.ndarray, z: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+
+    inverseomega = 1 / (2 * math.pi * np.asarray(frequency)) # 1 / w for every point
+    z = np.asarray(z)
+
+    r = z.real.mean(axis = -1) # the real part of the model is flat so the best R is the mean
+    elastance = -(z.imag * inverseomega).sum(axis = -1) / (inverseomega * inverseomega).sum() # the best 1 / C for im(Z) = -(1 / C) / w
+    c = 1 / elastance
+
+    model = r[..., np.newaxis] - 1j * elastance[..., np.newaxis] * inverseomega
+    residual = np.sqrt(np.mean(np.abs(z - model) ** 2, axis = -1) / np.mean(np.abs(model) ** 2, axis = -1))
+
+    return r, c, residual
+
+def CompletedFuture(result) -> Future: # a future that already has its result
+    future = Future()
+    future.set_result(result)
+    return future
+
+# Gives back a future that resolves to function applied to the result of future, cancelling it cancels future
+def ChainFuture(future: Future, function) -> Future:
+    return SharedFuture(future).Chain(function)
+
+# Hands the result of one future to several chained ones, e.g. tests that share a sweep
+# the work behind it is only cancelled once every chained future is, cancelling one test doesn't stop the sweep the others wait on
+class SharedFuture:
+    def __init__(self, future: Future):
+        self.future = future
+        self.dependents = [] # every future chained to this one
+        self.lock = threading.Lock() # the chained futures are cancelled from whichever thread is waiting on them
+
+    # Gives back a future that resolves to function applied to the result
+    def Chain(self, function) -> Future:
+
+        chained = Future()
+        with self.lock:
+            self.dependents.append(chained)
+
+        def Resolve(done: Future) -> None:
+            if done.cancelled():
+                chained.cancel()
+                return
+
+            if not chained.set_running_or_notify_cancel():
+                return
+
+            try:
+                chained.set_result(function(done.result()))
+            except Exception as e:
+                chained.set_exception(e)
 
-        channel |= relay_ch << 4 # put the correct index in
+        chained.add_done_callback(self.Release)
+        self.future.add_done_callback(Resolve)
 
-        self.arduino.Write(channel.to_bytes(1, 'big'))
+        return chained
 
+    def Release(self, done: Future) -> None: # if nobody wants the result anymore stop the work
+        if done.cancelled():
+            with self.lock:
+                unwanted = all(dependent.cancelled() for dependent in self.dependents)
+            if unwanted:
+                self.future.cancel()
 
 if __name__ == "__main__":
     pass
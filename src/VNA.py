@@ -1,8 +1,14 @@
 
 import os
 import glob
+import subprocess
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 import csv
 import re
+import numpy as np
+import Profiler
 
 inputimpedance = 50
 
@@ -22,6 +28,12 @@ class VNA:
         self.calsweep = None # How to Run the Calibration Sweep [ Open Short Crosstalk Thru] None for Dont 
         self.calsweepverbose = False # if we are doing a verbose Calibration Sweep
         self.filename = "Test" # Name to Save the File As, only the root of it
+        self.process = None # the VNA app running a one off script
+        self.sweeptimeout = None # how long to wait for a sweep in seconds before killing the VNA app, None waits forever
+        self.worker = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "VNA") # runs the sweeps in the background one at a time
+        self.lock = threading.Lock() # guards the running processes against cancellation from other threads
+        self.active = None # the future of the sweep that is running
+        self.sweeptimes = [] # how long every sweep took in seconds
         
     def SetStartFreq(self, freq: int):
         self.lowfreq = freq
@@ -57,67 +69,239 @@ class VNA:
     def SetNumPoints(self, points: int):
         self.numpoints = points
 
-    # Writes and Executes a Script File According to the Class Parameters
-    def Sweep(self):
-        with open(self.scriptfile, "w") as file: # open the Script for writing
-            
-            # see VNWA Handbook 
-            if self.mastercal is not None: # if we are using a master calibration load it
-                file.write(f"loadmastercal {self.mastercal}\n")
-
-            if self.calfile is not None: # if we are using a Calibration File Load it
-                file.write(f"loadcal {self.calfile}\n")
-
-            if self.calsweep is not None: # If we are Running a Calibration Sweep Set it
-                file.write(f"calsweep {self.calsweep}")
-                file.write("nv\n" if not self.calsweepverbose else "\n")
-
-            file.write(f"range {int(self.lowfreq)} {int(self.highfreq)}\n") # Set the Start Frequency and Stop Frequency
-            file.write(f"frame {self.numpoints} {self.scale}\n") # Set the Scale and Number of Points
-            file.write(f"timeperpoint {self.timeperpoint}\n") # Set the Time Per Point
-            # file.write(f"setTXpower {self.txpower}\n") # Set the Transmission Power for Measurement                
-
-            if len(self.parameters) != 0: # for all of the parameters to measure            
-                
-                file.write("sweep") 
-                for param in self.parameters:
-                    file.write(" " + param) # sweep over that range and measure the parameter
-                file.write("\n")                
-                
-                for param in self.parameters: # for each of the meausured parameters write the data to a file
-                    file.write(f"writes1p {self.filename + param}.s1p {param}\n")
-            
-            file.write("exitVNWA") # leave the VNA app so you can do this again
+    def SetSweepTimeout(self, timeout: float = None):
+        self.sweeptimeout = timeout
 
-        os.system("{} {} -debug".format(self.executable, os.getcwd() + "\\" + self.scriptfile)) # Run this Script File Through the VNA App
+    # The commands that load the calibration, the start of every sweep's script
+    def CalibrationCommands(self) -> list[str]:
 
+        commands = []
 
-def GrabS1PData(filename: str) -> dict[str, list[complex]]:
+        # see VNWA Handbook 
+        if self.mastercal is not None: # if we are using a master calibration load it
+            commands.append(f"loadmastercal {self.mastercal}")
 
-    s1pfile = open(filename, "r") #read the s1p file
+        if self.calfile is not None: # if we are using a Calibration File Load it
+            commands.append(f"loadcal {self.calfile}")
 
-    # read the s1p file according to the touchstone specifications
-    s1pfile.readline()
-    s1pfile.readline()
+        return commands
 
-    # Setup an empty Dictionary To Hold the S1P Values
-    data = {"Frequency": [], "Value": [], "Z": []}
+    # The commands that configure and run one sweep and write the results to files
+    def SweepCommands(self) -> list[str]:
 
-    # line for line extract the data
-    for line in s1pfile:
+        commands = []
 
-        items = ' '.join(line.split()) # get rid of the extra spaces to make it uniform and extractable
-        datem = [float(item) for item in items.split()] # pull all of the space seperated values and put them into a list
+        if self.calsweep is not None: # If we are Running a Calibration Sweep Set it
+            commands.append(f"calsweep {self.calsweep}" + (" nv" if not self.calsweepverbose else ""))
 
-        data["Frequency"].append(1e6 * datem[0]) # Frequency in units of MHz
-        
-        real = datem[1]
-        imag = datem[2]
+        commands.append(f"range {int(self.lowfreq)} {int(self.highfreq)}") # Set the Start Frequency and Stop Frequency
+        commands.append(f"frame {self.numpoints} {self.scale}") # Set the Scale and Number of Points
+        commands.append(f"timeperpoint {self.timeperpoint}") # Set the Time Per Point
+        # commands.append(f"setTXpower {self.txpower}") # Set the Transmission Power for Measurement                
+
+        if len(self.parameters) != 0: # for all of the parameters to measure            
+            commands.append("sweep " + " ".join(self.parameters)) # sweep over that range and measure the parameters
+
+            for param, output in zip(self.parameters, self.OutputFiles()): # for each of the meausured parameters write the data to a file
+                commands.append(f"writes1p {output} {param}")
+
+        return commands
+
+    # The files a sweep with the current settings will write
+    def OutputFiles(self) -> list[str]:
+        return [f"{self.filename + param}.s1p" for param in self.parameters]
+
+    # The command line to launch the VNA app with a script file
+    def Command(self, scriptfile: str) -> list[str]:
+        executable = [self.executable] if isinstance(self.executable, str) else list(self.executable) # the executable can be a path or a full command
+        return executable + [os.path.join(os.getcwd(), scriptfile), "-debug"]
+
+    # Writes and Executes a Script File According to the Class Parameters, waits for and gives back the parsed data for every parameter
+    def Sweep(self, timeout: float = None) -> dict[str, dict[str, np.ndarray]]:
+        return self.SweepAsync(timeout).result()
+
+    # Starts a sweep in the background and gives back a future of the parsed data for every parameter
+    # cancelling the future kills a running sweep, asyncio users can await it with asyncio.wrap_future
+    def SweepAsync(self, timeout: float = None) -> Future:
+
+        future = Future()
+        future.add_done_callback(self.CancelSweep) # if the caller cancels the future stop the VNA app
+
+        # take a copy of the settings now so the caller can set up the next sweep while this one runs
+        calibration = self.CalibrationCommands()
+        commands = self.SweepCommands()
+        outputs = dict(zip(self.parameters, self.OutputFiles()))
+        timeout = self.sweeptimeout if timeout is None else timeout
+
+        self.worker.submit(self.SweepWorker, future, calibration, commands, outputs, timeout) # sweeps run one at a time in order
+        return future
+
+    # Runs one sweep on the worker thread and resolves its future
+    def SweepWorker(self, future: Future, calibration: list[str], commands: list[str], outputs: dict[str, str], timeout: float) -> None:
+
+        with self.lock:
+            if future.cancelled(): # cancelled before it got to run
+                return
+            self.active = future
+
+        start = time.perf_counter()
+        deadline = None if timeout is None else start + timeout
+        data = None
+        error = None
+
+        try:
+            with Profiler.Stage("Sweep"):
+                self.ScriptSweep(calibration, commands, deadline)
+
+            self.sweeptimes.append(time.perf_counter() - start)
+            data = {param: ReadTouchstone(output) for param, output in outputs.items()} # parse every file that was written
+        except Exception as e: # hand every failure to whoever is waiting on the future
+            error = e
+
+        with self.lock:
+            self.active = None
+
+        if not future.set_running_or_notify_cancel(): # cancelled while it was running, nobody wants the result
+            return
+
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(data)
+
+    # Kills the VNA app if the sweep it is running was cancelled
+    def CancelSweep(self, future: Future) -> None:
+
+        if not future.cancelled():
+            return
+
+        with self.lock:
+            if self.active is not future:
+                return
+
+            if self.process is not None:
+                self.process.kill()
+
+    # Runs one sweep by starting the VNA app with a script that loads the calibration, sweeps and exits
+    def ScriptSweep(self, calibration: list[str], commands: list[str], deadline: float = None) -> None:
+
+        with open(self.scriptfile, "w") as file: # open the Script for writing
+            for command in calibration + commands:
+                file.write(command + "\n")
+            
+            file.write("exitVNWA") # leave the VNA app so you can do this again
+
+        with self.lock:
+            self.process = subprocess.Popen(self.Command(self.scriptfile)) # Run this Script File Through the VNA App
+            if self.active is not None and self.active.cancelled(): # cancelled before there was a process for CancelSweep to kill
+                self.process.kill()
+
+        try:
+            self.process.wait(timeout = None if deadline is None else max(0, deadline - time.perf_counter()))
+        except subprocess.TimeoutExpired: # the VNA app hung, get rid of it so the next sweep can run
+            self.process.kill()
+            self.process.wait()
+            raise TimeoutError("VNWA Sweep Timed Out")
+        finally:
+            with self.lock:
+                self.process = None
+
+# Touchstone frequency units and their multipliers to Hz
+frequencyunits = {"HZ": 1.0, "KHZ": 1e3, "MHZ": 1e6, "GHZ": 1e9}
+
+# Reads a Touchstone (.sNp) file into NumPy arrays according to the Touchstone 1.1 specification
+@Profiler.Timed("Parse")
+def ReadTouchstone(filename: str) -> dict[str, np.ndarray]:
+
+    # defaults from the specification if there is no option line
+    unit = "GHZ"
+    parameter = "S"
+    form = "MA"
+    z0 = float(inputimpedance)
+
+    match = re.search(r"\.s(\d+)p$", filename, re.IGNORECASE) # the number of ports comes from the file extension
+    ports = int(match.group(1)) if match is not None else 1
+
+    tokens = [] # all of the numeric fields in the file, in order
+    optionsfound = False
+
+    with open(filename, "r") as s1pfile:
+        for line in s1pfile:
+            line = line.split("!", 1)[0].strip() # comments can show up anywhere, strip them off
+
+            if len(line) == 0:
+                continue
+
+            if line.startswith("#"): # the option line, only the first one counts
+                if optionsfound:
+                    continue
+                optionsfound = True
+
+                options = line[1:].upper().split()
+                i = 0
+                while i < len(options):
+                    if options[i] in frequencyunits:
+                        unit = options[i]
+                    elif options[i] in ("S", "Y", "Z", "H", "G"):
+                        parameter = options[i]
+                    elif options[i] in ("RI", "MA", "DB"):
+                        form = options[i]
+                    elif options[i] == "R" and i + 1 < len(options):
+                        z0 = float(options[i + 1])
+                        i += 1
+                    i += 1
+                continue
+
+            tokens.append(line)
+
+    values = np.array(" ".join(tokens).split(), dtype=np.float64) # parse every number in one go
+    columns = 1 + 2 * ports * ports # frequency followed by a pair for every parameter
+
+    if values.size % columns != 0:
+        raise ValueError(f"{filename} does not contain whole {ports} port records")
+
+    values = values.reshape(-1, columns)
+
+    frequency = np.ascontiguousarray(values[:, 0] * frequencyunits[unit])
+    a = values[:, 1::2]
+    b = values[:, 2::2]
+
+    if form == "RI":
+        params = a + 1j * b
+    elif form == "MA":
+        params = a * np.exp(1j * np.deg2rad(b))
+    else:
+        params = 10 ** (a / 20) * np.exp(1j * np.deg2rad(b))
+
+    if ports == 1:
+        params = np.ascontiguousarray(params[:, 0])
+    else:
+        params = params.reshape(-1, ports, ports)
+        if ports == 2: # two port files list the parameters as 11 21 12 22
+            params = np.ascontiguousarray(params.transpose(0, 2, 1))
+
+    data = {"Frequency": frequency, "Value": params, "Z0": z0, "Parameter": parameter}
+
+    if ports == 1: # one port data can be converted directly to an impedance
+        if parameter == "S":
+            data["Z"] = z0 * (1 + params) / (1 - params)
+        elif parameter == "Z":
+            data["Z"] = z0 * params # Z and Y parameters are normalized to the reference impedance
+        elif parameter == "Y":
+            data["Z"] = z0 / params
+
+    return data
+
+# Reads an S1P file and gives the data back as lists so it can be indexed like before
+def GrabS1PData(filename: str) -> dict[str, list[complex]]:
+
+    arrays = ReadTouchstone(filename)
 
-        data["Value"].append(complex(real, imag)) # scale is in MHz
+    # Setup a Dictionary of lists from the parsed arrays
+    data = {"Frequency": arrays["Frequency"].tolist(), "Value": arrays["Value"].tolist(), "Z": []}
 
-    if "s11" in filename:        
-        data["Z"] = [ inputimpedance * (1 + val)/(1 - val) for val in data["Value"] ] # calculate the impedance for every frequency
+    if "Z" in arrays:
+        data["Z"] = arrays["Z"].tolist() # the impedance for every frequency
 
     return data
 
@@ -144,7 +328,6 @@ def ConvertS1PToCSV(filename: str) -> dict[str, complex]:
     csvwriter.writerows(zip(data["Frequency"], data["Value"]))
 
     csvfile.close()
-    s1pfile.close()
 
         
 
@@ -0,0 +1,101 @@
+import sys
+import os
+import math
+import time
+
+# A stand in for VNWA.exe that understands the script commands VNA.py writes
+# Usage: python VNWAStub.py [-startup=<s>] [-pointscale=<x>] <script file> [-debug]
+
+inputimpedance = 50
+
+stub_resistance = 5.0 # series resistance of the simulated load in ohms
+stub_capacitance = 720e-12 # series capacitance of the simulated load in farads
+
+stub_startup_s = 0 # how long the simulated app takes to start
+stub_point_scale = 0 # the fraction of the time per point a sweep really waits, 1 sweeps as slow as the real VNA
+
+class VNWAStub:
+    def __init__(self):
+        self.lowfreq = 1e6
+        self.highfreq = 1.3e9
+        self.numpoints = 2000
+        self.scale = "lin"
+        self.timeperpoint = 10
+        self.measured = [] # the parameters from the last sweep
+        self.running = True
+        self.resistance = stub_resistance # the load being measured
+        self.capacitance = stub_capacitance
+        self.pointscale = stub_point_scale
+
+    def Frequencies(self) -> list[float]:
+
+        if self.numpoints <= 1:
+            return [self.lowfreq]
+
+        if self.scale.lower() == "log":
+            ratio = (self.highfreq / self.lowfreq) ** (1 / (self.numpoints - 1))
+            return [self.lowfreq * ratio ** i for i in range(self.numpoints)]
+
+        step = (self.highfreq - self.lowfreq) / (self.numpoints - 1)
+        return [self.lowfreq + step * i for i in range(self.numpoints)]
+
+    def Reflection(self, freq: float) -> complex:
+        z = complex(self.resistance, -1 / (2 * math.pi * freq * self.capacitance)) # series RC load
+        return (z - inputimpedance) / (z + inputimpedance)
+
+    def WriteS1P(self, filename: str, param: str) -> None:
+
+        with open(filename + ".tmp", "w") as file: # write to the side so a reader never sees half a file
+            file.write(f"! VNWA Stub {param}\n")
+            file.write(f"# MHz S RI R {inputimpedance}\n")
+            for freq in self.Frequencies():
+                s = self.Reflection(freq)
+                file.write(f"{freq * 1e-6:.9f} {s.real:.9f} {s.imag:.9f}\n")
+
+        os.replace(filename + ".tmp", filename)
+
+    def Execute(self, line: str) -> None:
+
+        items = line.split()
+        if len(items) == 0:
+            return
+
+        command = items[0].lower()
+
+        if command == "range":
+            self.lowfreq = float(items[1])
+            self.highfreq = float(items[2])
+        elif command == "frame":
+            self.numpoints = int(items[1])
+            self.scale = items[2] if len(items) > 2 else "lin"
+        elif command == "timeperpoint":
+            self.timeperpoint = float(items[1])
+        elif command == "sweep":
+            self.measured = items[1:]
+            time.sleep(self.numpoints * self.timeperpoint * 1e-3 * self.pointscale) # the time per point is in ms
+        elif command == "load": # not a VNWA command, lets a simulation choose the load of each sweep
+            self.resistance = float(items[1])
+            self.capacitance = float(items[2])
+        elif command == "writes1p":
+            self.WriteS1P(items[1], items[2] if len(items) > 2 else "s11")
+        elif command == "exitvnwa":
+            self.running = False
+
+        # loadmastercal, loadcal, calsweep and setTXpower are accepted and ignored
+
+
+if __name__ == "__main__":
+
+    options = dict(arg[1:].split("=", 1) for arg in sys.argv[1:] if arg.startswith("-") and "=" in arg)
+    scriptfile = [arg for arg in sys.argv[1:] if not arg.startswith("-")][0]
+
+    stub = VNWAStub()
+    stub.pointscale = float(options.get("pointscale", stub_point_scale))
+
+    time.sleep(float(options.get("startup", stub_startup_s)))
+
+    with open(scriptfile, "r") as script: # run the script we were started with
+        for line in script:
+            stub.Execute(line)
+            if not stub.running:
+                break
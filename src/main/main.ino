@@ -11,14 +11,81 @@
 
 #define EN 13 // enable pin
 
+// reads the switched line back to measure how long the relays take to settle, wire it to the common of the relay output
+// not A0, on the Uno and Nano A0 is digital pin 14 which drives SEL5
+#define SENSE A1
+#define TRIGGER 2 // a rising edge here steps a loaded channel sequence, e.g. from the scope's trigger out
+
+// the framed protocol Arduino.py speaks, every command is acknowledged once it is done
+//   host -> arduino: [FRAME_SYNC] [sequence] [command] [length] [payload ...] [checksum]
+//   arduino -> host: [ACK_SYNC]   [sequence] [status]  [length] [payload ...] [checksum]
+// the checksum is the low byte of the sum of the sequence, command/status, length and payload bytes
+// numbers in payloads are little endian
+
+#define FRAME_SYNC 0xA5
+#define ACK_SYNC 0x5A
+
+#define CMD_SET_CHANNEL 0x01 // [channel] select the channel, acknowledge after it settles with [channel]
+#define CMD_SET_SETTLE 0x02 // [bank, 4 byte microseconds] set the settle time of a relay bank, bank 4 is a switch of the mux alone
+#define CMD_MEASURE_SETTLE 0x03 // [channel] select the channel, acknowledge with [4 byte microseconds] the sense line took to settle
+#define CMD_LOAD_SEQUENCE 0x04 // [offset, channels ...] load channels into the sequence from offset, offset 0 starts a new sequence
+// an offset before the end overwrites from there, so a chunk the host sends again because its acknowledgement was lost loads the same
+#define CMD_START_SEQUENCE 0x05 // [] select the first channel of the sequence, acknowledge after it settles with [index, channel]
+#define CMD_SET_TRIGGER 0x06 // [enabled, 4 byte microseconds] if the trigger pin steps the sequence and how long after the edge
+#define CMD_STOP_SEQUENCE 0x07 // [] forget the sequence and stop the trigger stepping it
+
+#define NEXT_BYTE 'N' // sent on its own outside of a frame, steps the sequence to its next channel
+// after a frame that was cut off or corrupted everything up to the next FRAME_SYNC is dropped, NEXT_BYTE included,
+// so the rest of a broken frame is never taken for a step of the sequence
+
+#define STATUS_OK 0x00
+#define STATUS_BAD_CHECKSUM 0x01
+#define STATUS_UNKNOWN_COMMAND 0x02
+#define STATUS_NO_SEQUENCE 0x03
+#define STATUS_BAD_LENGTH 0x04 // the payload isn't the length the command takes, nothing was done
+#define STATUS_LIVE 0x10 // sent on its own whenever the sequence steps, [index, channel] is now live
+#define STATUS_SEQUENCE_DONE 0x11 // sent on its own when the sequence is stepped past its last channel
+
+#define MAX_PAYLOAD 32 // the longest payload of any command
+#define MAX_SEQUENCE 128 // the most channels a sequence can have
+
+#define RELAY_BANKS 4 // relay banks are selected by bits 4-5 of the channel
+#define MUX_BANK 4 // the settle time index of a switch that stays in the same bank
+
+#define SETTLE_TOLERANCE 4 // how many adc counts the sense line can move and still be settled
+#define SETTLE_SAMPLES 8 // how many readings in a row have to be inside the tolerance
+#define SETTLE_TIMEOUT_US 100000 // give up measuring after this long
+
 const uint8_t sel[] = { SEL0, SEL1, SEL2, SEL3, SEL4, SEL5, SEL6, SEL7 }; // all of the selct pins
 
+uint32_t settle_us[] = { 5000, 5000, 5000, 5000, 50 }; // how long to wait after switching before acknowledging, per relay bank and for the mux alone
+
+uint8_t current = 0; // the channel that is selected
+bool enabled = false; // if the mux has been enabled yet
+
+uint8_t sequence[MAX_SEQUENCE]; // the channels to step through
+uint8_t sequence_length = 0;
+uint8_t sequence_index = 0; // the live channel of the sequence
+uint8_t report_count = 0; // the sequence numbers of the reports we send on our own
+bool trigger_enabled = false; // if the trigger pin steps the sequence
+uint32_t trigger_delay_us = 1000; // how long after the trigger edge to step, so the capture it triggered isn't cut off
+volatile bool triggered = false; // set by the trigger interrupt
+bool resync = false; // if we are dropping bytes until the next frame sync
+
 void set_channel(const uint8_t channel);
+uint8_t select_channel(const uint8_t channel);
+uint32_t measure_settle();
+void wait_us(uint32_t us);
+void send_ack(const uint8_t sequence, const uint8_t status, const uint8_t* payload, const uint8_t length);
+void step_sequence();
+void on_trigger();
+uint32_t read_u32(const uint8_t* data);
+bool valid_length(const uint8_t command, const uint8_t* payload, const uint8_t length);
 
 void setup() {
 
-  Serial.begin(115200); // begin the serial port and 
-  Serial.setTimeout(1);
+  Serial.begin(115200); // begin the serial port and
+  Serial.setTimeout(10); // the rest of a frame comes right behind its sync byte
 
   for (uint8_t i = 0; i < sizeof(sel); i++) // configure all of the select pins as outputs
     pinMode(sel[i], OUTPUT);
@@ -27,27 +94,247 @@ void setup() {
 
   digitalWrite(EN, LOW); // disable the device by default
 
+  pinMode(TRIGGER, INPUT);
+  attachInterrupt(digitalPinToInterrupt(TRIGGER), on_trigger, RISING);
+
 }
 
 void loop() {
 
-  while(!Serial.available()); // wait for the host to send something over the serial port
+  if (triggered) { // the trigger pin steps the sequence once the capture it started is done
+    triggered = false;
+    if (trigger_enabled && sequence_length != 0) {
+      wait_us(trigger_delay_us);
+      step_sequence();
+    }
+  }
+
+  if (!Serial.available()) // wait for the host to send something over the serial port
+    return;
 
   int value = Serial.read(); // get the value the host sent
 
-  Serial.println(value); // print the value over the serial port
+  if (value != FRAME_SYNC) {
+    if (value == NEXT_BYTE && !resync) // a whole channel step in one byte
+      step_sequence();
+    return; // skip anything else that isn't the start of a frame
+  }
+
+  resync = false;
+
+  uint8_t header[3]; // sequence, command, length
+  if (Serial.readBytes(header, 3) != 3 || header[2] > MAX_PAYLOAD) { // cut off or not a frame, find the next one
+    resync = true;
+    return;
+  }
+
+  uint8_t payload[MAX_PAYLOAD];
+  uint8_t checksum;
+  if (Serial.readBytes(payload, header[2]) != header[2] || Serial.readBytes(&checksum, 1) != 1) {
+    resync = true;
+    return;
+  }
+
+  uint8_t sum = header[0] + header[1] + header[2];
+  for (uint8_t i = 0; i < header[2]; i++)
+    sum += payload[i];
+
+  if (sum != checksum) { // ask the host to send it again, the length can't be trusted either so find the next frame
+    send_ack(header[0], STATUS_BAD_CHECKSUM, NULL, 0);
+    resync = true;
+    return;
+  }
+
+  if (!valid_length(header[1], payload, header[2])) { // never act on bytes the host didn't send
+    send_ack(header[0], header[1] >= CMD_SET_CHANNEL && header[1] <= CMD_STOP_SEQUENCE ? STATUS_BAD_LENGTH : STATUS_UNKNOWN_COMMAND, NULL, 0);
+    return;
+  }
+
+  switch (header[1]) {
+
+    case CMD_SET_CHANNEL: {
+      uint8_t bank = select_channel(payload[0]);
+      wait_us(settle_us[bank]); // let the relays settle before the host measures anything
+      send_ack(header[0], STATUS_OK, &current, 1);
+      break;
+    }
+
+    case CMD_SET_SETTLE: {
+      if (payload[0] <= MUX_BANK)
+        settle_us[payload[0]] = read_u32(payload + 1);
+      send_ack(header[0], STATUS_OK, NULL, 0);
+      break;
+    }
+
+    case CMD_LOAD_SEQUENCE: {
+      uint8_t offset = payload[0];
+      uint8_t count = header[2] - 1;
+      for (uint8_t i = 0; i < count; i++)
+        sequence[offset + i] = payload[1 + i];
+      sequence_length = offset + count;
+      sequence_index = 0;
+      send_ack(header[0], STATUS_OK, NULL, 0);
+      break;
+    }
+
+    case CMD_START_SEQUENCE: {
+      if (sequence_length == 0) {
+        send_ack(header[0], STATUS_NO_SEQUENCE, NULL, 0);
+        break;
+      }
+      sequence_index = 0;
+      wait_us(settle_us[select_channel(sequence[0])]);
+      uint8_t data[2] = { sequence_index, current };
+      send_ack(header[0], STATUS_OK, data, 2);
+      break;
+    }
+
+    case CMD_SET_TRIGGER: {
+      trigger_enabled = payload[0] != 0;
+      trigger_delay_us = read_u32(payload + 1);
+      triggered = false; // an edge from before doesn't count
+      send_ack(header[0], STATUS_OK, NULL, 0);
+      break;
+    }
+
+    case CMD_STOP_SEQUENCE: {
+      sequence_length = 0;
+      trigger_enabled = false;
+      send_ack(header[0], STATUS_OK, NULL, 0);
+      break;
+    }
+
+    case CMD_MEASURE_SETTLE: {
+      select_channel(payload[0]);
+      uint32_t us = measure_settle();
+      uint8_t data[4] = { (uint8_t)us, (uint8_t)(us >> 8), (uint8_t)(us >> 16), (uint8_t)(us >> 24) };
+      send_ack(header[0], STATUS_OK, data, 4);
+      break;
+    }
+
+    default:
+      send_ack(header[0], STATUS_UNKNOWN_COMMAND, NULL, 0);
+
+  }
+
+}
+
+// if the payload is what the command takes, a sequence is loaded in order without gaps and never past its end
+bool valid_length(const uint8_t command, const uint8_t* payload, const uint8_t length) {
+
+  switch (command) {
+    case CMD_SET_CHANNEL:
+    case CMD_MEASURE_SETTLE:
+      return length == 1;
+    case CMD_SET_SETTLE:
+    case CMD_SET_TRIGGER:
+      return length == 5;
+    case CMD_LOAD_SEQUENCE:
+      return length >= 2 && payload[0] <= sequence_length && payload[0] + length - 1 <= MAX_SEQUENCE;
+    case CMD_START_SEQUENCE:
+    case CMD_STOP_SEQUENCE:
+      return length == 0;
+    default:
+      return false;
+  }
 
-  set_channel(value); // set the cooresponding channel
+}
+
+// selects the channel and enables the chip, gives back the settle time index of the switch
+uint8_t select_channel(const uint8_t channel) {
+
+  uint8_t bank = ((channel >> 4) & 0x3) == ((current >> 4) & 0x3) && enabled ? MUX_BANK : (channel >> 4) & 0x3; // only a bank change moves the relays
+
+  set_channel(channel); // set the cooresponding channel
   digitalWrite(EN, HIGH); // enable the chip
 
+  current = channel;
+  enabled = true;
 
+  return bank;
 
 }
 
 void set_channel(const uint8_t channel) {
 
   for (uint8_t i = 0; i < sizeof(sel); i++)
-    digitalWrite(sel[i], channel & (1 << i)); // set the channel bit by bit 
+    digitalWrite(sel[i], channel & (1 << i)); // set the channel bit by bit
 
 }
 
+// times how long the sense line takes to stop moving after a switch
+uint32_t measure_settle() {
+
+  uint32_t start = micros();
+  uint32_t settled = start;
+  int last = analogRead(SENSE);
+  uint8_t steady = 0;
+
+  while (steady < SETTLE_SAMPLES && micros() - start < SETTLE_TIMEOUT_US) {
+
+    int reading = analogRead(SENSE);
+
+    if (abs(reading - last) <= SETTLE_TOLERANCE) {
+      if (steady == 0)
+        settled = micros(); // the first of the steady readings is when it settled
+      steady++;
+    } else {
+      steady = 0;
+    }
+
+    last = reading;
+  }
+
+  return settled - start;
+
+}
+
+// selects the next channel of the sequence and tells the host which one is live once it settles
+void step_sequence() {
+
+  if (sequence_length == 0 || sequence_index + 1 >= sequence_length) {
+    uint8_t data[2] = { sequence_index, current };
+    send_ack(report_count++, STATUS_SEQUENCE_DONE, data, 2);
+    return;
+  }
+
+  sequence_index++;
+  wait_us(settle_us[select_channel(sequence[sequence_index])]);
+
+  uint8_t data[2] = { sequence_index, current };
+  send_ack(report_count++, STATUS_LIVE, data, 2);
+
+}
+
+void on_trigger() {
+  triggered = true;
+}
+
+uint32_t read_u32(const uint8_t* data) { // little endian
+
+  return (uint32_t)data[0] | ((uint32_t)data[1] << 8) | ((uint32_t)data[2] << 16) | ((uint32_t)data[3] << 24);
+
+}
+
+void wait_us(uint32_t us) { // delayMicroseconds is only accurate up to about 16ms
+
+  delay(us / 1000);
+  delayMicroseconds(us % 1000);
+
+}
+
+void send_ack(const uint8_t sequence, const uint8_t status, const uint8_t* payload, const uint8_t length) {
+
+  uint8_t sum = sequence + status + length;
+  for (uint8_t i = 0; i < length; i++)
+    sum += payload[i];
+
+  Serial.write(ACK_SYNC);
+  Serial.write(sequence);
+  Serial.write(status);
+  Serial.write(length);
+  if (length != 0)
+    Serial.write(payload, length);
+  Serial.write(sum);
+
+}
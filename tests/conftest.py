@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the modules import each other by name from src, like they do when run from there
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
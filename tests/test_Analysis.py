@@ -0,0 +1,68 @@
+import numpy as np
+import Analysis
+
+frequency = np.arange(5.0)
+
+def test_PulseEchoMetricsBandEdges():
+    # the -3dB edges are interpolated between the bins either side of the crossing
+    metrics = Analysis.PulseEchoMetrics(np.array([-.2, .1, .3]), frequency, np.array([0, .5, 1, .5, 0]))
+
+    np.testing.assert_allclose(metrics["Vpp"], [.5])
+    np.testing.assert_allclose(metrics["Lower"], [1 + .207 / .5])
+    np.testing.assert_allclose(metrics["Upper"], [3 - .207 / .5])
+    np.testing.assert_allclose(metrics["Bandwidth"], metrics["Upper"] - metrics["Lower"])
+    np.testing.assert_allclose(metrics["Peak"], [2.0])
+
+def test_PulseEchoMetricsPeakParabola():
+    # samples of a parabola put the peak on its vertex, between the bins
+    amplitude = 1 - (frequency - 2.3) ** 2
+    np.testing.assert_allclose(Analysis.PulseEchoMetrics(np.zeros(3), frequency, amplitude)["Peak"], [2.3])
+
+def test_PulseEchoMetricsEdgesOnTheEnds():
+    # an edge that never drops below the cutoff stays on the end of the spectrum, a peak on the end isn't refined
+    amplitude = np.array([[1, .9, .8, .75, .72], [.1, .2, .3, .6, 1]])
+    metrics = Analysis.PulseEchoMetrics(np.zeros((2, 3)), frequency, amplitude)
+
+    np.testing.assert_allclose(metrics["Lower"], [0.0, 3 + (.707 - .6) / .4])
+    np.testing.assert_allclose(metrics["Upper"], [4.0, 4.0])
+    np.testing.assert_allclose(metrics["Peak"], [0.0, 4.0])
+
+def test_PulseEchoMetricsBatch():
+    # a whole catheter in one call gives the same metrics as one element at a time
+    rng = np.random.default_rng(2)
+    voltage = rng.normal(size = (8, 64))
+    amplitude = np.abs(rng.normal(size = (8, 33)))
+    batch = Analysis.PulseEchoMetrics(voltage, np.linspace(0, 10e6, 33), amplitude)
+
+    for i in range(8):
+        single = Analysis.PulseEchoMetrics(voltage[i], np.linspace(0, 10e6, 33), amplitude[i])
+        for key, value in single.items():
+            np.testing.assert_allclose(batch[key][i], value[0])
+
+# the band edge and peak bins the per channel loop found before the metrics were vectorized
+def BaselineBins(amplitude: np.ndarray) -> tuple[int, int, int]:
+    maxindex = np.where(amplitude == amplitude.max())[0][0]
+    thresh = .707 * amplitude.max()
+
+    left = maxindex
+    right = maxindex
+    while amplitude[left] > thresh and left > 0:
+        left -= 1
+    while amplitude[right] > thresh and right < len(amplitude) - 1:
+        right += 1
+
+    return left, right, maxindex
+
+def test_PulseEchoMetricsBaseline():
+    # the interpolated edges fall within the bin past the loop's edges, and the peak within half a bin of its peak
+    rng = np.random.default_rng(3)
+    axis = np.linspace(0, 10e6, 65)
+    amplitude = np.abs(rng.normal(size = (32, 65))) + np.exp(-((axis - 6e6) / 2e6) ** 2) * 3
+    metrics = Analysis.PulseEchoMetrics(np.zeros((32, 3)), axis, amplitude)
+    spacing = axis[1] - axis[0]
+
+    for i in range(32):
+        left, right, peak = BaselineBins(amplitude[i])
+        assert axis[left] <= metrics["Lower"][i] <= axis[min(left + 1, 64)]
+        assert axis[max(right - 1, 0)] <= metrics["Upper"][i] <= axis[right]
+        assert abs(metrics["Peak"][i] - axis[peak]) <= spacing / 2
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+import Archive
+import Simulator
+import TesterBackend as tb
+
+@pytest.mark.parametrize("averages, mode", [(1, "host"), (3, "host"), (3, "scope")])
+def test_ReplayArchive(monkeypatch, tmp_path, averages, mode):
+    # a run archived on the simulated bench scores the same when it is played back
+    monkeypatch.chdir(tmp_path) # the VNA script and sweeps are written to the working directory
+    monkeypatch.setattr(tb, "plot_mode", "skip")
+    monkeypatch.setattr(tb, "sequence_mode", "host")
+    monkeypatch.setattr(tb, "pulse_echo_averages", averages)
+    monkeypatch.setattr(tb, "pulse_echo_average_mode", mode)
+    filename = str(tmp_path / "Run")
+    channels = [1, 2, 3]
+
+    tester = tb.CatheterTester(*Simulator.SimulatedInstruments(Simulator.ScaledLatencies(scale = 0), seed = 7))
+    tester.StartArchive(filename)
+    run = {"PulseEcho": {}, "Impedance": {}}
+    for channel, results in tester.RunChannels(channels, filename, ["PulseEcho", "Impedance"]):
+        for test, values in results.items():
+            run[test].update(values)
+    tester.StopArchive()
+
+    reader = Archive.ArchiveReader(filename + "Archive")
+    replay = tb.CatheterTester(Archive.ReplayArduino(), Archive.ReplayScope(reader), Archive.ReplayVNA(reader))
+    replay.archive = None
+    assert replay.scope.counts == {"Writes": 0, "Queries": 0} and replay.scope.completionmode == "opc"
+
+    results = Archive.ReplayArchive(reader, replay, str(tmp_path / "Replay"))
+    assert sorted(results["PulseEcho"]) == channels and sorted(results["Impedance"]) == channels
+    for test in run:
+        for channel in channels:
+            np.testing.assert_allclose(np.array(results[test][channel], dtype = float), np.array(run[test][channel], dtype = float), rtol = 1e-6)
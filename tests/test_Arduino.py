@@ -0,0 +1,118 @@
+import time
+import pytest
+import Arduino
+import Simulator
+
+# A serial port that records what is written and answers with the bytes it is given
+class ScriptedPort:
+    def __init__(self, replies: bytes = b""):
+        self.timeout = .05
+        self.written = b""
+        self.replies = replies
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self.replies)
+
+    def write(self, data: bytes) -> int:
+        self.written += data
+        return len(data)
+
+    def read(self, size: int = 1) -> bytes:
+        data = self.replies[:size]
+        self.replies = self.replies[size:]
+        return data
+
+def Ack(sequence: int, status: int, payload: bytes = b"") -> bytes: # an acknowledgement frame like main.ino sends
+    body = bytes([sequence, status, len(payload)]) + payload
+    return bytes([Arduino.ack_sync]) + body + bytes([Arduino.Checksum(body)])
+
+def SimulatedArduino() -> Arduino.Arduino:
+    return Arduino.Arduino(Simulator.SimulatedSerial(Simulator.SimulatedBench(1), Simulator.ScaledLatencies(scale = 0), timeout = .05))
+
+def test_Checksum():
+    assert Arduino.Checksum(b"") == 0
+    assert Arduino.Checksum(bytes([0xFF, 0x02])) == 0x01
+
+def test_TransactFrame():
+    # sync, sequence, command, length, payload and the checksum of everything after the sync
+    port = ScriptedPort(Ack(0, Arduino.status_ok, bytes([0x25])))
+    arduino = Arduino.Arduino(port)
+
+    assert arduino.SetChannel(0x25) == 0x25
+    assert port.written == bytes([Arduino.frame_sync, 0, Arduino.command_set_channel, 1, 0x25, (0 + 1 + 1 + 0x25) & 0xFF])
+    assert arduino.sequence == 1 and len(arduino.acktimes) == 1
+
+def test_ReadFrameSkipsNoiseAndCorruption():
+    # stray bytes, a corrupted frame and an answer to an older command come before the acknowledgement
+    corrupted = bytearray(Ack(0, Arduino.status_ok, b"\x01"))
+    corrupted[-1] ^= 0xFF
+    port = ScriptedPort(b"\x00N\x13" + bytes(corrupted) + Ack(7, Arduino.status_ok, b"\x02") + Ack(0, Arduino.status_ok, b"\x03"))
+
+    assert Arduino.Arduino(port).Transact(Arduino.command_set_channel, b"\x03") == b"\x03"
+
+def test_TransactResendsAfterBadChecksum():
+    port = ScriptedPort(Ack(0, Arduino.status_bad_checksum) + Ack(1, Arduino.status_ok))
+    arduino = Arduino.Arduino(port)
+    arduino.SetSettle(1, .002)
+
+    assert port.written.count(bytes([Arduino.frame_sync])) == 2 # sent again with the next sequence number
+    assert port.written[-9:-1] == bytes([1, Arduino.command_set_settle, 5, 1]) + (2000).to_bytes(4, "little")
+
+def test_TransactRejected():
+    with pytest.raises(RuntimeError):
+        Arduino.Arduino(ScriptedPort(Ack(0, Arduino.status_unknown_command))).Transact(0x7F)
+
+def test_SimulatedSequence():
+    arduino = SimulatedArduino()
+    arduino.LoadSequence([0x01, 0x12, 0x23])
+
+    assert arduino.StartSequence() == (0, 0x01)
+    assert arduino.NextChannel() == (1, 0x12)
+    assert arduino.NextChannel() == (2, 0x23)
+    assert arduino.NextChannel() is None # past the end
+    arduino.StopSequence()
+
+def test_SimulatedBadLength():
+    # a payload that isn't the length the command takes is rejected without doing anything
+    arduino = SimulatedArduino()
+    with pytest.raises(RuntimeError, match = f"Status {Arduino.status_bad_length}"):
+        arduino.Transact(Arduino.command_set_channel, b"\x01\x02")
+    with pytest.raises(RuntimeError, match = f"Status {Arduino.status_bad_length}"):
+        arduino.Transact(Arduino.command_load_sequence, bytes([5, 1, 2])) # loading can't leave a gap after the end
+
+    assert arduino.port.current is None
+
+def test_SimulatedResync():
+    # a next byte right after a broken frame is dropped, not taken as a step, until a good frame comes in
+    arduino = SimulatedArduino()
+    arduino.LoadSequence([0x01, 0x02])
+    arduino.StartSequence()
+
+    corrupted = bytearray([Arduino.frame_sync, 9, Arduino.command_set_channel, 1, 0x05, 0x00])
+    arduino.port.write(bytes(corrupted) + bytes([Arduino.next_byte]))
+    assert arduino.ReadFrame(time.perf_counter() + 1)[1] == Arduino.status_bad_checksum
+    assert arduino.port.in_waiting == 0 and arduino.port.current == 0x01
+
+    assert arduino.SetChannel(0x01) == 0x01
+    assert arduino.NextChannel() == (1, 0x02)
+
+def test_SimulatedLostLoadAck(monkeypatch):
+    # the acknowledgement of a chunk is lost, the firmware loaded it so the chunk sent again overwrites itself instead of being rejected
+    monkeypatch.setattr(Arduino, "ack_timeout_s", .05)
+    arduino = SimulatedArduino()
+    execute = arduino.port.Execute
+    lost = []
+
+    def LoseSecondChunkAck(sequence: int, command: int, payload: bytes, valid: bool) -> None:
+        execute(sequence, command, payload, valid)
+        if command == Arduino.command_load_sequence and payload[0] == Arduino.sequence_chunk and len(lost) == 0:
+            lost.append(arduino.port.replies.pop())
+
+    monkeypatch.setattr(arduino.port, "Execute", LoseSecondChunkAck)
+    channels = list(range(30))
+    arduino.LoadSequence(channels)
+
+    assert len(lost) == 1 and arduino.port.sequence == channels
+    assert arduino.StartSequence() == (0, 0)
+    assert [arduino.NextChannel()[1] for _ in channels[1:]] == channels[1:]
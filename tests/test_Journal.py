@@ -0,0 +1,64 @@
+import numpy as np
+import Journal
+
+def test_ReadJournalMissing(tmp_path):
+    assert Journal.ReadJournal(str(tmp_path / "Missing")) is None
+
+def test_JournalRoundTrip(tmp_path):
+    filename = str(tmp_path / "Run")
+    journal = Journal.JournalWriter(filename, [1, 2], ["PulseEcho", "Impedance"])
+    journal.Append(1, {"PulseEcho": {1: [True, np.float64(.1)]}, "Impedance": {1: [True, 720e-12]}})
+    journal.Append(2, {"PulseEcho": {2: [np.bool_(False), np.array([.01, 2.0])]}})
+    journal.Close()
+
+    read = Journal.ReadJournal(filename)
+    assert read["Channels"] == [1, 2] and read["Tests"] == ["PulseEcho", "Impedance"]
+    assert read["Runs"] == 1 and not read["Done"]
+    assert read["Results"]["PulseEcho"] == {1: [True, .1], 2: [False, [.01, 2.0]]} # channels come back as ints
+    assert Journal.Needed(read) == {2: ["Impedance"]}
+    assert Journal.Needed(read, failed = True) == {2: ["PulseEcho", "Impedance"]}
+
+def test_JournalCrashAndResume(tmp_path):
+    # a line cut off by a crash is skipped, and a resumed run appends to the journal and finishes it
+    filename = str(tmp_path / "Run")
+    journal = Journal.JournalWriter(filename, [1, 2, 3], ["Impedance"])
+    journal.Append(1, {"Impedance": {1: [True, 720e-12]}})
+    journal.file.write('{"Kind": "Result", "Channel": 2, "Res') # the crash
+    journal.Close()
+
+    read = Journal.ReadJournal(filename)
+    assert Journal.Needed(read) == {2: ["Impedance"], 3: ["Impedance"]}
+
+    journal = Journal.JournalWriter(filename, [2, 3], ["Impedance"], mode = "Resume")
+    journal.Append(2, {"Impedance": {2: [False, 600e-12]}})
+    journal.Append(3, {"Impedance": {3: [True, 710e-12]}})
+    journal.Finish()
+    journal.Close()
+
+    read = Journal.ReadJournal(filename)
+    assert read["Runs"] == 2 and read["Done"]
+    assert read["Channels"] == [1, 2, 3]
+    assert Journal.Needed(read) == {}
+    assert Journal.Needed(read, failed = True) == {2: ["Impedance"]}
+
+    passmap = {"Impedance": [[False, 0]] * 3}
+    Journal.MergeResults(read, passmap)
+    assert passmap["Impedance"] == [[True, 720e-12], [False, 600e-12], [True, 710e-12]]
+
+def test_JournalRetestReplaces(tmp_path):
+    # later results replace earlier ones, and a new run starts a new journal
+    filename = str(tmp_path / "Run")
+    journal = Journal.JournalWriter(filename, [1], ["Impedance"])
+    journal.Append(1, {"Impedance": {1: [False, 600e-12]}})
+    journal.Finish()
+    journal.Close()
+
+    journal = Journal.JournalWriter(filename, [1], ["Impedance"], mode = "Retest")
+    journal.Append(1, {"Impedance": {1: [True, 720e-12]}})
+    journal.Finish()
+    journal.Close()
+    assert Journal.ReadJournal(filename)["Results"]["Impedance"] == {1: [True, 720e-12]}
+
+    Journal.JournalWriter(filename, [1], ["Impedance"]).Close()
+    read = Journal.ReadJournal(filename)
+    assert read["Runs"] == 1 and read["Results"] == {}
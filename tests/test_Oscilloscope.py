@@ -0,0 +1,136 @@
+import numpy as np
+import pytest
+import Oscilloscope
+import Simulator
+
+# A scope on the simulated bench that answers at once
+def SimulatedScope(recordlength: int = 2000) -> Oscilloscope.Oscilloscope:
+    _, scope, _ = Simulator.SimulatedInstruments(Simulator.ScaledLatencies(scale = 0), recordlength, seed = 5)
+    return scope
+
+def test_ParsePreamble():
+    preamble = Oscilloscope.ParsePreamble('1;8;BIN;RI;MSB;"Ch1, DC coupling; 10.0mV/div";1000;Y;"s";1.0E-9;-2.0E-6;0;"V";4.0E-4;1.5;2.0E-3')
+    assert preamble == {"XINCR": 1e-9, "XZERO": -2e-6, "YMULT": 4e-4, "YOFF": 1.5, "YZERO": 2e-3}
+
+def test_ParsePreambleOtherOrder():
+    # a TDS orders the fields differently, trusting the positions would swap the offsets and scale by the wrong numbers
+    assert Oscilloscope.ParsePreamble('1;8;BIN;RI;MSB;1000;"Ch1, DC coupling";Y;1.0E-9;0;-2.0E-6;"s";4.0E-4;2.0E-3;1.5;"V"') is None
+    assert Oscilloscope.ParsePreamble('1;8;ASC;RI;MSB;"Ch1";1000;Y;"s";1.0E-9;0;0;"V";4.0E-4;0;0') is None
+    assert Oscilloscope.ParsePreamble('1;8;BIN;RI;MSB') is None
+
+def test_PreambleEveryCapture():
+    # a volts per division change on the front panel between captures is picked up by the next capture
+    scope = SimulatedScope()
+    scope.CaptureWaveforms([1])
+    before = scope.preamble["YMULT"]
+
+    scope.scope.write("CH1:SCALE 0.05") # turned on the front panel, not through the cache
+    scope.CaptureWaveforms([1])
+
+    assert scope.preamble["YMULT"] == pytest.approx(.05 / 25) != before
+    np.testing.assert_allclose(scope.Waveform["Voltage"], scope.samples * scope.preamble["YMULT"])
+
+def test_RunningStats():
+    # the running mean and sample variance match numpy's over the whole stack, nan until there are two samples
+    values = np.random.default_rng(2).normal(3.0, 2.0, (10, 4, 3))
+    stats = Oscilloscope.RunningStats((4, 3))
+    stats.Update(values[0])
+    assert np.isnan(stats.Variance()).all() and np.isnan(stats.ConfidenceInterval()).all()
+
+    for value in values[1:]:
+        stats.Update(value)
+
+    assert stats.count == 10
+    np.testing.assert_allclose(stats.mean, values.mean(axis = 0))
+    np.testing.assert_allclose(stats.Variance(), values.var(axis = 0, ddof = 1))
+    np.testing.assert_allclose(stats.ConfidenceInterval(2.0), 2.0 * np.sqrt(values.var(axis = 0, ddof = 1) / 10))
+
+def test_CaptureAveragedHost():
+    # averaging on the host gives the mean of every shot and their spread, and hands every shot to the callback
+    scope = SimulatedScope()
+    shots = []
+    waveform = scope.CaptureAveraged([1, 2], 4, mode = "host", callback = lambda shot: shots.append(np.array(shot["Voltage"])))
+
+    shots = np.stack(shots)
+    assert shots.shape[:2] == (4, 2)
+    np.testing.assert_allclose(waveform["Voltage"], shots.mean(axis = 0), atol = 1e-12)
+    np.testing.assert_allclose(scope.Statistics["Variance"], shots.var(axis = 0, ddof = 1), atol = 1e-12)
+    assert scope.Statistics["Count"] == 4 and (scope.Statistics["Variance"] > 0).any() # the simulated noise differs from shot to shot
+
+def test_CaptureAveragedScope():
+    # the scope averages the acquisitions itself so there is one transfer and no spread to report
+    scope = SimulatedScope()
+    queries = scope.counts["Queries"]
+    waveform = scope.CaptureAveraged([1], 4, mode = "scope", callback = lambda shot: pytest.fail("no shots reach the host"))
+
+    assert scope.Statistics["Count"] == 4 and np.isnan(scope.Statistics["Variance"]).all()
+    assert waveform["Voltage"].shape == scope.Statistics["Mean"].shape
+    assert scope.settings["ACQUIRE:MODE"] == "AVERAGE" and scope.counts["Queries"] - queries < 8
+
+def test_TimeAxis():
+    # the lazy axis indexes, slices and converts like the array it describes without building it
+    axis = Oscilloscope.TimeAxis(-2e-6, 1e-9, 1000)
+    times = -2e-6 + 1e-9 * np.arange(1000)
+
+    assert len(axis) == 1000
+    assert axis[0] == -2e-6 and axis[10] == pytest.approx(times[10]) and axis[-1] == pytest.approx(times[-1])
+    with pytest.raises(IndexError):
+        axis[1000]
+
+    window = axis[100:600:2] # slicing keeps it lazy
+    assert isinstance(window, Oscilloscope.TimeAxis)
+    assert len(window) == 250 and window.dt == pytest.approx(2e-9)
+    np.testing.assert_allclose(np.asarray(window), times[100:600:2])
+    np.testing.assert_allclose(np.asarray(axis, dtype = np.float32), times.astype(np.float32))
+
+def test_CaptureVoltageType():
+    # the raw samples stay int8 and are scaled once into the float type asked for
+    scope = SimulatedScope()
+    scope.SetVoltageType(np.float32)
+    waveform = scope.CaptureWaveforms([1])
+
+    assert scope.samples.dtype == np.int8
+    assert waveform["Voltage"].dtype == np.float32 and waveform["Voltage"].shape == (1, 2000)
+    assert isinstance(waveform["Time"], Oscilloscope.TimeAxis) and len(waveform["Time"]) == 2000
+    np.testing.assert_allclose(waveform["Voltage"], Oscilloscope.ScaleSamples(scope.samples, scope.preamble["YMULT"], 0, 0), rtol = 1e-6)
+
+def test_WindowSampleRange():
+    assert Oscilloscope.WindowSampleRange(.75, .75, 1e-9, 2000) == (750, 750)
+    assert Oscilloscope.WindowSampleRange(.5, 1.0, 1e-9, 2000) == (499, 999) # rounded down like WindowWaveform
+    assert Oscilloscope.WindowSampleRange(1.5, .75, 1e-9, 2000) is None # runs past the end of the record
+    assert Oscilloscope.WindowSampleRange(-.1, .75, 1e-9, 2000) is None
+    assert Oscilloscope.WindowSampleRange(.75, 0.0, 1e-9, 2000) is None
+
+def test_WindowedTransfer():
+    # only the window crosses the bus, and its times are where the window is in the record
+    scope = SimulatedScope()
+    waveform = scope.CaptureWaveforms([1], .75, .75)
+
+    assert scope.scope.settings["DATA:START"] == "751" and scope.scope.settings["DATA:STOP"] == "1500"
+    assert scope.samples.shape == (1, 750)
+    assert waveform["Time"][0] == pytest.approx(.75e-6) and waveform["Time"].dt == pytest.approx(1e-9) and len(waveform["Time"]) == 750
+
+    waveform = scope.CaptureWaveforms([1]) # without a window the whole record comes back
+    assert scope.scope.settings["DATA:START"] == "1" and scope.scope.settings["DATA:STOP"] == "2000"
+    assert waveform["Voltage"].shape == (1, 2000)
+
+def test_WindowOutsideRecord():
+    # a window the scope can't cut transfers the whole record and is windowed on the host as well as it can be
+    scope = SimulatedScope()
+    waveform = scope.CaptureWaveforms([1], 1.5, .75)
+
+    assert scope.samples.shape == (1, 2000)
+    assert waveform["Voltage"].shape == (1, 2000) # the window runs off the end so nothing is cut
+
+def test_MultiChannelCapture():
+    # every channel comes from one acquisition, stacked one row per channel and scaled with its own preamble
+    scope = SimulatedScope()
+    scope.scope.write("CH2:SCALE 0.05")
+    acquisitions = scope.scope.acquisitions
+    waveform = scope.CaptureWaveforms([1, 2, 3], .75, .75)
+
+    assert scope.scope.acquisitions == acquisitions + 1
+    assert scope.samples.shape == (3, 750) and waveform["Voltage"].shape == (3, 750) and len(waveform["Time"]) == 750
+    assert [preamble["YMULT"] for preamble in scope.capturepreambles] == pytest.approx([.02 / 25, .05 / 25, .02 / 25])
+    np.testing.assert_allclose(waveform["Voltage"], scope.samples * np.array([[.02 / 25], [.05 / 25], [.02 / 25]]))
+    assert not np.array_equal(scope.samples[0], scope.samples[2]) # each input sees its own element
@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+import pytest
+import TesterBackend as tb
+import Planner
+
+costs = {"Command": .001, "Settle": [.01, .02, .03, .04, .0001], "PulseEcho": .1, "Sweep": 1.0}
+
+@pytest.fixture(autouse = True)
+def SeparateSweeps(monkeypatch): # the dongle and impedance tests on sweeps of their own
+    monkeypatch.setattr(tb, "dongle_freq", 400e3)
+    monkeypatch.setattr(tb, "capacitance_mode", "point")
+
+def Pairs(steps: list[tuple[int, list[str]]]) -> list[tuple[int, str]]: # every (channel, test) a plan runs
+    return sorted((channel, test) for channel, tests in steps for test in tests)
+
+@pytest.mark.parametrize("order", Planner.planner_orders)
+def test_StepsRunEveryTestOnce(monkeypatch, order):
+    # every order runs every test on every channel once, pulse echo only on the first channel of each group of scope inputs
+    monkeypatch.setattr(tb, "pulse_echo_scope_channels", [1, 2])
+    channels = list(range(1, 9))
+    expected = sorted([(c, "PulseEcho") for c in channels if c % 2 == 1] + [(c, test) for c in channels for test in ["Impedance", "Dongle"]])
+
+    assert Pairs(Planner.Steps(order, channels, ["PulseEcho", "Impedance", "Dongle"])) == expected
+
+def test_StepsTestMajor():
+    # a pass per sweep, every other pass walking back the way the last one came
+    assert Planner.Steps("Test Major", [1, 2], ["Impedance", "Dongle"]) == [(1, ["Impedance"]), (2, ["Impedance"]), (2, ["Dongle"]), (1, ["Dongle"])]
+
+def test_Restrict(monkeypatch):
+    monkeypatch.setattr(tb, "pulse_echo_scope_channels", [1, 2])
+    steps = Planner.Steps("Channel Major", [1, 2, 3, 4], ["PulseEcho", "Impedance"])
+
+    # channel 2's pulse echo is captured with channel 1's, channel 4 needs nothing
+    restricted = Planner.Restrict(steps, {2: ["PulseEcho"], 3: ["Impedance"]})
+    assert restricted == [(1, ["PulseEcho"]), (3, ["Impedance"])]
+    assert Planner.Restrict(steps, {}) == []
+
+def test_Estimate():
+    estimate = Planner.Estimate([(1, ["PulseEcho", "Impedance"]), (2, ["Impedance"]), (17, ["Dongle"])], costs)
+
+    # channel 1 moves bank 0, channel 2 only the mux, channel 17 moves bank 1
+    assert estimate["Switches"] == 3 and estimate["Bank Changes"] == 2
+    assert estimate["Seconds"] == pytest.approx((.001 + .01) + .1 + 1.0 + (.001 + .0001) + 1.0 + (.001 + .02) + 1.0)
+
+def test_EstimateStaysOnChannel():
+    # running a second test on the channel the relays are on doesn't switch them
+    estimate = Planner.Estimate(Planner.Steps("Test Major", [1, 2], ["Impedance", "Dongle"]), costs)
+    assert estimate["Switches"] == 3
+
+def test_PlanRun():
+    # every sweep starts the VNA app, so the order that switches the relays the least wins
+    tester = SimpleNamespace(arduino = SimpleNamespace(acktimes = [.003, .001]), steptimes = {"PulseEcho": [], "Sweep": [2.0, 4.0, 3.0]},
+                             relaysettle = costs["Settle"], vna = None)
+    assert Planner.Costs(tester)["Command"] == .001 and Planner.Costs(tester)["Sweep"] == 3.0 # what was measured over the defaults
+
+    plan = Planner.PlanRun(tester, list(range(1, 17)), ["Impedance", "Dongle"], verbose = False)
+
+    assert plan["Name"] == "Channel Major"
+    assert Pairs(plan["Steps"]) == sorted((c, test) for c in range(1, 17) for test in ["Impedance", "Dongle"])
@@ -0,0 +1,96 @@
+import time
+import pytest
+import Report
+import Scheduler
+import Simulator
+import TesterBackend as tb
+
+# A scheduler running a tester on the simulated bench, the worker is stopped once the test is done
+@pytest.fixture
+def scheduler(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path) # the journal, VNA script and sweeps are written to the working directory
+    monkeypatch.setattr(tb, "plot_mode", "skip")
+    monkeypatch.setattr(tb, "sequence_mode", "host") # every pulse echo capture waits for the operator's trigger
+    monkeypatch.setattr(tb, "pipeline_channels", False) # a channel's results come back before the next one starts
+    monkeypatch.setattr(tb, "archive_captures", False)
+    scheduler = Scheduler.TestScheduler(tb.CatheterTester(*Simulator.SimulatedInstruments(Simulator.ScaledLatencies(scale = 0), seed = 8)))
+    yield scheduler
+    scheduler.Abort()
+    scheduler.Stop()
+    scheduler.thread.join(timeout = 10)
+
+# Polls the scheduler like the GUI does until it posts event, gives back every event it posted until then
+def WaitFor(scheduler: Scheduler.TestScheduler, event: str, timeout: float = 30) -> list[tuple[str, object]]:
+    events = []
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        events += scheduler.Poll()
+        if any(name == event for name, _ in events):
+            return events
+        time.sleep(.01)
+    raise TimeoutError(f"No {event} Event, Got {[name for name, _ in events]}")
+
+def Names(events: list[tuple[str, object]]) -> list[str]:
+    return [name for name, _ in events]
+
+def test_Select(scheduler):
+    # selecting a channel from the GUI is done on the worker and acknowledged with what the firmware selected
+    scheduler.SelectChannel(3)
+    events = WaitFor(scheduler, "Idle")
+
+    assert ("Selected", {"Channel": 3, "Byte": 2}) in events
+
+def test_RunEvents(scheduler, tmp_path):
+    # a run posts when it starts, every channel as it starts and finishes, and when it is done, then writes the report
+    passmap = Report.EmptyPassMap(3)
+    scheduler.Run([1, 2, 3], ["Impedance"], str(tmp_path / "Run"), False, passmap)
+    events = WaitFor(scheduler, "Idle")
+
+    names = [name for name in Names(events) if name in ("Started", "Channel", "Results", "Done")]
+    assert names == ["Started"] + ["Channel", "Results"] * 3 + ["Done"]
+    assert events[0] == ("Started", {"Count": 3})
+
+    results = [data for name, data in events if name == "Results"]
+    assert sorted(data["Channel"] for data in results) == [1, 2, 3] and [data["Index"] for data in results] == [1, 2, 3]
+    assert all(passmap["Impedance"][data["Channel"] - 1] == data["Results"]["Impedance"][data["Channel"]] for data in results)
+
+    done = dict(events)["Done"]
+    assert done["Aborted"] is False and done["Channels"] == 3
+    assert (tmp_path / "RunReport.xlsx").exists()
+
+def test_TriggerPauseAbort(scheduler, tmp_path):
+    # every capture waits for the trigger, a pause holds the run before the next channel and an abort ends it there
+    scheduler.Run([1, 2, 3], ["PulseEcho"], str(tmp_path / "Run"), True)
+
+    WaitFor(scheduler, "Waiting")
+    time.sleep(.3)
+    assert "Results" not in Names(scheduler.Poll()) # nothing is captured until the operator fires the pulser
+
+    scheduler.Pause() # the channel that has started is finished
+    scheduler.Trigger()
+    events = WaitFor(scheduler, "Results")
+    assert [data["Channel"] for name, data in events if name == "Results"] == [1]
+    time.sleep(.3)
+    assert "Channel" not in Names(scheduler.Poll()) # held before channel 2
+
+    scheduler.Resume()
+    events = WaitFor(scheduler, "Waiting")
+    assert ("Channel", {"Channel": 2, "Index": 1, "Count": 3}) in events
+
+    scheduler.Pause()
+    scheduler.Trigger()
+    WaitFor(scheduler, "Results")
+    scheduler.Abort() # stops before channel 3
+    events = WaitFor(scheduler, "Done")
+    assert "Channel" not in Names(events)
+    assert dict(events)["Done"]["Aborted"] is True and dict(events)["Done"]["Channels"] == 2
+
+def test_AbortWhileWaitingForTrigger(scheduler, tmp_path):
+    # an abort wakes a channel waiting for its trigger and nothing after it is measured
+    scheduler.Run([1, 2, 3], ["PulseEcho"], str(tmp_path / "Run"), True)
+    WaitFor(scheduler, "Waiting")
+
+    scheduler.Abort()
+    events = WaitFor(scheduler, "Done")
+    assert "Results" not in Names(events)
+    assert dict(events)["Done"]["Aborted"] is True and dict(events)["Done"]["Channels"] == 0
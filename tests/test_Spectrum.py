@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+import Spectrum
+
+dt = 1e-9
+rng = np.random.default_rng(4)
+voltage = rng.normal(size = (3, 900))
+
+def test_FFTMatchesRFFT():
+    spectrum = Spectrum.SpectrumAnalyzer(pad = False)
+    fft = spectrum.FFT(voltage, dt)
+
+    np.testing.assert_allclose(fft["Amplitude"], np.abs(np.fft.rfft(voltage, axis = -1)), rtol = 1e-9, atol = 1e-9)
+    np.testing.assert_allclose(fft["Frequency"], np.fft.rfftfreq(900, dt))
+
+def test_FFTPaddedAndBatched():
+    # padding zero fills to a fast length, every waveform of a batch gets the same transform as on its own
+    spectrum = Spectrum.SpectrumAnalyzer()
+    fft = spectrum.FFT(voltage, dt)
+    nfft = 2 * (len(fft["Frequency"]) - 1)
+
+    assert nfft >= 900
+    np.testing.assert_allclose(fft["Amplitude"], np.abs(np.fft.rfft(voltage, n = nfft, axis = -1)), rtol = 1e-9, atol = 1e-9)
+    np.testing.assert_allclose(spectrum.FFT(voltage[1], dt)["Amplitude"], fft["Amplitude"][1])
+
+def test_FFTTaper():
+    from scipy.signal import get_window
+    spectrum = Spectrum.SpectrumAnalyzer("hann", pad = False)
+    fft = spectrum.FFT(voltage, dt)
+
+    np.testing.assert_allclose(fft["Amplitude"], np.abs(np.fft.rfft(voltage * get_window("hann", 900, fftbins = False), axis = -1)), rtol = 1e-9, atol = 1e-9)
+
+@pytest.mark.parametrize("taper", ["boxcar", "hann"])
+def test_BandFFTMatchesDenseDFT(taper):
+    # the zoom fft is the dft of the waveform evaluated at the band's frequencies
+    spectrum = Spectrum.SpectrumAnalyzer(taper)
+    band = spectrum.BandFFT(voltage, dt, 2e6, 8e6, 64)
+
+    frequency = 2e6 + np.arange(64) * (8e6 / 64)
+    times = np.arange(900) * dt
+    dft = np.abs(spectrum.Apply(voltage) @ np.exp(-2j * np.pi * np.outer(times, frequency)))
+
+    np.testing.assert_allclose(band["Frequency"], frequency)
+    np.testing.assert_allclose(band["Amplitude"], dft, rtol = 1e-6, atol = 1e-9)
@@ -0,0 +1,199 @@
+import math
+import pytest
+import numpy as np
+import TesterBackend as tb
+
+frequency = np.linspace(720e3, 880e3, 21)
+
+def SeriesRC(r: float, c: float) -> np.ndarray:
+    return r - 1j / (2 * math.pi * frequency * c)
+
+def test_FitSeriesRCExact():
+    r, c, residual = tb.FitSeriesRC(frequency, SeriesRC(12.0, 725e-12))
+
+    assert math.isclose(r, 12.0, rel_tol = 1e-9)
+    assert math.isclose(c, 725e-12, rel_tol = 1e-9)
+    assert residual < 1e-12
+
+def test_FitSeriesRCStack():
+    # a stack of sweeps is fit one row at a time
+    z = np.stack([SeriesRC(5.0, 300e-12), SeriesRC(20.0, 740e-12)])
+    r, c, residual = tb.FitSeriesRC(frequency, z)
+
+    np.testing.assert_allclose(r, [5.0, 20.0])
+    np.testing.assert_allclose(c, [300e-12, 740e-12])
+    assert residual.shape == (2,)
+
+def test_FitSeriesRCNoise():
+    # noise averages out over the band, and a model that doesn't fit shows up in the residual
+    rng = np.random.default_rng(1)
+    z = SeriesRC(10.0, 700e-12)
+    noisy = z + rng.normal(0, .01 * abs(z).mean(), z.shape)
+    r, c, residual = tb.FitSeriesRC(frequency, noisy)
+
+    assert math.isclose(c, 700e-12, rel_tol = .01)
+    assert residual < .02
+
+    inductive = z + 1j * 2 * math.pi * frequency * 50e-6 # a series inductor the model doesn't have
+    assert tb.FitSeriesRC(frequency, inductive)[2] > residual
+
+def test_MeasureRelaySettleFloor(monkeypatch):
+    # a sense line that doesn't follow the switch settles at once, the fixed delays are kept instead of almost nothing
+    import Simulator
+    monkeypatch.setattr(Simulator, "simulated_relay_settle_s", [1e-6] * 4)
+    monkeypatch.setattr(Simulator, "simulated_mux_settle_s", 1e-7)
+    monkeypatch.setattr(tb, "relay_settle_mode", "measure")
+    tester = tb.CatheterTester(*Simulator.SimulatedInstruments(Simulator.ScaledLatencies(scale = 0)))
+
+    assert tester.relaysettle == tb.relay_settle_s
+    assert tester.arduino.port.settle == pytest.approx(tb.relay_settle_s) # what the firmware was sent
+
+# A serial port with the old firmware on the other end, it takes every byte and never answers
+class OldFirmwarePort:
+    timeout = .01
+    in_waiting = 0
+
+    def write(self, data: bytes) -> int:
+        return len(data)
+
+    def read(self, size: int = 1) -> bytes:
+        return b""
+
+def test_OldFirmware(monkeypatch, capsys):
+    import Arduino
+    import Simulator
+    monkeypatch.setattr(Arduino, "ack_timeout_s", .01)
+    monkeypatch.setattr("builtins.input", lambda prompt = "": "")
+    _, scope, vna = Simulator.SimulatedInstruments(Simulator.ScaledLatencies(scale = 0))
+
+    with pytest.raises(SystemExit):
+        tb.CatheterTester(Arduino.Arduino(OldFirmwarePort()), scope, vna)
+    assert "Flash src/main/main.ino" in capsys.readouterr().out
+
+# A tester on the simulated bench with a VNA app that takes startup seconds to start, everything else answers at once
+def SimulatedTester(monkeypatch, tmp_path, startup: float = 0) -> tb.CatheterTester:
+    import Simulator
+    monkeypatch.chdir(tmp_path) # the VNA script and sweeps are written to the working directory
+    latencies = Simulator.ScaledLatencies(scale = 0)
+    latencies["VNAStartup"] = startup
+    return tb.CatheterTester(*Simulator.SimulatedInstruments(latencies, seed = 6))
+
+def test_SweepTimeoutFailsChannel(monkeypatch, tmp_path):
+    # a hung VNA fails the channel instead of stopping the run
+    monkeypatch.setattr(tb, "vna_sweep_timeout_s", .5)
+    tester = SimulatedTester(monkeypatch, tmp_path, startup = 30)
+
+    result = tester.RunVNATests(1, str(tmp_path / "Run"), ["Impedance"])["Impedance"]
+    assert result[0] is False and result[1] == 0 and math.isnan(result[2])
+
+def test_CancelOneSharedTest(monkeypatch, tmp_path):
+    # the impedance and dongle tests share a sweep, cancelling one leaves the sweep running for the other
+    tester = SimulatedTester(monkeypatch, tmp_path, startup = .5)
+    futures = tester.StartVNATests(1, str(tmp_path / "Run"), ["Impedance", "Dongle"])
+
+    assert futures["Impedance"].cancel()
+    result = futures["Dongle"].result(timeout = 30)
+    assert isinstance(result[0], bool) and result[1] > 0
+
+def test_CancelEverySharedTest(monkeypatch, tmp_path):
+    # once nobody wants the sweep the VNA app is killed instead of sweeping to the end
+    tester = SimulatedTester(monkeypatch, tmp_path, startup = 30)
+    futures = tester.StartVNATests(1, str(tmp_path / "Run"), ["Impedance", "Dongle"])
+
+    assert futures["Impedance"].cancel() and futures["Dongle"].cancel()
+    tester.vna.worker.submit(lambda: None).result(timeout = 10) # the sweep is done well before the app would have been
+    assert tester.vna.active is None
+
+@pytest.mark.parametrize("damage", ["Truncated", "Missing Parameter"])
+def test_BadSweepFileFailsChannel(monkeypatch, tmp_path, damage):
+    # a sweep file cut off by a killed sweep, or without the parameter a test needs, fails the channel instead of stopping the run
+    import VNA
+    read = VNA.ReadTouchstone
+
+    def Damaged(filename: str) -> dict:
+        if damage == "Missing Parameter":
+            return {key: value for key, value in read(filename).items() if key != "Z"}
+        with open(filename, "r") as file:
+            text = file.read()
+        with open(filename, "w") as file:
+            file.write(text[:text.rstrip().rfind(" ")]) # the last number is lost
+        return read(filename)
+
+    monkeypatch.setattr(VNA, "ReadTouchstone", Damaged)
+    tester = SimulatedTester(monkeypatch, tmp_path)
+
+    results = tester.RunVNATests(1, str(tmp_path / "Run"), ["Impedance", "Dongle"])
+    assert [result[0] for result in results.values()] == [False, False]
+
+def test_PointSweepAfterFitSweep(monkeypatch, tmp_path):
+    # a point mode sweep after a fit mode sweep sets its own time per point instead of keeping the fit's
+    tester = SimulatedTester(monkeypatch, tmp_path)
+    filename = str(tmp_path / "Run")
+
+    monkeypatch.setattr(tb, "capacitance_mode", "fit")
+    tester.RunVNATests(1, filename, ["Impedance"])
+    assert tester.vna.timeperpoint == tb.capacitance_fit_timeperpoint
+
+    monkeypatch.setattr(tb, "capacitance_mode", "point")
+    tester.RunVNATests(1, filename, ["Impedance"])
+    assert tester.vna.timeperpoint == tb.capacitance_point_timeperpoint
+
+@pytest.mark.parametrize("pipeline", [True, False])
+def test_RunChannelsOrder(monkeypatch, tmp_path, pipeline):
+    # the channels come back in order with the same results whether or not the analysis overlaps the next channel
+    monkeypatch.setattr(tb, "plot_mode", "skip")
+    monkeypatch.setattr(tb, "sequence_mode", "host")
+    channels = list(range(1, 9))
+
+    runs = {}
+    for pipelined in (pipeline, not pipeline):
+        monkeypatch.setattr(tb, "pipeline_channels", pipelined)
+        tester = SimulatedTester(monkeypatch, tmp_path)
+        runs[pipelined] = list(tester.RunChannels(channels, str(tmp_path / "Run"), ["PulseEcho", "Impedance"]))
+
+    assert [channel for channel, _ in runs[True]] == channels
+    np.testing.assert_equal(runs[True], runs[False])
+
+def test_RunChannelsErrorAfterPending(monkeypatch, tmp_path):
+    # an error measuring a channel is raised only after the channels measured before it are given back
+    monkeypatch.setattr(tb, "plot_mode", "skip")
+    monkeypatch.setattr(tb, "sequence_mode", "host")
+    monkeypatch.setattr(tb, "pipeline_channels", True)
+    tester = SimulatedTester(monkeypatch, tmp_path)
+    select = tester.SelectChannel
+
+    def Unplugged(channel: int) -> None:
+        if channel == 3:
+            raise RuntimeError("Relay Board Unplugged")
+        select(channel)
+
+    monkeypatch.setattr(tester, "SelectChannel", Unplugged)
+    yielded = []
+    with pytest.raises(RuntimeError, match = "Unplugged"):
+        for channel, results in tester.RunChannels([1, 2, 3, 4], str(tmp_path / "Run"), ["PulseEcho"]):
+            yielded.append(channel)
+            assert set(results["PulseEcho"]) == {channel}
+
+    assert yielded == [1, 2]
+
+@pytest.mark.parametrize("mode", ["host", "scope"])
+def test_PulseEchoIntervals(monkeypatch, tmp_path, mode):
+    # averaging on the host reports the mean of every shot's metrics and the confidence interval of it, the scope's average has no shots to tell
+    monkeypatch.setattr(tb, "plot_mode", "skip")
+    monkeypatch.setattr(tb, "pulse_echo_averages", 4)
+    monkeypatch.setattr(tb, "pulse_echo_average_mode", mode)
+    tester = SimulatedTester(monkeypatch, tmp_path)
+    tester.SelectChannel(1)
+
+    data, shots = tester.MeasurePulseEcho([1], [1])
+    result = tester.AnalyzePulseEcho(data, shots, [1], str(tmp_path / "Run"))[0]
+    assert result[1] > tb.PulseEchoLimits()["Dead"] # a live element so the metrics are reported
+
+    if mode == "scope":
+        assert shots.count == 0 and np.isnan(result[4:]).all()
+        return
+
+    assert shots.count == 4
+    np.testing.assert_allclose(result[1:4], shots.mean[0])
+    np.testing.assert_allclose(result[4:], tb.confidence_z * np.sqrt(shots.Variance()[0] / 4))
+    assert (np.array(result[4:]) > 0).all()
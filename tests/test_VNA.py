@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+import VNA
+
+frequency = np.array([1e6, 2e6, 3e6])
+s11 = np.array([.5 + .25j, -.1 + .3j, .2 - .6j])
+
+# Writes a touchstone file with the given option line and data lines
+def WriteTouchstone(path, name: str, options: str, lines: list[str]) -> str:
+    filename = str(path / name)
+    with open(filename, "w") as file:
+        file.write("! written by the tests\n")
+        file.write(options + "\n")
+        file.write("\n".join(lines) + "\n")
+    return filename
+
+def Pairs(values: np.ndarray, form: str) -> list[tuple[float, float]]: # the number pairs of the complex values in a touchstone form
+    if form == "RI":
+        return [(v.real, v.imag) for v in values]
+    if form == "MA":
+        return [(abs(v), np.degrees(np.angle(v))) for v in values]
+    return [(20 * np.log10(abs(v)), np.degrees(np.angle(v))) for v in values]
+
+@pytest.mark.parametrize("form", ["RI", "MA", "DB"])
+def test_ReadTouchstoneForms(tmp_path, form):
+    lines = [f"{f / 1e6:.1f} {float(a)!r} {float(b)!r}" for f, (a, b) in zip(frequency, Pairs(s11, form))]
+    data = VNA.ReadTouchstone(WriteTouchstone(tmp_path, "Test.s1p", f"# MHz S {form} R 50", lines))
+
+    np.testing.assert_allclose(data["Frequency"], frequency)
+    np.testing.assert_allclose(data["Value"], s11, rtol = 1e-12)
+    np.testing.assert_allclose(data["Z"], 50 * (1 + s11) / (1 - s11), rtol = 1e-12)
+    assert data["Parameter"] == "S" and data["Z0"] == 50
+
+def test_ReadTouchstoneDefaultsAndComments(tmp_path):
+    # no option line is GHz, S, MA, 50 ohms, and comments can follow the numbers
+    filename = WriteTouchstone(tmp_path, "Test.S1P", "! no options", ["0.001 0.5 90 ! a comment", "0.002 0.8 0"])
+    data = VNA.ReadTouchstone(filename)
+
+    np.testing.assert_allclose(data["Frequency"], [1e6, 2e6])
+    np.testing.assert_allclose(data["Value"], [.5j, .8], atol = 1e-12)
+
+def test_ReadTouchstoneReferenceImpedance(tmp_path):
+    data = VNA.ReadTouchstone(WriteTouchstone(tmp_path, "Test.s1p", "# Hz Z RI R 75", ["1000 1 -2"]))
+    np.testing.assert_allclose(data["Z"], [75 * (1 - 2j)])
+
+def test_ReadTouchstoneTwoPort(tmp_path):
+    # two port records are listed 11 21 12 22 and can wrap onto more than one line
+    filename = WriteTouchstone(tmp_path, "Test.s2p", "# kHz S RI R 50", ["1 .1 .2 .3 .4", ".5 .6 .7 .8", "2 1 0 2 0 3 0 4 0"])
+    data = VNA.ReadTouchstone(filename)
+
+    np.testing.assert_allclose(data["Frequency"], [1e3, 2e3])
+    assert data["Value"].shape == (2, 2, 2)
+    np.testing.assert_allclose(data["Value"][0], [[.1 + .2j, .5 + .6j], [.3 + .4j, .7 + .8j]])
+    np.testing.assert_allclose(data["Value"][1], [[1, 3], [2, 4]])
+    assert "Z" not in data
+
+def test_ReadTouchstonePartialRecord(tmp_path):
+    with pytest.raises(ValueError):
+        VNA.ReadTouchstone(WriteTouchstone(tmp_path, "Test.s1p", "# MHz S RI", ["1 .5 .5", "2 .5"]))
+
+# A VNA running VNWAStub.py that takes startup seconds to start
+def SimulatedVNA(startup: float = 0):
+    import Simulator
+    latencies = Simulator.ScaledLatencies(scale = 0)
+    latencies["VNAStartup"] = startup
+    return Simulator.SimulatedVNA(Simulator.SimulatedBench(1), latencies)
+
+def test_CancelBeforeTheAppStarts(tmp_path, monkeypatch):
+    # a cancel that comes in before there is a VNA app to kill still stops the sweep once the app starts
+    monkeypatch.chdir(tmp_path)
+    vna = SimulatedVNA(startup = 30)
+    script = vna.ScriptSweep
+
+    def CancelFirst(*args):
+        vna.active.cancel()
+        script(*args)
+
+    monkeypatch.setattr(vna, "ScriptSweep", CancelFirst)
+    future = vna.SweepAsync(60)
+    vna.worker.submit(lambda: None).result(timeout = 10) # the sweep is done well before the app would have been
+
+    assert future.cancelled()
+    assert vna.active is None and vna.process is None